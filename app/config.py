@@ -35,6 +35,10 @@ class Config:
 
             # General
             cls.local_timezone = str(getenv('LOCAL_TIMEZONE', 'America/Bogota'))
+            # Segundos que se conservan en memoria las tablas de referencia (tipos, estados, bodegas)
+            cls.catalogo_cache_ttl = float(getenv('CATALOGO_CACHE_TTL', 300))
+            # Meses futuros para los que se mantienen creadas las particiones de movimientos
+            cls.movimientos_particiones_meses = int(getenv('MOVIMIENTOS_PARTICIONES_MESES', 3))
 
             # Security & Shopify
             cls.secret_key = str(getenv('SECRET_KEY', ''))
@@ -42,15 +46,43 @@ class Config:
             cls.shop_version = str(getenv('SHOP_VERSION', '2025-07'))
             cls.api_key_shopify = str(getenv('API_KEY_SHOPIFY', ''))
             cls.webhook_secret_shopify = str(getenv('WEBHOOK_SECRET_SHOPIFY', ''))
+            # Sincronización de pedidos por rango: ventanas consultadas a la vez, ventanas con line items consultados
+            # a la vez, ventanas escritas a la vez en la base de datos y ventanas en espera entre etapas
+            cls.shopify_sync_ventanas = int(getenv('SHOPIFY_SYNC_VENTANAS', 2))
+            cls.shopify_sync_line_items = int(getenv('SHOPIFY_SYNC_LINE_ITEMS', 2))
+            cls.shopify_sync_escrituras = int(getenv('SHOPIFY_SYNC_ESCRITURAS', 1))
+            cls.shopify_sync_cola = int(getenv('SHOPIFY_SYNC_COLA', 2))
+            # Segundos entre sincronizaciones incrementales de pedidos, 0 las desactiva
+            cls.shopify_sync_intervalo = float(getenv('SHOPIFY_SYNC_INTERVALO', 3600))
             cls.algorithm = str(getenv('ALGORITHM', 'HS256'))
             cls.access_token_expire_minutes = int(getenv('ACCESS_TOKEN_EXPIRE_MINUTES', 30))
             cls.admin_password = str(getenv('ADMIN_PWD', ''))
+            # Segundos que se conserva en memoria el usuario de un token validado
+            cls.auth_cache_ttl = float(getenv('AUTH_CACHE_TTL', 60))
+            # argon2: parámetros de los hashes nuevos (los existentes se verifican con los suyos) y número de
+            # hashes/verificaciones simultáneas por proceso
+            cls.argon2_time_cost = int(getenv('ARGON2_TIME_COST', 3))
+            cls.argon2_memory_cost = int(getenv('ARGON2_MEMORY_COST', 65536))
+            cls.argon2_parallelism = int(getenv('ARGON2_PARALLELISM', 4))
+            cls.password_max_concurrencia = int(getenv('PASSWORD_MAX_CONCURRENCIA', 2))
 
             # World Office
             cls.wo_api_key = str(getenv('WO_API_KEY', ''))
             cls.wo_api_version = str(getenv('WO_API_VERSION', 'v1'))
             cls.wo_prefijo = int(getenv('WO_PREFIJO', 1))
             cls.wo_concepto = str(getenv('WO_CONCEPTO', ''))
+            # Peticiones por segundo y ráfaga máxima permitidas hacia World Office
+            cls.wo_rate_limit = float(getenv('WO_RATE_LIMIT', 1))
+            cls.wo_rate_burst = float(getenv('WO_RATE_BURST', 1))
+            # Segundos que se conservan en memoria inventarios, ciudades y terceros consultados a World Office
+            cls.wo_cache_ttl = float(getenv('WO_CACHE_TTL', 3600))
+
+            # Cola de trabajos: trabajos simultáneos por worker de uvicorn, segundos entre consultas cuando la cola
+            # está vacía, segundos que un trabajo queda asignado a un worker y espera base entre reintentos
+            cls.jobs_concurrencia = int(getenv('JOBS_CONCURRENCIA', 2))
+            cls.jobs_poll_interval = float(getenv('JOBS_POLL_INTERVAL', 5))
+            cls.jobs_lease = float(getenv('JOBS_LEASE', 600))
+            cls.jobs_backoff = float(getenv('JOBS_BACKOFF', 60))
 
             # Addi
             cls.addi_email = str(getenv('ADDI_EMAIL', ''))
@@ -10,7 +10,7 @@ from app.internal.query.inventario import seed_data_inventario
 from app.internal.query.usuario import set_admin_user
 
 # Importar modelos para que SQLModel los registre antes de crear las tablas
-from app.models.db import transacciones # noqa: F401
+from app.models.db import jobs, sincronizacion, transacciones  # noqa: F401
 
 
 async def tasks_entrypoint():
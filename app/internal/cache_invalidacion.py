@@ -0,0 +1,149 @@
+# app/internal/cache_invalidacion.py
+"""
+Invalidación de las cachés en memoria (app.internal.gen.cache) entre procesos, con LISTEN/NOTIFY de PostgreSQL.
+Las cachés son por proceso: sin esta invalidación, un usuario eliminado en un worker de uvicorn seguiría autenticado
+en los demás hasta que su entrada expire. Cada proceso escucha `CANAL` en una conexión dedicada y aplica las
+invalidaciones que cualquier proceso publica con `InvalidacionCache.notificar`.
+Las invalidaciones publicadas mientras la conexión está caída se pierden, por eso al reconectar se vacían todas las
+cachés registradas; el TTL de cada caché sigue siendo el límite si el listener no está en ejecución.
+"""
+
+import json
+from asyncio import CancelledError, Task, create_task, sleep
+from typing import Callable
+
+from psycopg import AsyncConnection
+from sqlalchemy import text
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.config import Config
+from app.internal.log import factory_logger
+from app.models.db.session import AsyncSessionLocal
+
+log_cache = factory_logger('cache', file=True)
+
+CANAL = 'cache_invalidada'
+
+# Recibe la llave a invalidar, None vacía la caché.
+InvalidacionHandler = Callable[[str | None], None]
+
+
+class InvalidacionCache:
+    __handlers: dict[str, InvalidacionHandler] = {}
+
+    def __init__(self, reconexion: float = 5):
+        self.reconexion = reconexion
+        self._task: Task | None = None
+
+    @classmethod
+    def handler(cls, nombre: str) -> Callable[[InvalidacionHandler], InvalidacionHandler]:
+        """Registra la función que invalida la caché `nombre` en este proceso."""
+
+        def decorator(func: InvalidacionHandler) -> InvalidacionHandler:
+            cls.__handlers[nombre] = func
+            return func
+
+        return decorator
+
+    @classmethod
+    def aplicar(cls, nombre: str, llave: str | None = None):
+        handler = cls.__handlers.get(nombre)
+        if handler is None:
+            log_cache.warning(f'Invalidación de caché sin handler: {nombre}')
+            return
+        handler(llave)
+
+    @classmethod
+    async def notificar(cls, nombre: str, llave: str | None = None):
+        """Invalida la caché `nombre` en este proceso y publica la invalidación para los demás.
+        Si la publicación falla solo se registra el error, los demás procesos dependen del TTL."""
+        cls.aplicar(nombre, llave)
+        mensaje = json.dumps({'nombre': nombre, 'llave': llave})
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(text('SELECT pg_notify(:canal, :mensaje)'), {'canal': CANAL, 'mensaje': mensaje})
+                await session.commit()
+        except Exception as e:
+            log_cache.error(f'No fue posible publicar la invalidación de {nombre}: {e}')
+
+    def start(self):
+        if self._task is None and self.__handlers:
+            self._task = create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        reconectando = False
+        while True:
+            try:
+                async with await AsyncConnection.connect(
+                    host=Config.db_host,
+                    port=Config.db_port,
+                    user=Config.db_user,
+                    password=Config.db_password,
+                    dbname=Config.db_name,
+                    autocommit=True,
+                ) as conn:
+                    await conn.execute(f'LISTEN {CANAL}')
+                    if reconectando:
+                        for nombre in self.__handlers:
+                            self.aplicar(nombre)
+                        log_cache.info('Listener de invalidación reconectado, se vaciaron las cachés')
+                    async for notificacion in conn.notifies():
+                        try:
+                            mensaje = json.loads(notificacion.payload)
+                            self.aplicar(mensaje['nombre'], mensaje.get('llave'))
+                        except Exception as e:
+                            log_cache.error(f'Invalidación inválida {notificacion.payload}: {e}')
+            except CancelledError:
+                raise
+            except Exception as e:
+                log_cache.error(f'Error en el listener de invalidación de cachés: {e}')
+            reconectando = True
+            await sleep(self.reconexion)
+
+
+invalidacion_cache = InvalidacionCache()
+
+
+if __name__ == '__main__':
+    from asyncio import run
+
+    from app.internal.gen.cache import TTLCache
+
+    async def main():
+        # Requiere la base de datos: la invalidación publicada vuelve al listener de este mismo proceso.
+        cache: TTLCache[str, int] = TTLCache(ttl=60)
+        recibidas = []
+
+        @InvalidacionCache.handler('test')
+        def invalidar(llave: str | None):
+            recibidas.append(llave)
+            if llave:
+                cache.invalidate(llave)
+            else:
+                cache.clear()
+
+        invalidacion_cache.start()
+        await sleep(1)
+        cache.set('a', 1)
+        await InvalidacionCache.notificar('test', 'a')
+        await sleep(1)
+        await invalidacion_cache.stop()
+        # Una vez local y otra desde el listener.
+        assert recibidas == ['a', 'a'], recibidas
+        assert cache.get('a') is None
+
+    run(main())
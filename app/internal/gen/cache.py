@@ -0,0 +1,103 @@
+# app/internal/gen/cache.py
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from time import monotonic
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+@dataclass
+class TTLCacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    expirados: int = 0
+    invalidados: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'hit_rate': self.hit_rate}
+
+
+class TTLCache(Generic[K, V]):
+    """Caché en memoria por proceso con expiración por entrada y descarte LRU al superar `maxsize`.
+    No usa locks: las operaciones son síncronas y no ceden el event loop.
+    """
+
+    __caches: dict[str, 'TTLCache'] = {}
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.metrics = TTLCacheMetrics()
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    @classmethod
+    def get_named(cls, name: str, ttl: float, maxsize: int = 1024) -> 'TTLCache':
+        """Retorna la caché `name`, creándola la primera vez. Las cachés con nombre se reportan en all_metrics."""
+        cache = cls.__caches.get(name)
+        if cache is None:
+            cache = cls(ttl, maxsize)
+            cls.__caches[name] = cache
+        return cache
+
+    @classmethod
+    def all_metrics(cls) -> dict[str, dict]:
+        return {name: {**cache.metrics.to_dict(), 'registros': len(cache)} for name, cache in cls.__caches.items()}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> V | None:
+        entry = self._data.get(key)
+        if entry is None:
+            self.metrics.misses += 1
+            return None
+        expira, value = entry
+        if expira <= monotonic():
+            del self._data[key]
+            self.metrics.expirados += 1
+            self.metrics.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.metrics.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None):
+        self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: K):
+        if self._data.pop(key, None) is not None:
+            self.metrics.invalidados += 1
+
+    def invalidate_where(self, predicate: Callable[[K], bool]):
+        """Elimina las entradas cuya llave cumple `predicate` (ej. todas las de un usuario)."""
+        for key in [key for key in self._data if predicate(key)]:
+            self.invalidate(key)
+
+    def clear(self):
+        self._data.clear()
+
+
+if __name__ == '__main__':
+    from time import sleep
+
+    cache: TTLCache[str, int] = TTLCache(ttl=0.1, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # descarta 'b', el menos usado
+    assert cache.get('b') is None and cache.get('a') == 1
+    cache.invalidate_where(lambda key: key == 'a')
+    assert cache.get('a') is None
+    sleep(0.1)
+    assert cache.get('c') is None
+    print(cache.metrics.to_dict())
@@ -0,0 +1,139 @@
+# app/internal/gen/pipeline.py
+"""
+Pipeline asíncrono por etapas con colas acotadas.
+Cada etapa tiene sus propios workers y una cola de entrada de tamaño máximo `cola`: cuando una etapa se atrasa,
+la anterior se bloquea al entregar (backpressure) en lugar de acumular resultados en memoria. Así el trabajo de red
+de un elemento se solapa con el de base de datos del anterior sin que ninguna etapa supere su concurrencia.
+"""
+
+from asyncio import Queue, TaskGroup
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Iterable
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.log import factory_logger
+
+log_pipeline = factory_logger('pipeline', file=True)
+
+_FIN = object()
+
+
+@dataclass
+class EtapaMetrics:
+    procesados: int = 0
+    # Segundos acumulados ejecutando la función, esperando entrada y esperando espacio en la siguiente cola.
+    ocupado: float = 0
+    espera_entrada: float = 0
+    espera_salida: float = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'procesados': self.procesados,
+            'ocupado': round(self.ocupado, 2),
+            'espera_entrada': round(self.espera_entrada, 2),
+            'espera_salida': round(self.espera_salida, 2),
+        }
+
+
+@dataclass
+class Etapa:
+    """`funcion` recibe un elemento y retorna el elemento para la siguiente etapa, None lo descarta."""
+
+    nombre: str
+    funcion: Callable[[Any], Awaitable[Any]]
+    concurrencia: int = 1
+    cola: int = 1
+    metrics: EtapaMetrics = field(default_factory=EtapaMetrics)
+
+
+async def ejecutar_pipeline(entradas: Iterable, etapas: list[Etapa]) -> dict[str, dict]:
+    """Pasa cada elemento de `entradas` por las etapas en orden. El orden de salida entre elementos no se conserva.
+    Si una etapa lanza una excepción se cancelan las demás y se propaga la primera excepción (con el grupo completo
+    como causa); las demás excepciones del grupo se registran en el log.
+    Returns:
+        Métricas por etapa.
+    """
+    colas: list[Queue] = [Queue(maxsize=etapa.cola) for etapa in etapas]
+
+    async def alimentar():
+        for entrada in entradas:
+            await colas[0].put(entrada)
+        for _ in range(etapas[0].concurrencia):
+            await colas[0].put(_FIN)
+
+    async def worker(i: int):
+        etapa = etapas[i]
+        siguiente = colas[i + 1] if i + 1 < len(etapas) else None
+        while True:
+            inicio = perf_counter()
+            elemento = await colas[i].get()
+            etapa.metrics.espera_entrada += perf_counter() - inicio
+            if elemento is _FIN:
+                return
+            inicio = perf_counter()
+            resultado = await etapa.funcion(elemento)
+            etapa.metrics.ocupado += perf_counter() - inicio
+            etapa.metrics.procesados += 1
+            if siguiente is not None and resultado is not None:
+                inicio = perf_counter()
+                await siguiente.put(resultado)
+                etapa.metrics.espera_salida += perf_counter() - inicio
+
+    async def etapa_completa(i: int, task_group: TaskGroup):
+        # La siguiente etapa termina cuando todos los workers de esta terminaron.
+        tasks = [task_group.create_task(worker(i)) for _ in range(etapas[i].concurrencia)]
+        for task in tasks:
+            await task
+        if i + 1 < len(etapas):
+            for _ in range(etapas[i + 1].concurrencia):
+                await colas[i + 1].put(_FIN)
+
+    try:
+        async with TaskGroup() as task_group:
+            task_group.create_task(alimentar())
+            for i in range(len(etapas)):
+                task_group.create_task(etapa_completa(i, task_group))
+    except ExceptionGroup as e:
+        for error in e.exceptions[1:]:
+            log_pipeline.error(f'Pipeline: excepción adicional {type(error).__name__}: {error}')
+        raise e.exceptions[0] from e
+    return {etapa.nombre: etapa.metrics.to_dict() for etapa in etapas}
+
+
+if __name__ == '__main__':
+    from asyncio import run, sleep
+
+    # Dos etapas de 0.1s por elemento: en secuencia 10 elementos tardan 2s, con el pipeline ~1.1s.
+    async def red(n: int) -> int:
+        await sleep(0.1)
+        return n
+
+    resultados = []
+
+    async def base_datos(n: int):
+        await sleep(0.1)
+        resultados.append(n)
+
+    async def main():
+        inicio = perf_counter()
+        metrics = await ejecutar_pipeline(range(10), [Etapa('red', red, cola=2), Etapa('base_datos', base_datos)])
+        print(f'{perf_counter() - inicio:.2f}s', metrics)
+        assert sorted(resultados) == list(range(10))
+
+        async def falla(n: int):
+            raise ValueError(n)
+
+        try:
+            await ejecutar_pipeline(range(10), [Etapa('red', red), Etapa('falla', falla)])
+        except ValueError as e:
+            assert isinstance(e.__cause__, ExceptionGroup)
+        else:
+            raise AssertionError('Se esperaba ValueError')
+
+    run(main())
@@ -46,7 +46,7 @@ class AddiClient(BaseClient):
         params: list[str] | None = None,
         query_params: dict | None = None,
         payload: dict | None = None,
-        timeout: int = 30,
+        timeout: float | None = None,
         cookies: dict | None = None,
     ):
         cookies = cookies or {}
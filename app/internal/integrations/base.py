@@ -1,7 +1,9 @@
 import json
 import httpx
-from time import time
-from asyncio import sleep
+from dataclasses import dataclass
+from asyncio import gather
+
+from app.internal.integrations.rate_limit import RateLimit, SharedTokenBucket, TokenBucket
 
 
 class ClientException(Exception):
@@ -30,19 +32,74 @@ class ClientException(Exception):
         return self.__str__()
 
 
+@dataclass(frozen=True)
+class HttpClientConfig:
+    """Configuración del pool de conexiones de una integración."""
+
+    timeout: float = 30
+    connect_timeout: float = 10
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60
+    http2: bool = True
+
+
+class HttpClientPool:
+    """Clientes httpx de larga duración, uno por host.
+    Reutilizar el cliente conserva las conexiones abiertas (keep-alive / HTTP2),
+    evitando un handshake TCP+TLS por cada petición.
+    """
+
+    __clients: dict[str, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        _url = httpx.URL(url)
+        return f'{_url.scheme}://{_url.netloc.decode()}'
+
+    @classmethod
+    def get(cls, url: str, config: HttpClientConfig) -> httpx.AsyncClient:
+        key = cls.host_key(url)
+        client = cls.__clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=config.http2,
+                timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_keepalive_connections,
+                    keepalive_expiry=config.keepalive_expiry,
+                ),
+            )
+            cls.__clients[key] = client
+        return client
+
+    @classmethod
+    async def close(cls):
+        clients = list(cls.__clients.values())
+        cls.__clients.clear()
+        await gather(*[client.aclose() for client in clients])
+
+
 class BaseClient:
-    def __init__(self, min_interval: float = 0.1):
-        self.__last_request_time: float = 0
-        self._min_interval = min_interval
+    host: str = ''
 
-    async def _rate_limit(self):
-        """Aplica rate limiting para asegurar 1 petición por segundo"""
-        current_time = time()
-        time_since_last_request = current_time - self.__last_request_time
+    def __init__(
+        self,
+        rate_limit: RateLimit | None = RateLimit(rate=10, capacity=10),
+        http_config: HttpClientConfig = HttpClientConfig(),
+        shared_rate_limit: bool = False,
+    ):
+        # El bucket se comparte por integración, sobrevive a las re-inicializaciones del singleton.
+        # Con shared_rate_limit el límite es global entre procesos (SharedTokenBucket), para APIs cuyo límite es
+        # por cuenta y no por conexión.
+        bucket_cls = SharedTokenBucket if shared_rate_limit else TokenBucket
+        self.rate_limiter = bucket_cls.get(type(self).__name__, rate_limit) if rate_limit else None
+        self.http_config = http_config
 
-        if time_since_last_request < self._min_interval:
-            sleep_time = self._min_interval - time_since_last_request
-            await sleep(sleep_time)
+    def open_http_client(self) -> httpx.AsyncClient:
+        """Crea (o reutiliza) el cliente del pool para el host de la integración."""
+        return HttpClientPool.get(self.host, self.http_config)
 
     async def request(
         self,
@@ -52,26 +109,55 @@ class BaseClient:
         params: list[str] | None = None,
         query_params: dict | None = None,
         payload: dict | None = None,
-        timeout: int = 30,
+        timeout: float | None = None,
         cookies: dict | None = None,
     ):
-        if self._min_interval > 0:
-            await self._rate_limit()
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
 
         if params:
             url += f'/{"/".join(params)}'
 
-        timeout_config = httpx.Timeout(float(timeout))
-        async with httpx.AsyncClient(timeout=timeout_config) as client:
-            response = await client.request(
-                method, url, params=query_params, headers=headers, json=payload, cookies=cookies
+        client = HttpClientPool.get(url, self.http_config)
+        timeout_config = httpx.Timeout(
+            float(timeout or self.http_config.timeout), connect=self.http_config.connect_timeout
+        )
+        # Las cookies se envían por petición, no se persisten en el cliente compartido.
+        if cookies:
+            headers = {**headers, 'Cookie': '; '.join(f'{key}={value}' for key, value in cookies.items())}
+        response = await client.request(
+            method, url, params=query_params, headers=headers, json=payload, timeout=timeout_config
+        )
+        try:
+            return response.json()
+        except Exception:
+            raise ClientException(
+                payload=payload,
+                url=url,
+                response={'statuc_code': response.status_code, 'content': response.text},
+                msg=f'TypeError: {type(Exception).__name__}',
             )
-            try:
-                return response.json()
-            except Exception:
-                raise ClientException(
-                    payload=payload,
-                    url=url,
-                    response={'statuc_code': response.status_code, 'content': response.text},
-                    msg=f'TypeError: {type(Exception).__name__}',
-                )
+
+
+if __name__ == '__main__':
+    from asyncio import run
+    from time import perf_counter
+
+    async def benchmark_handshake(url: str = 'https://www.google.com', n: int = 20):
+        """Compara n peticiones secuenciales abriendo un cliente por petición contra el cliente del pool."""
+        start = perf_counter()
+        for _ in range(n):
+            async with httpx.AsyncClient() as client:
+                await client.get(url)
+        sin_pool = perf_counter() - start
+
+        client = HttpClientPool.get(url, HttpClientConfig())
+        start = perf_counter()
+        for _ in range(n):
+            await client.get(url)
+        con_pool = perf_counter() - start
+        await HttpClientPool.close()
+
+        print(f'{n} peticiones sin pool: {sin_pool:.2f}s, con pool: {con_pool:.2f}s')
+
+    run(benchmark_handshake())
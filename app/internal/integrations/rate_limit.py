@@ -0,0 +1,175 @@
+# app/internal/integrations/rate_limit.py
+from asyncio import Lock, sleep
+from dataclasses import asdict, dataclass
+from time import monotonic
+
+from sqlalchemy import text
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.log import factory_logger
+from app.models.db.session import AsyncSessionLocal
+
+log_rate_limit = factory_logger('rate_limit', file=True)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Presupuesto de una integración: `rate` tokens por segundo y ráfagas de hasta `capacity` tokens."""
+
+    rate: float
+    capacity: float
+
+
+@dataclass
+class TokenBucketMetrics:
+    admitidas: int = 0
+    en_cola: int = 0
+    max_en_cola: int = 0
+    esperas: int = 0
+    tiempo_espera_total: float = 0
+    tiempo_espera_max: float = 0
+
+    @property
+    def tiempo_espera_promedio(self) -> float:
+        return self.tiempo_espera_total / self.esperas if self.esperas else 0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'tiempo_espera_promedio': self.tiempo_espera_promedio}
+
+
+class TokenBucket:
+    """Token bucket asíncrono compartido por todas las corrutinas de una integración.
+
+    Los waiters se atienden en orden de llegada: asyncio.Lock despierta en FIFO y quien
+    tiene el lock espera a que haya tokens suficientes, así una petición costosa no es
+    adelantada indefinidamente por peticiones baratas.
+    """
+
+    __buckets: dict[str, 'TokenBucket'] = {}
+
+    def __init__(self, rate_limit: RateLimit, name: str = ''):
+        self.name = name
+        self.rate = rate_limit.rate
+        self.capacity = rate_limit.capacity
+        self.tokens = rate_limit.capacity
+        self.updated = monotonic()
+        self.metrics = TokenBucketMetrics()
+        self._lock = Lock()
+
+    @classmethod
+    def get(cls, name: str, rate_limit: RateLimit) -> 'TokenBucket':
+        """Retorna el bucket de la integración `name`, creándolo la primera vez."""
+        bucket = cls.__buckets.get(name)
+        if bucket is None:
+            bucket = cls(rate_limit, name)
+            cls.__buckets[name] = bucket
+        return bucket
+
+    @classmethod
+    def all_metrics(cls) -> dict[str, dict]:
+        return {name: bucket.metrics.to_dict() for name, bucket in cls.__buckets.items()}
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def refund(self, tokens: float):
+        """Devuelve tokens reservados de más (ej. costo estimado mayor al costo real)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def sync(self, available: float, capacity: float, rate: float):
+        """Ajusta el bucket al estado reportado por el servidor.
+        Solo se reduce `tokens`: el valor local ya descuenta las peticiones en vuelo y el del servidor
+        incluye el consumo de otros procesos que comparten el mismo presupuesto.
+        """
+        self._refill()
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = min(self.tokens, available)
+
+    async def _take(self, tokens: float):
+        self._refill()
+        while self.tokens < tokens:
+            await sleep((tokens - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= tokens
+
+    async def acquire(self, tokens: float = 1):
+        # Una petición más costosa que la capacidad nunca sería admitida.
+        tokens = min(tokens, self.capacity)
+        start = monotonic()
+        self.metrics.en_cola += 1
+        self.metrics.max_en_cola = max(self.metrics.max_en_cola, self.metrics.en_cola)
+        try:
+            async with self._lock:
+                await self._take(tokens)
+        finally:
+            self.metrics.en_cola -= 1
+
+        waited = monotonic() - start
+        self.metrics.admitidas += 1
+        if waited > 0.001:
+            self.metrics.esperas += 1
+            self.metrics.tiempo_espera_total += waited
+            self.metrics.tiempo_espera_max = max(self.metrics.tiempo_espera_max, waited)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket compartido por todos los procesos (workers de uvicorn) a través de public.rate_limits.
+
+    Cada petición reserva sus tokens con un solo UPDATE atómico sobre la fila de la integración: el saldo puede
+    quedar negativo, y la deuda es el tiempo que la petición debe esperar antes de enviarse. Dentro del proceso
+    se conserva el lock FIFO del bucket local para no abrir una conexión por cada waiter.
+    Si la base de datos no responde se usa el bucket local, así una falla de la base de datos no detiene las
+    integraciones (el límite vuelve a ser por proceso mientras dure la falla).
+    """
+
+    RESERVAR = text(
+        """
+        INSERT INTO public.rate_limits AS r (nombre, tokens, actualizado)
+        VALUES (:nombre, :capacity - :tokens, clock_timestamp())
+        ON CONFLICT (nombre) DO UPDATE SET
+            tokens = least(
+                :capacity, r.tokens + extract(epoch FROM clock_timestamp() - r.actualizado)::float8 * :rate
+            ) - :tokens,
+            actualizado = clock_timestamp()
+        RETURNING tokens
+        """
+    )
+
+    async def _take(self, tokens: float):
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    self.RESERVAR,
+                    {'nombre': self.name, 'capacity': self.capacity, 'rate': self.rate, 'tokens': tokens},
+                )
+                saldo = result.scalar_one()
+                await session.commit()
+        except Exception as e:
+            log_rate_limit.error(f'Rate limit compartido {self.name} no disponible, se usa el local: {e}')
+            await super()._take(tokens)
+            return
+        if saldo < 0:
+            await sleep(-saldo / self.rate)
+
+
+if __name__ == '__main__':
+    from asyncio import gather, run
+
+    async def main():
+        bucket = TokenBucket.get('test', RateLimit(rate=5, capacity=5))
+        start = monotonic()
+        await gather(*[bucket.acquire() for _ in range(20)])
+        # 5 inmediatas y 15 a 5 por segundo
+        assert 2.8 < monotonic() - start < 3.5
+        print(TokenBucket.all_metrics())
+
+    run(main())
@@ -1,9 +1,12 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+import json
 import re
 import traceback
 from pydantic import BaseModel, ValidationError
 from re import findall
 from asyncio import gather, sleep
+from time import monotonic
+from collections.abc import AsyncIterable, AsyncIterator
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -13,13 +16,16 @@ if __name__ == '__main__':
 
     sys_path.append(abspath('.'))
 
-from app.internal.gen.utilities import DateTz, divide
+from app.internal.gen.pipeline import Etapa, ejecutar_pipeline
+from app.internal.gen.utilities import DateTz
+from app.internal.query.base import unit_of_work
 from app.internal.query.inventario import (
     BodegaQuery,
     ElementoQuery,
     EstadoVarianteQuery,
     MetaAtributoQuery,
     MetaValorQuery,
+    MetadatoCarga,
     MetadatosPorSoporteQuery,
     MovimientoQuery,
     PrecioPorVarianteQuery,
@@ -27,14 +33,15 @@ from app.internal.query.inventario import (
     TipoSoporteQuery,
     VarianteElementoQuery,
 )
+from app.internal.query.sincronizacion import MarcaSincronizacionQuery
 
 from app.internal.log import factory_logger, LogLevel
 from app.models.pydantic.shopify.order import Order, OrderResponse, OrdersResponse
-from app.internal.integrations.base import BaseClient, ClientException
+from app.internal.integrations.base import BaseClient, ClientException, HttpClientConfig, HttpClientPool
+from app.internal.integrations.rate_limit import RateLimit, TokenBucket
 from app.models.db.inventario import (
     Bodega,
     BodegaCreate,
-    Elemento,
     ElementoCreate,
     MetaAtributoCreate,
     MetaValorCreate,
@@ -48,9 +55,12 @@ from app.models.db.inventario import (
 )
 from app.models.db.session import get_async_session
 from app.models.pydantic.shopify.inventario import (
+    InventoryLevel,
     InventoryLevelsResponse,
     Location,
     Product,
+    ProductNodes,
+    Products,
     ProductsResponse,
     Variant,
     VariantsResponse,
@@ -62,6 +72,9 @@ log_shopify = factory_logger('shopify', file=True)
 log_level = LogLevel.DEBUG if Config.environment == 'development' else LogLevel.INFO
 log_debug = factory_logger('debug', level=log_level, file=False)
 
+# Marca de agua (MarcaSincronizacion) de la sincronización incremental de pedidos.
+MARCA_PEDIDOS_SHOPIFY = 'shopify_pedidos'
+
 
 class ShopifyException(ClientException):
     def __init__(self, *args, **kwargs):
@@ -70,9 +83,39 @@ class ShopifyException(ClientException):
             self.payload['query'] = re.sub(r'\s+', ' ', self.payload['query'])
 
 
+async def parse_bulk_products(lines: AsyncIterable[dict]) -> list[Product]:
+    """Construye los productos a partir de las líneas JSONL de una operación bulk.
+    Cada nodo anidado llega en su propia línea con __parentId, Shopify escribe los padres antes que sus hijos:
+    Product -> ProductVariant -> InventoryLevel (el padre de un InventoryLevel es la variante).
+    """
+    products: dict[str, Product] = {}
+    variants: dict[str, Variant] = {}
+    async for line in lines:
+        gid: str = line.get('id', '')
+        parent_id: str = line.get('__parentId', '')
+        if gid.startswith('gid://shopify/Product/'):
+            products[gid] = Product(legacyResourceId=line['legacyResourceId'], title=line.get('title', ''))
+        elif gid.startswith('gid://shopify/ProductVariant/'):
+            product = products[parent_id]
+            variant = Variant(**line, product=Variant.VariantProduct(legacyResourceId=product.legacyResourceId))
+            # El sku se toma de la variante como en get_variant_inventory_levels.
+            variant.sku = variant.sku or variant.inventoryItem.sku
+            product.variants.append(variant)
+            variants[gid] = variant
+        elif gid.startswith('gid://shopify/InventoryLevel/'):
+            variant = variants[parent_id]
+            level = InventoryLevel(**line)
+            level.item.variant.legacyResourceId = variant.legacyResourceId
+            variant.inventoryItem.inventoryLevels.nodes.append(level)
+    return list(products.values())
+
+
 class ShopifyGraphQLClient(BaseClient):
     __instance = None
-    __currently_available: int
+    # Último requestedQueryCost conocido por query, para reservar puntos antes de ejecutarla.
+    __query_costs: dict[str, float] = {}
+    default_query_cost: float = 100
+    max_throttled_retries: int = 5
 
     class Variables(BaseModel):
         num_items: int = 10
@@ -93,43 +136,83 @@ class ShopifyGraphQLClient(BaseClient):
         version: str = Config.shop_version,
         access_token: str = Config.api_key_shopify,
     ):
-        super().__init__(min_interval=0)
+        # Las peticiones no se limitan por cantidad sino por puntos de costo, ver _execute_query.
+        super().__init__(rate_limit=None, http_config=HttpClientConfig(max_connections=30))
+        # Valores iniciales del plan estándar, se ajustan con cada throttleStatus recibido.
+        self.cost_limiter = TokenBucket.get(f'{type(self).__name__}Cost', RateLimit(rate=50, capacity=1000))
         self.host = f'https://{shop}.myshopify.com/admin/api/{version}/graphql.json'
         self.access_token = access_token
         self.headers = {
             'Content-Type': 'application/json',
             'X-Shopify-Access-Token': access_token,
         }
-        self.payload = {}
-        self.response = {}
 
-    async def _execute_query(self, query: str, **variables) -> dict:
-        self.payload = {'query': query, 'variables': variables or {}}
-        self.response = {}
+    @staticmethod
+    def build_payload(query: str, variables: dict | None = None) -> dict:
+        return {'query': query, 'variables': dict(variables or {})}
+
+    def is_throttled(self, response: dict) -> bool:
+        errors = response.get('errors') or []
+        return isinstance(errors, list) and any(
+            (error.get('extensions') or {}).get('code') == 'THROTTLED' for error in errors
+        )
+
+    def update_cost(self, query: str, reserved_cost: float, response: dict):
+        """Registra el costo de la query y sincroniza el bucket con el throttleStatus de Shopify."""
+        cost = (response.get('extensions') or {}).get('cost')
+        if not cost:
+            return
+        requested_cost = cost['requestedQueryCost']
+        self.__query_costs[query] = requested_cost
+        # Shopify cobra el costo solicitado y reembolsa la diferencia con el costo real. Una query THROTTLED no se
+        # cobra (actualQueryCost es null), se devuelve toda la reserva.
+        actual_cost = cost.get('actualQueryCost')
+        self.cost_limiter.refund(reserved_cost - (actual_cost if actual_cost is not None else 0))
+        throttle_status = cost['throttleStatus']
+        self.cost_limiter.sync(
+            throttle_status['currentlyAvailable'],
+            throttle_status['maximumAvailable'],
+            throttle_status['restoreRate'],
+        )
+
+    async def _execute_query(self, query: str, variables: dict | None = None) -> dict:
+        """Ejecuta la query cuando el bucket compartido tiene puntos suficientes para su costo.
+        Si Shopify responde THROTTLED (ej. otro worker consumió el presupuesto), se reintenta.
+        El payload y la respuesta son locales: el cliente es un singleton y se ejecutan varias queries a la vez.
+        """
+        payload = self.build_payload(query, variables)
+        response = {}
 
         try:
-            self.response = await self.request('POST', self.headers, self.host, payload=self.payload)
-            self.__currently_available = self.response['extensions']['cost']['throttleStatus']['currentlyAvailable']
-            max_available = self.response['extensions']['cost']['throttleStatus']['maximumAvailable']
-            restore_rate = self.response['extensions']['cost']['throttleStatus']['restoreRate']
-            diff_available = max_available - self.__currently_available
-            if self.__currently_available < 200:
-                await sleep(divide(diff_available, restore_rate))
-            return self.response
+            for _ in range(self.max_throttled_retries):
+                # acquire no toma más que la capacidad, el reembolso se calcula sobre lo que realmente se tomó.
+                reserved_cost = min(self.__query_costs.get(query, self.default_query_cost), self.cost_limiter.capacity)
+                await self.cost_limiter.acquire(reserved_cost)
+                response = await self.request('POST', self.headers, self.host, payload=payload)
+                self.update_cost(query, reserved_cost, response)
+                if not self.is_throttled(response):
+                    return response
         except Exception as e:
-            exception = ShopifyException(url=self.host, payload=self.payload, msg=type(e).__name__)
+            exception = ShopifyException(url=self.host, payload=payload, msg=type(e).__name__)
             log_shopify.error(f'Error al ejecutar consulta GraphQL: {exception} {traceback.format_exc()}')
             raise exception
 
-    def get_specific_obj_response(self, response: dict, keys: list[str], child_keys: list[str]):
+        exception = ShopifyException(url=self.host, payload=payload, response=response, msg='THROTTLED')
+        log_shopify.error(str(exception))
+        raise exception
+
+    def get_specific_obj_response(
+        self, response: dict, keys: list[str], child_keys: list[str], payload: dict | None = None
+    ):
         """Retorna un objeto en la ruta accediendo a cada una de las key en keys,
         además retorna hijos específicos de ese objeto accediendo a cada una de las key en child_keys.
+        :param payload: Payload de la query, solo para el mensaje de error.
         """
         obj = response
         childs = {}
         if not response:
             msg = 'Respuesta vacía'
-            exception = ShopifyException(payload=self.payload, response=response, msg=msg)
+            exception = ShopifyException(payload=payload, response=response, msg=msg)
             log_shopify.error(str(exception))
             raise exception
 
@@ -142,7 +225,7 @@ class ShopifyGraphQLClient(BaseClient):
 
             if obj is None:
                 msg = f'No se pudo obtener {key}, keys: {keys}, child_keys: {child_keys}'
-                exception = ShopifyException(payload=self.payload, response=response, msg=msg)
+                exception = ShopifyException(payload=payload, response=response, msg=msg)
                 log_shopify.error(str(exception))
                 raise exception
 
@@ -150,7 +233,7 @@ class ShopifyGraphQLClient(BaseClient):
             if isinstance(obj, dict):
                 child = obj.get(key, None)
                 if not child:
-                    exception = ShopifyException(payload=self.payload, response=response)
+                    exception = ShopifyException(payload=payload, response=response)
                     log_shopify.error(f'No se pudo obtener {key} de la respuesta {exception}')
                     raise exception
                 childs[key] = child
@@ -196,9 +279,11 @@ class ShopifyGraphQLClient(BaseClient):
 
         self.pagination_verify_query(query, variables)
 
-        query_result = await self._execute_query(query, **variables)
+        query_result = await self._execute_query(query, variables)
         result = query_result
-        specific_obj_response = self.get_specific_obj_response(query_result, keys, ['pageInfo', 'nodes'])
+        specific_obj_response = self.get_specific_obj_response(
+            query_result, keys, ['pageInfo', 'nodes'], self.build_payload(query, variables)
+        )
 
         page_info = specific_obj_response['childs']['pageInfo']
         nodes = specific_obj_response['childs']['nodes']
@@ -207,8 +292,10 @@ class ShopifyGraphQLClient(BaseClient):
 
         while has_next_page:
             variables['cursor'] = cursor
-            next_query_result = await self._execute_query(query, **variables)
-            specific_obj_response = self.get_specific_obj_response(next_query_result, keys, ['pageInfo', 'nodes'])
+            next_query_result = await self._execute_query(query, variables)
+            specific_obj_response = self.get_specific_obj_response(
+                next_query_result, keys, ['pageInfo', 'nodes'], self.build_payload(query, variables)
+            )
 
             nodes.extend(specific_obj_response['childs']['nodes'])
 
@@ -250,7 +337,7 @@ class ShopifyGraphQLClient(BaseClient):
             }
         """
         variables = self.Variables(search_query=f'variant_id:{variant_id}').model_dump(exclude_none=True)
-        product_json = await self._execute_query(query, **variables)
+        product_json = await self._execute_query(query, variables)
         product_response = ProductsResponse(**product_json)
         return product_response.data.products.nodes[0]
 
@@ -323,7 +410,7 @@ class ShopifyGraphQLClient(BaseClient):
             }
         """
         variables = self.Variables(search_query=f'id:{inventory_item_id}').model_dump(exclude_none=True)
-        inventory_levels_json = await self._execute_query(query, **variables)
+        inventory_levels_json = await self._execute_query(query, variables)
         return InventoryLevelsResponse(**inventory_levels_json)
 
     async def get_variant_inventory_levels(self, variant: Variant):
@@ -333,12 +420,10 @@ class ShopifyGraphQLClient(BaseClient):
             variant.sku = inventory_item.sku
             variant.inventoryItem.inventoryLevels.nodes = inventory_item.inventoryLevels.nodes
 
-    async def get_porduct_variant_inventory_levels(self, product: Product, batch_size: int = 5):
+    async def get_porduct_variant_inventory_levels(self, product: Product):
         await self.get_product_variants(product)
-        for i in range(0, len(product.variants), batch_size):
-            batch = product.variants[i : i + batch_size]
-            tasks = [self.get_variant_inventory_levels(variant) for variant in batch]
-            await gather(*tasks)
+        # La concurrencia la regula el bucket de costo, no un tamaño de lote fijo.
+        await gather(*[self.get_variant_inventory_levels(variant) for variant in product.variants])
 
     async def get_order_line_items(self, order: Order, num_items: int = 50):
         query = """
@@ -376,18 +461,18 @@ class ShopifyGraphQLClient(BaseClient):
         }
         """
         variables = self.Variables(num_items=num_items, gid=order.id).model_dump(exclude_none=True)
-        order_line_items_json = await self._execute_query(query, **variables)
+        order_line_items_json = await self._execute_query(query, variables)
         order.lineItems = order_line_items_json['data']['order']['lineItems']
 
-    async def get_orders_line_items(self, orders: list[Order], batch_size: int = 10) -> None:
-        # Procesar por lotes de con asyncio.gather
-        if len(orders) > 0:
-            for i in range(0, len(orders), batch_size):
-                batch = orders[i : i + batch_size]
-                tasks = [self.get_order_line_items(order) for order in batch if batch]
-                await gather(*tasks)
+    async def get_orders_line_items(self, orders: list[Order]) -> None:
+        # La concurrencia la regula el bucket de costo, no un tamaño de lote fijo.
+        await gather(*[self.get_order_line_items(order) for order in orders])
 
-    async def get_orders_by_range(self, start: date, end: date, num_items: int = 20) -> list[Order]:
+    async def get_orders_by_range(
+        self, start: date, end: date, num_items: int = 20, line_items: bool = True
+    ) -> list[Order]:
+        """:param line_items: Consulta los line items de cada pedido, con False se consultan aparte con
+        get_orders_line_items."""
         start_str = DateTz.local(datetime(start.year, start.month, start.day)).utc.to_isostring
         end_str = DateTz.local(datetime(end.year, end.month, end.day)).utc.to_isostring
         query = """
@@ -420,8 +505,46 @@ class ShopifyGraphQLClient(BaseClient):
         ).model_dump(exclude_none=True)
         orders_json = await self._get_all(query, ['data', 'orders'], variables)
         orders_response = OrdersResponse(**orders_json)
-        await self.get_orders_line_items(orders_response.data.orders.nodes)
+        if line_items:
+            await self.get_orders_line_items(orders_response.data.orders.nodes)
+
+        return orders_response.data.orders.nodes
 
+    async def get_orders_updated_since(self, desde: datetime, num_items: int = 20) -> list[Order]:
+        """Pedidos pagados actualizados desde `desde` (inclusive), ordenados por updatedAt ascendente.
+        Se usa >= para no perder pedidos con el mismo updatedAt que la marca; el pedido de la marca se vuelve a
+        procesar y su procesamiento es idempotente."""
+        desde_str = desde.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+        query = """
+            query GetOrdersUpdatedSince($num_items: Int!, $search_query: String!, $cursor: String) {
+                orders(first: $num_items, query: $search_query, after: $cursor, sortKey: UPDATED_AT) {
+                    nodes {
+                        id
+                        fulfillments(first: 1) {
+                            location {
+                                legacyResourceId
+                            }
+                        }
+                        number
+                        createdAt
+                        updatedAt
+                        tags
+                        app {
+                            name
+                        }
+                    }
+                    pageInfo {
+                        endCursor
+                        hasNextPage
+                    }
+                }
+            }
+        """
+        variables = self.Variables(
+            num_items=num_items, search_query=f"financial_status:paid updated_at:>='{desde_str}'"
+        ).model_dump(exclude_none=True)
+        orders_json = await self._get_all(query, ['data', 'orders'], variables)
+        orders_response = OrdersResponse(**orders_json)
         return orders_response.data.orders.nodes
 
     async def temp_get_orders_by_range(self, start: date, end: date, num_items: int = 20) -> list[Order]:
@@ -520,23 +643,24 @@ class ShopifyGraphQLClient(BaseClient):
         }
         """
         variables = self.Variables(gid=order_gid).model_dump(exclude_none=True)
-        order_json = await self._execute_query(query, **variables)
+        payload = self.build_payload(query, variables)
+        order_json = await self._execute_query(query, variables)
         try:
             order_response = OrderResponse(**order_json)
             await self.get_order_line_items(order_response.data.order)
         except ValidationError as e:
             msg = f'{type(e)} {OrderResponse.__name__}'
             msg += f'\n{repr(e.errors())}'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=order_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=order_json, msg=msg)
             raise exception
         except KeyError:
             msg = 'KeyError'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=order_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=order_json, msg=msg)
             raise exception
 
         if not order_response.valid():
             msg = 'No se obtuvo orden'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=order_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=order_json, msg=msg)
             raise exception
 
         return order_response
@@ -609,22 +733,23 @@ class ShopifyGraphQLClient(BaseClient):
         }
         """
         variables = self.Variables(search_query=f'name:#{order_number}').model_dump(exclude_none=True)
-        orders_json = await self._execute_query(query, **variables)
+        payload = self.build_payload(query, variables)
+        orders_json = await self._execute_query(query, variables)
         try:
             orders_response = OrdersResponse(**orders_json)
             await self.get_order_line_items(orders_response.data.orders.nodes[0])
         except ValidationError as e:
             msg = f'{type(e)} {OrdersResponse.__name__}'
             msg += f'\n{repr(e.errors())}'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=orders_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=orders_json, msg=msg)
             raise exception
         except KeyError:
             msg = 'KeyError'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=orders_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=orders_json, msg=msg)
             raise exception
         except IndexError:
             msg = 'IndexError'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=orders_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=orders_json, msg=msg)
             raise exception
 
         return orders_response.data.orders.nodes[0]
@@ -658,7 +783,8 @@ class ShopifyGraphQLClient(BaseClient):
         }
         """
         variables = self.Variables(search_query=f'payment_id:{payment_id}').model_dump(exclude_none=True)
-        orders_json = await self._execute_query(query, **variables)
+        payload = self.build_payload(query, variables)
+        orders_json = await self._execute_query(query, variables)
         try:
             orders_response = OrdersResponse(**orders_json)
             orders_response.valid()
@@ -667,49 +793,367 @@ class ShopifyGraphQLClient(BaseClient):
         except ValidationError as e:
             msg = f'{type(e)} {OrdersResponse.__name__}'
             msg += f'\n{repr(e.errors())}'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=orders_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=orders_json, msg=msg)
             raise exception
         except KeyError:
             msg = 'KeyError'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=orders_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=orders_json, msg=msg)
             raise exception
         except IndexError:
             msg = 'IndexError'
-            exception = ShopifyException(url=self.host, payload=self.payload, response=orders_json, msg=msg)
+            exception = ShopifyException(url=self.host, payload=payload, response=orders_json, msg=msg)
             raise exception
 
         return orders_response.data.orders.nodes[0]
 
-    async def get_orders_by_payment_ids(self, payment_ids: list[str], batch_size: int = 10) -> list[Order]:
+    async def get_orders_by_payment_ids(self, payment_ids: list[str]) -> list[Order]:
         if not len(payment_ids):
             return []
-        orders = []
-        for i in range(0, len(payment_ids), batch_size):
-            batch = payment_ids[i : i + batch_size]
-            tasks = [self.get_order_by_payment_id(payment_id) for payment_id in batch if payment_id]
-            orders_response = await gather(*tasks)
-            orders.extend([order for order in orders_response if order])
-        return orders
-
-    async def get_products(self, batch_size: int = 10) -> list[Product]:
-        """Función principal optimizada con procesamiento en lotes de 5 productos"""
-        # Obtener todos los productos
-        product_response = await self._get_products_base()
-        products = product_response.data.products.nodes
-
-        for i in range(0, len(products), batch_size):
-            batch = products[i : i + batch_size]
-            # Procesar cada lote de productos concurrentemente
-            await gather(*[self.get_porduct_variant_inventory_levels(product) for product in batch])
+        tasks = [self.get_order_by_payment_id(payment_id) for payment_id in payment_ids if payment_id]
+        orders_response = await gather(*tasks)
+        return [order for order in orders_response if order]
+
+    variant_inventory_fragment = """
+        fragment VariantInventory on ProductVariant {
+            legacyResourceId
+            inventoryQuantity
+            title
+            price
+            sku
+            inventoryItem {
+                legacyResourceId
+                inventoryLevels(first: $num_levels) {
+                    nodes {
+                        quantities(names: ["on_hand"]) {
+                            quantity
+                        }
+                        location {
+                            legacyResourceId
+                            address {
+                                city
+                                province
+                                country
+                                address1
+                                formatted
+                            }
+                        }
+                    }
+                    pageInfo {
+                        hasNextPage
+                    }
+                }
+            }
+        }
+    """
+
+    def _parse_nested_variants(self, product: Product, nodes: list[dict]) -> tuple[list[Variant], list[Variant]]:
+        """Retorna las variantes del producto y, aparte, las que tienen más niveles de inventario que los obtenidos."""
+        variants: list[Variant] = []
+        overflow: list[Variant] = []
+        for node in nodes:
+            variant = Variant(**node, product=Variant.VariantProduct(legacyResourceId=product.legacyResourceId))
+            for level in variant.inventoryItem.inventoryLevels.nodes:
+                level.item.variant.legacyResourceId = variant.legacyResourceId
+            variants.append(variant)
+            if node['inventoryItem']['inventoryLevels']['pageInfo']['hasNextPage']:
+                overflow.append(variant)
+        return variants, overflow
+
+    async def _get_remaining_variants(
+        self, product: Product, cursor: str, num_variants: int, num_levels: int
+    ) -> tuple[list[Variant], list[Variant]]:
+        """Obtiene las variantes que no cupieron en la página anidada de get_products_nested."""
+        query = (
+            """
+            query GetProductVariantsNested($gid: ID!, $num_items: Int!, $cursor: String, $num_levels: Int!) {
+                product(id: $gid) {
+                    variants(first: $num_items, after: $cursor) {
+                        nodes {
+                            ...VariantInventory
+                        }
+                        pageInfo {
+                            hasNextPage
+                            endCursor
+                        }
+                    }
+                }
+            }
+            """
+            + self.variant_inventory_fragment
+        )
+        variables = {
+            **self.Variables(
+                num_items=num_variants, cursor=cursor, gid=f'gid://shopify/Product/{product.legacyResourceId}'
+            ).model_dump(exclude_none=True),
+            'num_levels': num_levels,
+        }
+        variants_json = await self._get_all(query, ['data', 'product', 'variants'], variables)
+        return self._parse_nested_variants(product, variants_json['data']['product']['variants']['nodes'])
+
+    async def get_products_nested(
+        self,
+        search_query: str = 'has_variant_with_components:false',
+        num_items: int = 5,
+        num_variants: int = 10,
+        num_levels: int = 3,
+    ) -> list[Product]:
+        """Obtiene productos, variantes y niveles de inventario en una sola consulta paginada.
+        Los tamaños de página mantienen el costo de cada página por debajo del máximo de 1000 puntos de Shopify;
+        las variantes o niveles que no caben en la página anidada se completan con consultas adicionales.
+        """
+        query = (
+            """
+            query GetProductsNested(
+                $num_items: Int!, $cursor: String, $search_query: String, $num_variants: Int!, $num_levels: Int!
+            ) {
+                products(first: $num_items, after: $cursor, query: $search_query) {
+                    nodes {
+                        legacyResourceId
+                        title
+                        variants(first: $num_variants) {
+                            nodes {
+                                ...VariantInventory
+                            }
+                            pageInfo {
+                                hasNextPage
+                                endCursor
+                            }
+                        }
+                    }
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                }
+            }
+            """
+            + self.variant_inventory_fragment
+        )
+        variables = {
+            **self.Variables(num_items=num_items, search_query=search_query).model_dump(exclude_none=True),
+            'num_variants': num_variants,
+            'num_levels': num_levels,
+        }
+        products_json = await self._get_all(query, ['data', 'products'], variables)
+
+        products: list[Product] = []
+        overflow_variants: list[Variant] = []
+        remaining_variants_tasks = []
+        for node in products_json['data']['products']['nodes']:
+            product = Product(legacyResourceId=node['legacyResourceId'], title=node['title'])
+            product.variants, overflow = self._parse_nested_variants(product, node['variants']['nodes'])
+            overflow_variants.extend(overflow)
+            page_info = node['variants']['pageInfo']
+            if page_info['hasNextPage']:
+                remaining_variants_tasks.append(
+                    self._get_remaining_variants(product, page_info['endCursor'], num_variants, num_levels)
+                )
+            products.append(product)
+
+        products_by_id = {product.legacyResourceId: product for product in products}
+        for variants, overflow in await gather(*remaining_variants_tasks):
+            for variant in variants:
+                products_by_id[variant.product.legacyResourceId].variants.append(variant)
+            overflow_variants.extend(overflow)
+
+        await gather(*[self.get_variant_inventory_levels(variant) for variant in overflow_variants])
+        return products
+
+    async def get_products_by_variant_ids(self, variant_ids: list[int], chunk_size: int = 50) -> list[Product]:
+        """Obtiene los productos (con variantes e inventarios) de varias variantes agrupando los ids en
+        búsquedas `variant_id:1 OR variant_id:2 ...`, en lugar de una consulta por variante."""
+        chunks = [variant_ids[i : i + chunk_size] for i in range(0, len(variant_ids), chunk_size)]
+        results = await gather(
+            *[
+                self.get_products_nested(search_query=' OR '.join(f'variant_id:{id}' for id in chunk))
+                for chunk in chunks
+            ]
+        )
+        products = {product.legacyResourceId: product for result in results for product in result}
+        return list(products.values())
+
+    async def get_products(self) -> list[Product]:
+        """Obtiene todos los productos con sus variantes e inventarios.
+        Una sola consulta paginada y anidada reemplaza las consultas por producto y por variante.
+        """
+        products = await self.get_products_nested()
 
         # Guardar resultados
         if Config.environment == 'development':
-            output_json = product_response.model_dump_json(indent=2)
+            output_json = ProductsResponse(data=Products(products=ProductNodes(nodes=products))).model_dump_json(
+                indent=2
+            )
             with open('shopify_inventory_data.json', 'w', encoding='utf-8') as f:
                 f.write(output_json)
 
         return products
 
+    async def bulk_operation_run_query(self, bulk_query: str) -> str:
+        """Inicia una operación bulk de Shopify y retorna su id.
+        Shopify solo permite una operación bulk de consulta a la vez por tienda.
+        """
+        mutation = """
+        mutation BulkOperationRunQuery($query: String!) {
+            bulkOperationRunQuery(query: $query) {
+                bulkOperation {
+                    id
+                    status
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+        """
+        variables = {'query': bulk_query}
+        bulk_json = await self._execute_query(mutation, variables)
+        root = self.get_specific_obj_response(bulk_json, ['data', 'bulkOperationRunQuery'], [])['root']
+        user_errors = root.get('userErrors') or []
+        bulk_operation = root.get('bulkOperation') or {}
+        if user_errors or not bulk_operation.get('id'):
+            payload = self.build_payload(mutation, variables)
+            exception = ShopifyException(url=self.host, payload=payload, response=bulk_json, msg='bulkOperation')
+            log_shopify.error(str(exception))
+            raise exception
+        return bulk_operation['id']
+
+    async def bulk_operation_cancel(self, bulk_operation_id: str):
+        """Solicita la cancelación de una operación bulk, Shopify la pasa a CANCELING y luego a CANCELED."""
+        mutation = """
+        mutation BulkOperationCancel($id: ID!) {
+            bulkOperationCancel(id: $id) {
+                bulkOperation {
+                    id
+                    status
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+        """
+        variables = {'id': bulk_operation_id}
+        bulk_json = await self._execute_query(mutation, variables)
+        root = self.get_specific_obj_response(bulk_json, ['data', 'bulkOperationCancel'], [])['root']
+        if root.get('userErrors'):
+            payload = self.build_payload(mutation, variables)
+            exception = ShopifyException(url=self.host, payload=payload, response=bulk_json, msg='bulkOperationCancel')
+            log_shopify.error(str(exception))
+            raise exception
+
+    async def wait_bulk_operation(
+        self, bulk_operation_id: str, poll_interval: float = 3, timeout: float = 3600
+    ) -> str | None:
+        """Espera a que la operación bulk termine y retorna la url del archivo JSONL.
+        Retorna None si la operación no produjo resultados.
+        Si no termina en `timeout` segundos se cancela, así no bloquea las siguientes operaciones bulk de la tienda.
+        """
+        query = """
+        query BulkOperation($gid: ID!) {
+            node(id: $gid) {
+                ... on BulkOperation {
+                    id
+                    status
+                    errorCode
+                    objectCount
+                    url
+                }
+            }
+        }
+        """
+        variables = self.Variables(gid=bulk_operation_id).model_dump(exclude_none=True)
+        deadline = monotonic() + timeout
+        while True:
+            bulk_json = await self._execute_query(query, variables)
+            bulk_operation = self.get_specific_obj_response(bulk_json, ['data', 'node'], [])['root']
+            status = bulk_operation.get('status')
+            if status == 'COMPLETED':
+                return bulk_operation.get('url')
+            if status in ('FAILED', 'CANCELED', 'EXPIRED'):
+                payload = self.build_payload(query, variables)
+                exception = ShopifyException(url=self.host, payload=payload, response=bulk_json, msg=status)
+                log_shopify.error(str(exception))
+                raise exception
+            if monotonic() >= deadline:
+                try:
+                    await self.bulk_operation_cancel(bulk_operation_id)
+                except ShopifyException:
+                    pass  # Ya registrada, se reporta el timeout.
+                payload = self.build_payload(query, variables)
+                exception = ShopifyException(url=self.host, payload=payload, response=bulk_json, msg='TIMEOUT')
+                log_shopify.error(str(exception))
+                raise exception
+            await sleep(poll_interval)
+
+    async def stream_jsonl(self, url: str) -> AsyncIterator[dict]:
+        """Descarga el archivo JSONL de una operación bulk línea por línea, sin cargarlo completo en memoria."""
+        client = HttpClientPool.get(url, self.http_config)
+        async with client.stream('GET', url, timeout=300) as response:
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    async def get_products_bulk(self) -> list[Product]:
+        """Alternativa a get_products para catálogos grandes: una sola operación bulk
+        reemplaza las consultas por producto y por variante.
+        """
+        bulk_query = """
+        {
+            products(query: "has_variant_with_components:false") {
+                edges {
+                    node {
+                        id
+                        legacyResourceId
+                        title
+                        variants {
+                            edges {
+                                node {
+                                    id
+                                    legacyResourceId
+                                    inventoryQuantity
+                                    title
+                                    price
+                                    sku
+                                    inventoryItem {
+                                        legacyResourceId
+                                        sku
+                                        inventoryLevels {
+                                            edges {
+                                                node {
+                                                    id
+                                                    quantities(names: ["on_hand"]) {
+                                                        quantity
+                                                    }
+                                                    location {
+                                                        legacyResourceId
+                                                        address {
+                                                            city
+                                                            province
+                                                            country
+                                                            address1
+                                                            formatted
+                                                        }
+                                                    }
+                                                }
+                                            }
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+        """
+        bulk_operation_id = await self.bulk_operation_run_query(bulk_query)
+        url = await self.wait_bulk_operation(bulk_operation_id)
+        if not url:
+            return []
+        return await parse_bulk_products(self.stream_jsonl(url))
+
     async def taggs_add(self, id: int | str, tags: list[str]) -> bool:
         mutation = """
         mutation addTags($id: ID!, $tags: [String!]!) {
@@ -724,76 +1168,62 @@ class ShopifyGraphQLClient(BaseClient):
         }
         """
         variables = self.Variables(id=id, tags=tags).model_dump(exclude_none=True)
-        mutation_json = await self._execute_query(mutation, **variables)
+        mutation_json = await self._execute_query(mutation, variables)
         user_errors = self.get_specific_obj_response(mutation_json, ['data', 'tagsAdd', 'userErrors'], [])['root']
         return isinstance(user_errors, list) and len(user_errors) == 0
 
 
 class ShopifyInventario:
-    async def crear_bodega(self, session: AsyncSession, location: Location) -> Bodega:
-        bodega_query = BodegaQuery()
-
-        bodega = await bodega_query.get_by_shopify_id(session, location.legacyResourceId)
-        if bodega is None:
-            ubicacion = ', '.join(location.address.formatted)
-            bodega_create = BodegaCreate(ubicacion=ubicacion, shopify_id=location.legacyResourceId)
-            bodega = await bodega_query.create(session, bodega_create)
-
-        return bodega
-
-    async def crear_bodegas(self, session: AsyncSession, locations: list[Location]):
-        bodegas = [await self.crear_bodega(session, location) for location in locations]
-        bodegas = [bodega for bodega in bodegas if bodega]
-        return bodegas
-
-    async def crear_elemento(self, session, product: Product) -> Elemento:
-        elemento_query = ElementoQuery()
-        elemento = await elemento_query.get_by_shopify_id(session, product.legacyResourceId)
-        if elemento is None:
-            elemento_create = ElementoCreate(
-                shopify_id=product.legacyResourceId,
-                nombre=product.title,
-                tipo_medida_id=1,
-                grupo_id=3,
-                fabricado=True,
-            )
-            elemento = await elemento_query.create(session, elemento_create)
-
-        return elemento
-
-    async def crear_variante_elemento(
-        self, session: AsyncSession, variant: Variant, elemento_id: int
-    ) -> VarianteElemento:
-        variante_elemento_query = VarianteElementoQuery()
+    async def crear_bodegas(self, session: AsyncSession, locations: list[Location]) -> list[Bodega]:
+        """Crea las bodegas que no existan, los registros existentes no se modifican."""
+        bodegas_create = [
+            BodegaCreate(ubicacion=', '.join(location.address.formatted), shopify_id=location.legacyResourceId)
+            for location in locations
+        ]
+        return await BodegaQuery().bulk_upsert(session, bodegas_create, ['shopify_id'], update_cols=[])
+
+    async def crear_elemento_y_variantes(self, session: AsyncSession, product: Product) -> dict[int, VarianteElemento]:
+        """Crea el elemento y las variantes que no existan con un upsert por tabla.
+        Retorna las variantes por shopify_id.
+        """
+        elemento_create = ElementoCreate(
+            shopify_id=product.legacyResourceId,
+            nombre=product.title,
+            tipo_medida_id=1,
+            grupo_id=3,
+            fabricado=True,
+        )
+        elementos = await ElementoQuery().bulk_upsert(session, [elemento_create], ['shopify_id'], update_cols=[])
 
-        variante = await variante_elemento_query.get_by_shopify_id(session, variant.legacyResourceId)
-        if variante is None:
-            variante_create = VarianteElementoCreate(
+        variantes_create = [
+            VarianteElementoCreate(
                 shopify_id=variant.legacyResourceId,
                 nombre=variant.title,
                 sku=variant.sku,
-                elemento_id=elemento_id,
+                elemento_id=elementos[0].id,
             )
-            variante = await variante_elemento_query.create(session, variante_create)
-
-        return variante
-
-    async def crear_precio_variante(self, price_variant: float, variante_elemento_id: int) -> PreciosPorVariante:
-        async for session in get_async_session():
-            async with session:
-                precio_variante_query = PrecioPorVarianteQuery()
-
-                precio = await precio_variante_query.get_last(session, variante_elemento_id, 1)
-                if precio is None or (precio and precio.precio != price_variant):
-                    precio_create = PreciosPorVarianteCreate(
-                        variante_id=variante_elemento_id,
-                        tipo_precio_id=1,
-                        precio=price_variant,
-                    )
-                    precio = await precio_variante_query.create(session, precio_create)
+            for variant in product.variants
+        ]
+        variantes = await VarianteElementoQuery().bulk_upsert(
+            session, variantes_create, ['shopify_id'], update_cols=[]
+        )
+        return {variante.shopify_id: variante for variante in variantes}
+
+    async def crear_precio_variante(
+        self, session: AsyncSession, price_variant: float, variante_elemento_id: int
+    ) -> PreciosPorVariante:
+        precio_variante_query = PrecioPorVarianteQuery()
+
+        precio = await precio_variante_query.get_last(session, variante_elemento_id, 1)
+        if precio is None or (precio and precio.precio != price_variant):
+            precio_create = PreciosPorVarianteCreate(
+                variante_id=variante_elemento_id,
+                tipo_precio_id=1,
+                precio=price_variant,
+            )
+            precio = await precio_variante_query.create(session, precio_create)
 
-            return precio
-        raise
+        return precio
 
     async def crear_movimiento_ajuste(
         self,
@@ -827,25 +1257,22 @@ class ShopifyInventario:
 
     async def crear_product_and_relations(self, product: Product):
         async for session in get_async_session():
-            async with session:
-                elemento = await self.crear_elemento(session, product)
+            async with unit_of_work(session):
+                variantes = await self.crear_elemento_y_variantes(session, product)
                 for variant in product.variants:
-                    variante_elemento = await self.crear_variante_elemento(
-                        session, variant=variant, elemento_id=elemento.id
-                    )
-                    await self.crear_precio_variante(variant.price, variante_elemento.id)
-                    for level in variant.inventoryItem.inventoryLevels.nodes:
-                        await self.crear_bodega(session, level.location)
+                    variante_elemento = variantes[variant.legacyResourceId]
+                    await self.crear_precio_variante(session, variant.price, variante_elemento.id)
+                locations = self.get_products_unique_locations([product])
+                await self.crear_bodegas(session, list(locations.values()))
 
     async def crear_product_relations_ajuste(self, product: Product, bodegas: list[Bodega]):
+        # Un solo commit por producto: el elemento, sus variantes, precios y ajustes se crean o no en conjunto.
         async for session in get_async_session():
-            async with session:
-                elemento = await self.crear_elemento(session, product)
+            async with unit_of_work(session):
+                variantes = await self.crear_elemento_y_variantes(session, product)
                 for variant in product.variants:
-                    variante_elemento = await self.crear_variante_elemento(
-                        session, variant=variant, elemento_id=elemento.id
-                    )
-                    await self.crear_precio_variante(variant.price, variante_elemento.id)
+                    variante_elemento = variantes[variant.legacyResourceId]
+                    await self.crear_precio_variante(session, variant.price, variante_elemento.id)
                     for level in variant.inventoryItem.inventoryLevels.nodes:
                         bodega = next(
                             (bodega for bodega in bodegas if bodega.shopify_id == level.location.legacyResourceId)
@@ -858,8 +1285,11 @@ class ShopifyInventario:
         meta_atributo_query = MetaAtributoQuery()
         meta_atributo = await meta_atributo_query.get_by_nombre(session, nombre)
         if meta_atributo is None:
+            # ON CONFLICT: otra corrutina pudo crear el atributo entre la consulta y la inserción.
             meta_atributo_create = MetaAtributoCreate(nombre=nombre)
-            meta_atributo = await meta_atributo_query.create(session, meta_atributo_create)
+            (meta_atributo,) = await meta_atributo_query.bulk_upsert(
+                session, [meta_atributo_create], ['nombre'], update_cols=[]
+            )
 
         return meta_atributo
 
@@ -868,7 +1298,7 @@ class ShopifyInventario:
         meta_valor = await meta_valor_query.get_by_valor(session, valor)
         if meta_valor is None:
             meta_valor_create = MetaValorCreate(valor=valor)
-            meta_valor = await meta_valor_query.create(session, meta_valor_create)
+            (meta_valor,) = await meta_valor_query.bulk_upsert(session, [meta_valor_create], ['valor'], update_cols=[])
         return meta_valor
 
     async def crear_metadato_orden(self, session: AsyncSession, atributo: str, valor: str, order_number: int):
@@ -897,7 +1327,12 @@ class ShopifyInventario:
                 meta_atributo_id=meta_atributo.id,
                 meta_valor_id=meta_valor.id,
             )
-            metadato = await metadatos_por_soporte_query.create(session, metadato_create)
+            (metadato,) = await metadatos_por_soporte_query.bulk_upsert(
+                session,
+                [metadato_create],
+                ['tipo_soporte_id', 'soporte_id', 'meta_atributo_id', 'meta_valor_id'],
+                update_cols=[],
+            )
 
         return metadato
 
@@ -912,17 +1347,16 @@ class ShopifyInventario:
                 if orden.app and orden.app.name:
                     await self.crear_metadato_orden(session, 'app', orden.app.name, orden.number)
 
-    async def sicnronizar_inventario(self, ajustar_existencias: bool = False):
+    async def sicnronizar_inventario(self, ajustar_existencias: bool = False, bulk: bool = False):
+        """:param bulk: Obtiene el catálogo con una operación bulk de Shopify en lugar de consultas por producto."""
         client = ShopifyGraphQLClient()
-        products = await client.get_products()
+        products = await client.get_products_bulk() if bulk else await client.get_products()
 
         unique_locations = self.get_products_unique_locations(products)
         bodegas: list[Bodega] = []
         async for session in get_async_session():
             async with session:
-                for location in unique_locations.values():
-                    bodega = await self.crear_bodega(session, location)
-                    bodegas.append(bodega)
+                bodegas = await self.crear_bodegas(session, list(unique_locations.values()))
 
         if ajustar_existencias:
             await gather(*[self.crear_product_relations_ajuste(product, bodegas) for product in products])
@@ -931,106 +1365,238 @@ class ShopifyInventario:
         log_shopify.info('Inventario sincronizado')
 
     async def crear_movimientos_orden(self, orden: Order):
-        movimiento_query = MovimientoQuery()
-        elemento_query = ElementoQuery()
-        tipo_movimiento_query = TipoMovimientoQuery()
-        tipo_soporte_query = TipoSoporteQuery()
+        await self.crear_movimientos_ordenes([orden])
+
+    async def resolver_variantes(self, session: AsyncSession, variant_ids: set[int]) -> dict[int, VarianteElemento]:
+        """Retorna las variantes por shopify_id, creando desde Shopify los productos que aún no existen."""
         variante_elemento_query = VarianteElementoQuery()
-        estado_variante_query = EstadoVarianteQuery()
-        bodega_query = BodegaQuery()
-        async for session in get_async_session():
-            async with session:
-                for item in orden.lineItems.nodes:
-                    # Se garantiza que todos los elementos necesarios estén creados.
-                    elemento = await elemento_query.get_by_shopify_id(session, item.variant.legacyResourceId)
-                    if elemento is None:
-                        shopify_client = ShopifyGraphQLClient()
-                        product = await shopify_client.get_product_by_variant_id(item.variant.legacyResourceId)
-                        await shopify_client.get_porduct_variant_inventory_levels(product)
-                        await self.crear_product_and_relations(product)
-
-                    variante_elemento = await variante_elemento_query.get_by_shopify_id(
-                        session, item.variant.legacyResourceId
-                    )
-                    if variante_elemento is None:
-                        raise ValueError(f'No se encontró VarianteElemento con id {item.variant.legacyResourceId}')
+        variantes = await variante_elemento_query.get_by_shopify_ids(session, list(variant_ids))
+        variantes_by_id = {variante.shopify_id: variante for variante in variantes}
 
-                    name_tipo_soporte = 'Pedido'
-                    tipo_soporte = await tipo_soporte_query.get_by_nombre(session, name_tipo_soporte)
-                    if tipo_soporte is None:
-                        raise ValueError(f'No se encontró TipoSoporte con nombre {name_tipo_soporte}')
+        missing = [id for id in variant_ids if id not in variantes_by_id]
+        if missing:
+            products = await ShopifyGraphQLClient().get_products_by_variant_ids(missing)
+            await gather(*[self.crear_product_and_relations(product) for product in products])
+            variantes = await variante_elemento_query.get_by_shopify_ids(session, missing)
+            variantes_by_id.update({variante.shopify_id: variante for variante in variantes})
+
+        return variantes_by_id
 
-                    movimiento = await movimiento_query.get_by_soporte_variante_id(
-                        session,
+    async def preparar_movimientos_ordenes(self, session: AsyncSession, ordenes: list[Order]) -> list[MovimientoCreate]:
+        """Movimientos de salida de un lote de pedidos que aún no existen.
+        Las variantes y los movimientos existentes del lote se resuelven con consultas IN, el número de
+        consultas depende del número de lotes y no del número de ítems.
+        Se debe llamar en la transacción que inserta los movimientos: los pedidos del lote quedan bloqueados
+        (MovimientoQuery.bloquear_soportes) hasta el commit, así otro proceso no inserta los mismos movimientos.
+        """
+        tipo_soporte = await TipoSoporteQuery().get_by_nombre(session, 'Pedido')
+        if tipo_soporte is None:
+            raise ValueError('No se encontró TipoSoporte con nombre Pedido')
+        tipo_movimiento = await TipoMovimientoQuery().get_by_nombre(session, 'Salida')
+        if tipo_movimiento is None:
+            raise ValueError('No se encontró TipoMovimiento con nombre Salida')
+        estado_variante = await EstadoVarianteQuery().get_by_nombre(session, 'Descontado')
+        if estado_variante is None:
+            raise ValueError('No se encontró EstadoVariante con nombre Descontado')
+
+        # Se garantiza que todos los elementos necesarios estén creados.
+        variant_ids = {item.variant.legacyResourceId for orden in ordenes for item in orden.lineItems.nodes}
+        variantes = await self.resolver_variantes(session, variant_ids)
+        not_found = variant_ids - variantes.keys()
+        if not_found:
+            raise ValueError(f'No se encontró VarianteElemento con id {", ".join(map(str, not_found))}')
+
+        movimiento_query = MovimientoQuery()
+        soporte_ids = [str(orden.number) for orden in ordenes]
+        await movimiento_query.bloquear_soportes(session, tipo_soporte.id, soporte_ids)
+        movimientos = await movimiento_query.get_by_soportes(session, tipo_soporte.id, soporte_ids)
+        existentes = {(movimiento.soporte_id, movimiento.variante_id) for movimiento in movimientos}
+
+        bodega_query = BodegaQuery()
+        bodegas: dict[int, Bodega] = {}
+        movimientos_create: list[MovimientoCreate] = []
+        for orden in ordenes:
+            if len(orden.fulfillments) > 0:
+                location_id = orden.fulfillments[0].location.legacyResourceId
+            else:
+                # Por defecto si no se encuentra bodega, se asigna el ID del fulfillment en Bogotá
+                location_id = 109793607972
+            bodega = bodegas.get(location_id) or await bodega_query.get_by_shopify_id(session, location_id)
+            if bodega is None:
+                raise ValueError(f'No se encontró Bodega con shopify_id {location_id}')
+            bodegas[location_id] = bodega
+
+            for item in orden.lineItems.nodes:
+                variante_elemento = variantes[item.variant.legacyResourceId]
+                key = (str(orden.number), variante_elemento.id)
+                if key in existentes:
+                    continue
+                existentes.add(key)
+
+                movimientos_create.append(
+                    MovimientoCreate(
+                        tipo_movimiento_id=tipo_movimiento.id,
                         tipo_soporte_id=tipo_soporte.id,
                         soporte_id=str(orden.number),
-                        variante_elemento_id=variante_elemento.id,
+                        variante_id=variante_elemento.id,
+                        estado_variante_id=estado_variante.id,
+                        cantidad=item.quantity,
+                        valor=item.discounted_unit_price,
+                        bodega_id=bodega.id,
+                        fecha=orden.createdAt,
                     )
+                )
+        return movimientos_create
 
-                    if movimiento is None:
-                        tipo_movimiento = await tipo_movimiento_query.get_by_nombre(session, 'Salida')
-                        if tipo_movimiento is None:
-                            raise ValueError('No se encontró TipoMovimiento con nombre Salida')
-                        estado_variante = await estado_variante_query.get_by_nombre(session, 'Descontado')
-                        if estado_variante is None:
-                            raise ValueError('No se encontró EstadoVariante con nombre Descontado')
-                        bodega = None
-                        if len(orden.fulfillments) > 0:
-                            location_id = orden.fulfillments[0].location.legacyResourceId
-                            bodega = await bodega_query.get_by_shopify_id(session, location_id)
-                        else:
-                            bodega = await bodega_query.get_by_shopify_id(
-                                session, 109793607972
-                            )  # Por defecto si no se encuentra bodega, se asigna el ID del fulfillment en Bogotá
-                        if bodega is None:
-                            raise ValueError()
-
-                        movimiento_create = MovimientoCreate(
-                            tipo_movimiento_id=tipo_movimiento.id,
-                            tipo_soporte_id=tipo_soporte.id,
-                            soporte_id=str(orden.number),
-                            variante_id=variante_elemento.id,
-                            estado_variante_id=estado_variante.id,
-                            cantidad=item.quantity,
-                            valor=item.discounted_unit_price,
-                            bodega_id=bodega.id,
-                            fecha=orden.createdAt,
-                        )
+    async def crear_movimientos_ordenes(self, ordenes: list[Order]):
+        """Crea los movimientos de salida de un lote de pedidos."""
+        if not ordenes:
+            return
 
-                        await movimiento_query.create(session, movimiento_create)
+        async for session in get_async_session():
+            async with unit_of_work(session):
+                movimientos_create = await self.preparar_movimientos_ordenes(session, ordenes)
+                await MovimientoQuery().bulk_insert(session, movimientos_create)  # type: ignore
+
+    async def cargar_movimientos_ordenes(self, ordenes: list[Order]) -> tuple[int, int]:
+        """Equivale a crear_metadatos_orden y crear_movimientos_ordenes sobre el lote, con una carga COPY
+        (MovimientoQuery.cargar_copy). Pensado para backfills de miles de pedidos.
+        Returns:
+            Movimientos y metadatos insertados.
+        """
+        cargados = 0, 0
+        if not ordenes:
+            return cargados
+
+        async for session in get_async_session():
+            async with session:
+                tipo_soporte = await TipoSoporteQuery().get_by_nombre(session, 'Pedido')
+                if tipo_soporte is None:
+                    raise ValueError('No se encontró TipoSoporte con nombre Pedido')
+                metadatos = [
+                    MetadatoCarga(tipo_soporte.id, str(orden.number), 'tag', tag.strip())
+                    for orden in ordenes
+                    for tag in orden.tags
+                    if tag.strip()
+                ]
+                metadatos.extend(
+                    MetadatoCarga(tipo_soporte.id, str(orden.number), 'app', orden.app.name)
+                    for orden in ordenes
+                    if orden.app and orden.app.name
+                )
+                movimientos = await self.preparar_movimientos_ordenes(session, ordenes)
+                cargados = await MovimientoQuery().cargar_copy(session, movimientos, metadatos)
+        return cargados
+
+    async def escribir_movimientos_ordenes(self, orders: list[Order], batch_size: int = 5, copy: bool = False):
+        """Crea los metadatos y movimientos de los pedidos, en lotes de batch_size o con una carga COPY."""
+        if copy:
+            return await self.cargar_movimientos_ordenes(orders)
+        for i in range(0, len(orders), batch_size):
+            batch = orders[i : i + batch_size]
+            unique_tags = {tag.strip() for orden in batch for tag in orden.tags if tag.strip()}
+            unique_apps = {
+                orden.app.name.strip() for orden in batch if orden.app and orden.app.name and orden.app.name.strip()
+            }
+            async for session in get_async_session():
+                async with session:
+                    for tag in unique_tags:
+                        await self.crear_meta_atributo(session, 'tag')
+                        await self.crear_meta_valor(session, tag)
+
+                    for app in unique_apps:
+                        await self.crear_meta_atributo(session, 'app')
+                        await self.crear_meta_valor(session, app)
+            await gather(*[self.crear_metadatos_orden(orden) for orden in batch])
+            await self.crear_movimientos_ordenes(batch)
 
     async def sincronizar_movimientos_ordenes_by_range(
-        self, start: date, end: date, step_days: int = 5, batch_size: int = 5
-    ):
+        self, start: date, end: date, step_days: int = 5, batch_size: int = 5, copy: bool = False
+    ) -> dict[str, dict]:
+        """Sincroniza los movimientos de los pedidos del rango por ventanas de step_days días, en un pipeline de
+        tres etapas: pedidos de la ventana, line items y escritura en la base de datos. La consulta a Shopify de
+        una ventana se solapa con la escritura de la anterior; la concurrencia y las colas entre etapas se
+        configuran con Config.shopify_sync_*.
+        :param copy: Escribe cada ventana con COPY (cargar_movimientos_ordenes) en lugar de lotes de batch_size
+        pedidos, para backfills históricos.
+        Returns:
+            Métricas del pipeline por etapa.
+        """
         # Se sincroniza el inventario antes de los movimientos para evitar crear elementos duplicados por operaciones concurrentes.
         await self.sicnronizar_inventario()
         shopify_client = ShopifyGraphQLClient()
-        # Realizar sincronización por rangos de fechas de acuerdo a step_days
+
+        ventanas = []
         current_start = start
         while current_start <= end:
-            range_end = current_start + timedelta(days=step_days - 1)
-            orders = await shopify_client.get_orders_by_range(current_start, min(range_end, end))
-            for i in range(0, len(orders), batch_size):
-                batch = orders[i : i + batch_size]
-                unique_tags = {tag.strip() for orden in batch for tag in orden.tags if tag.strip()}
-                unique_apps = {
-                    orden.app.name.strip() for orden in batch if orden.app and orden.app.name and orden.app.name.strip()
-                }
-                async for session in get_async_session():
-                    async with session:
-                        for tag in unique_tags:
-                            await self.crear_meta_atributo(session, 'tag')
-                            await self.crear_meta_valor(session, tag)
-
-                        for app in unique_apps:
-                            await self.crear_meta_atributo(session, 'app')
-                            await self.crear_meta_valor(session, app)
-                await gather(*[self.crear_metadatos_orden(orden) for orden in batch])
-                await gather(*[self.crear_movimientos_orden(orden) for orden in batch])
-
-            log_shopify.info(msg=f'movimientos sincronizados desde {current_start} hasta {min(range_end, end)}')
+            range_end = min(current_start + timedelta(days=step_days - 1), end)
+            ventanas.append((current_start, range_end))
             current_start = range_end + timedelta(days=1)
 
+        async def obtener_pedidos(ventana: tuple[date, date]):
+            orders = await shopify_client.get_orders_by_range(*ventana, line_items=False)
+            return ventana, orders
+
+        async def obtener_line_items(entrada: tuple[tuple[date, date], list[Order]]):
+            await shopify_client.get_orders_line_items(entrada[1])
+            return entrada
+
+        async def escribir(entrada: tuple[tuple[date, date], list[Order]]):
+            (desde, hasta), orders = entrada
+            await self.escribir_movimientos_ordenes(orders, batch_size, copy)
+            log_shopify.info(msg=f'movimientos sincronizados desde {desde} hasta {hasta}, {len(orders)} pedidos')
+
+        metrics = await ejecutar_pipeline(
+            ventanas,
+            [
+                Etapa('pedidos', obtener_pedidos, Config.shopify_sync_ventanas, Config.shopify_sync_cola),
+                Etapa('line_items', obtener_line_items, Config.shopify_sync_line_items, Config.shopify_sync_cola),
+                Etapa('escritura', escribir, Config.shopify_sync_escrituras, Config.shopify_sync_cola),
+            ],
+        )
+        log_shopify.info(msg=f'Sincronización de movimientos desde {start} hasta {end}: {metrics}')
+        return metrics
+
+    async def sincronizar_movimientos_ordenes_incremental(self, batch_size: int = 50, copy: bool = False) -> int:
+        """Registra los movimientos de los pedidos pagados nuevos desde la última sincronización, el costo depende
+        de la actividad nueva y no de un rango de fechas. Se consultan los pedidos pagados con updatedAt posterior
+        a la marca, así también se incluyen los pedidos creados antes que se pagaron después. La marca (updatedAt
+        del último pedido procesado) avanza después de escribir cada lote de batch_size pedidos, una ejecución
+        interrumpida continúa desde el último lote escrito. Sin marca se parte de la fecha del último movimiento de
+        pedido.
+        Solo agrega movimientos de pedidos (o líneas) que aún no los tienen: los cambios de un pedido ya registrado
+        (cantidades editadas, cancelaciones, reembolsos) no se aplican y se deben ajustar con un movimiento manual.
+        No sincroniza el inventario completo, las variantes que no existen se crean al resolver los movimientos.
+        Returns:
+            Pedidos procesados.
+        """
+        shopify_client = ShopifyGraphQLClient()
+        marca_query = MarcaSincronizacionQuery()
+        desde = None
+        async for session in get_async_session():
+            async with session:
+                desde = await marca_query.get_marca(session, MARCA_PEDIDOS_SHOPIFY)
+                if desde is None:
+                    tipo_soporte = await TipoSoporteQuery().get_by_nombre(session, 'Pedido')
+                    if tipo_soporte is None:
+                        raise ValueError('No se encontró TipoSoporte con nombre Pedido')
+                    desde = await MovimientoQuery().get_ultima_fecha(session, tipo_soporte.id)
+        desde = desde or DateTz.local()
+
+        orders = await shopify_client.get_orders_updated_since(desde)
+        for i in range(0, len(orders), batch_size):
+            batch = orders[i : i + batch_size]
+            await shopify_client.get_orders_line_items(batch)
+            await self.escribir_movimientos_ordenes(batch, copy=copy)
+            marca = max((orden.updatedAt for orden in batch if orden.updatedAt), default=None)
+            if marca is None:
+                continue
+            async for session in get_async_session():
+                async with session:
+                    await marca_query.avanzar(session, MARCA_PEDIDOS_SHOPIFY, marca)
+        log_shopify.info(msg=f'Sincronización incremental de movimientos desde {desde}: {len(orders)} pedidos')
+        return len(orders)
+
     async def crear_metadata_orders_by_range(self, start: date, end: date, step_days: int = 5, batch_size: int = 20):
         shopify_client = ShopifyGraphQLClient()
         # Realizar sincronización por rangos de fechas de acuerdo a step_days
@@ -1066,13 +1632,97 @@ class ShopifyInventario:
 
 
 if __name__ == '__main__':
-    pass
     from asyncio import run
-    # from time import time
+    from time import perf_counter
+
+    async def benchmark_get_products():
+        """Compara la obtención del catálogo por consultas N+1 contra la operación bulk."""
+        client = ShopifyGraphQLClient()
+        start = perf_counter()
+        products = await client.get_products()
+        print(f'get_products: {len(products)} productos, {perf_counter() - start:.2f}s')
+        start = perf_counter()
+        products_bulk = await client.get_products_bulk()
+        print(f'get_products_bulk: {len(products_bulk)} productos, {perf_counter() - start:.2f}s')
+
+    async def check_parse_bulk_products():
+        async def fixture():
+            lines = [
+                {'id': 'gid://shopify/Product/1', 'legacyResourceId': '1', 'title': 'Vela'},
+                {
+                    'id': 'gid://shopify/ProductVariant/11',
+                    'legacyResourceId': '11',
+                    'title': 'Coco',
+                    'price': '25000.00',
+                    'sku': 'VEL-COCO',
+                    'inventoryQuantity': 3,
+                    'inventoryItem': {'legacyResourceId': '111', 'sku': 'VEL-COCO'},
+                    '__parentId': 'gid://shopify/Product/1',
+                },
+                {
+                    'id': 'gid://shopify/InventoryLevel/1111?inventory_item_id=111',
+                    'quantities': [{'quantity': 3}],
+                    'location': {'legacyResourceId': '109793607972', 'address': {'formatted': ['Bogotá']}},
+                    '__parentId': 'gid://shopify/ProductVariant/11',
+                },
+            ]
+            for line in lines:
+                yield line
+
+        products = await parse_bulk_products(fixture())
+        variant = products[0].variants[0]
+        assert variant.product.legacyResourceId == 1 and variant.price == 25000
+        assert variant.inventoryItem.inventoryLevels.nodes[0].location.legacyResourceId == 109793607972
+        assert variant.inventoryItem.inventoryLevels.nodes[0].item.variant.legacyResourceId == 11
+
+    async def check_execute_query_concurrente(n: int = 20):
+        """Queries simultáneas sobre el cliente singleton: cada una debe enviar su propio payload."""
+        from asyncio import sleep as asleep
+
+        client = ShopifyGraphQLClient()
+
+        async def request(method, headers, url, payload):
+            await asleep(0.01)
+            return {'data': {'variables': payload['variables']}}
+
+        client.request = request  # type: ignore
+        responses = await gather(*[client._execute_query('query Check { shop { id } }', {'id': i}) for i in range(n)])
+        assert [response['data']['variables']['id'] for response in responses] == list(range(n))
+
+    async def check_bulk_operation_run_query():
+        """bulk_operation_run_query envía la query bulk como variable $query de la mutación."""
+        client = ShopifyGraphQLClient()
+        payloads = []
+
+        async def request(method, headers, url, payload):
+            payloads.append(payload)
+            bulk_operation = {'id': 'gid://shopify/BulkOperation/1', 'status': 'CREATED'}
+            return {'data': {'bulkOperationRunQuery': {'bulkOperation': bulk_operation, 'userErrors': []}}}
+
+        client.request = request  # type: ignore
+        bulk_operation_id = await client.bulk_operation_run_query('{ products { edges { node { id } } } }')
+        assert bulk_operation_id == 'gid://shopify/BulkOperation/1'
+        assert payloads[0]['variables'] == {'query': '{ products { edges { node { id } } } }'}
+
+    async def benchmark_get_all():
+        """Paginación de _get_all abriendo una conexión por página (sin keep-alive) contra el pool."""
+        client = ShopifyGraphQLClient()
+        for http_config in (HttpClientConfig(max_keepalive_connections=0), HttpClientConfig()):
+            client.http_config = http_config
+            await HttpClientPool.close()
+            start = perf_counter()
+            await client._get_products_base()
+            print(f'keep-alive: {http_config.max_keepalive_connections > 0}, {perf_counter() - start:.2f}s')
 
     async def main():
         client = ShopifyGraphQLClient()
 
+        # await check_execute_query_concurrente()
+        # await check_bulk_operation_run_query()
+        # await benchmark_get_all()
+        # await check_parse_bulk_products()
+        # await benchmark_get_products()
+
         # orders = await client.get_orders_by_range(date(2025, 7, 1), date(2025, 7, 31), 40)
         # with open('shopify_orders.json', 'w', encoding='utf-8') as f:
         #     f.write(orders.model_dump_json(exclude_unset=True, indent=2))
@@ -422,10 +422,23 @@ async def facturar_orden_shopify_world_office(orden: Order, force=False):  # Bac
 
 if __name__ == '__main__':
     from asyncio import run
+    from time import perf_counter
+    from app.internal.integrations.base import HttpClientConfig, HttpClientPool
+
+    async def benchmark_reglones(order: Order):
+        """get_wo_reglones_from_order abriendo una conexión por renglón (sin keep-alive) contra el pool."""
+        wo_client = WoClient()
+        for http_config in (HttpClientConfig(timeout=60, max_keepalive_connections=0), HttpClientConfig(timeout=60)):
+            wo_client.http_config = http_config
+            await HttpClientPool.close()
+            start = perf_counter()
+            await get_wo_reglones_from_order(wo_client, order)
+            print(f'keep-alive: {http_config.max_keepalive_connections > 0}, {perf_counter() - start:.2f}s')
 
     async def main():
         shopify_client = ShopifyGraphQLClient()
         order = await shopify_client.get_order_by_number(33291)
+        # await benchmark_reglones(order)
         await facturar_orden_shopify_world_office(order)
 
     run(main())
@@ -9,6 +9,8 @@ if __name__ == '__main__':
 # from random import randint
 
 
+from dataclasses import dataclass
+
 from pydantic import ValidationError
 from app.internal.log import factory_logger
 from app.models.pydantic.world_office.base import Operador, TipoDatoWoFiltro, TipoFiltroWoFiltro, WOFiltro, WOListar
@@ -29,7 +31,10 @@ from app.models.pydantic.world_office.facturacion import (
 from app.models.pydantic.world_office.general import WOCiudad, WOListaCiudadesResponse
 from app.models.pydantic.world_office.invenvario import WOInventario, WOInventarioResponse
 from app.models.pydantic.world_office.terceros import WOTercero, WOTerceroResponse, WOTerceroCreateEdit
-from app.internal.integrations.base import BaseClient, ClientException
+from app.internal.integrations.base import BaseClient, ClientException, HttpClientConfig
+from app.internal.integrations.rate_limit import RateLimit
+from app.internal.cache_invalidacion import InvalidacionCache
+from app.internal.gen.cache import TTLCache
 from app.config import Config
 
 wo_log = factory_logger('world_office', file=True)
@@ -40,6 +45,17 @@ class WOException(ClientException):
         super().__init__(*args, **kwargs)
 
 
+@dataclass(frozen=True)
+class CiudadNoEncontrada:
+    """Búsqueda de ciudad sin resultado en la caché. Se guarda en lugar de la excepción para lanzar una nueva en
+    cada consulta: relanzar la misma instancia acumula los tracebacks de todas las consultas."""
+
+    url: str
+    payload: dict
+    response: dict
+    msg: str
+
+
 class WoClient(BaseClient):
     __instance = None
 
@@ -73,37 +89,65 @@ class WoClient(BaseClient):
             inventario_por_codigo: str = f'{root}/consultaCodigo'
             listar_inventarios: str = f'{root}/listarInventarios'
 
+    # Cachés de consultas de catálogo, una facturación consulta el inventario de cada producto, hasta cuatro ciudades
+    # y el tercero. Se invalidan en todos los procesos con invalidar_cache (ej. al cambiar impuestos de un producto
+    # en World Office), ver app.internal.cache_invalidacion.
+    inventario_cache: TTLCache[str, WOInventario] = TTLCache.get_named('wo_inventario', ttl=Config.wo_cache_ttl)
+    # Incluye las búsquedas sin resultado, así una ciudad mal escrita no se consulta en cada pedido.
+    ciudades_cache: TTLCache[tuple[str, str], WOCiudad | CiudadNoEncontrada] = TTLCache.get_named(
+        'wo_ciudades', ttl=Config.wo_cache_ttl
+    )
+    terceros_cache: TTLCache[str, WOTercero] = TTLCache.get_named('wo_terceros', ttl=Config.wo_cache_ttl)
+
     # Singleton para implementar posteriormente la restricción de peticiones.
     def __new__(cls):
         if cls.__instance is None:
             cls.__instance = super().__new__(cls)
         return cls.__instance
 
+    # Se han obtenido varios timeouts usando 30 segundos. se cambia a 60 segundos.
     def __init__(self, host: str = f'https://api.worldoffice.cloud/api/{Config.wo_api_version}'):
-        super().__init__(min_interval=1)
+        super().__init__(
+            rate_limit=RateLimit(rate=Config.wo_rate_limit, capacity=Config.wo_rate_burst),
+            http_config=HttpClientConfig(timeout=60, max_connections=10),
+            shared_rate_limit=True,
+        )
         self.host = host
         self.headers = {
             'Content-Type': 'application/json',
             'Authorization': f'WO {Config.wo_api_key}',
         }
 
-    # Se han obtenido varios timeouts usando 30 segundos. se cambia a 60 segundos.
-    async def request(
-        self,
-        method: str,
-        headers: dict,
-        url: str,
-        params: list[str] | None = None,
-        query_params: dict | None = None,
-        payload: dict | None = None,
-        timeout: int = 60,
-        cookies: dict | None = None,
-    ):
-        return await super().request(
-            method, headers, url, params, query_params, payload, timeout=timeout, cookies=cookies
-        )
+    @classmethod
+    def caches(cls) -> dict[str, TTLCache]:
+        return {'inventario': cls.inventario_cache, 'ciudades': cls.ciudades_cache, 'terceros': cls.terceros_cache}
+
+    @classmethod
+    def vaciar_cache(cls, nombre: str | None = None):
+        """Vacía la caché `nombre` (inventario, ciudades, terceros) o todas, solo en este proceso."""
+        for key, cache in cls.caches().items():
+            if nombre is None or key == nombre:
+                cache.clear()
+
+    @classmethod
+    async def invalidar_cache(cls, nombre: str | None = None):
+        """Vacía la caché `nombre` (inventario, ciudades, terceros) o todas, en todos los procesos."""
+        if nombre is not None and nombre not in cls.caches():
+            raise ValueError(f'Caché desconocida: {nombre}, opciones: {", ".join(cls.caches())}')
+        await InvalidacionCache.notificar('world_office', nombre)
+
+    @classmethod
+    def invalidar_tercero_local(cls, identificacion: str | None):
+        if identificacion is None:
+            cls.terceros_cache.clear()
+        else:
+            cls.terceros_cache.invalidate(identificacion)
 
     async def get_tercero(self, identificacion: str) -> WOTercero | None:
+        tercero = self.terceros_cache.get(identificacion)
+        if tercero is not None:
+            return tercero.model_copy(deep=True)
+
         url = f'{self.host}{self.Paths.Terceros.identificacion}'
         tercero_json = await self.request('GET', self.headers, url, params=[identificacion])
 
@@ -125,6 +169,8 @@ class WoClient(BaseClient):
             wo_log.error(str(exception))
             raise exception
 
+        # Solo se conservan los terceros existentes, uno inexistente se crea a continuación.
+        self.terceros_cache.set(identificacion, tercero_response.data.model_copy(deep=True))
         return tercero_response.data
 
     async def get_documento_venta(self, id_documento: int) -> WODocumentoVentaDetail:
@@ -149,6 +195,10 @@ class WoClient(BaseClient):
         return documento_venta_response.data
 
     async def get_inventario_por_codigo(self, codigo: str) -> WOInventario:
+        inventario = self.inventario_cache.get(codigo)
+        if inventario is not None:
+            return inventario.model_copy(deep=True)
+
         url = f'{self.host}{self.Paths.Inventario.inventario_por_codigo}'
         inventario_json = await self.request('GET', self.headers, url, params=[codigo])
 
@@ -167,6 +217,7 @@ class WoClient(BaseClient):
             wo_log.error(str(exception))
             raise exception
 
+        self.inventario_cache.set(codigo, inventario_response.data.model_copy(deep=True))
         return inventario_response.data
 
     async def get_list_inventario_por_codigo(self, codigo: str) -> WODataListInventarios:
@@ -260,6 +311,7 @@ class WoClient(BaseClient):
             exception = WOException(url=url, payload=payload, response=tercero_json, msg=msg)
             wo_log.error(str(exception))
             raise exception
+        await InvalidacionCache.notificar('wo_terceros', wo_tercero_create.identificacion)
         return tercero_response.data
 
     async def editar_tercero(self, wo_tercero_edit: WOTerceroCreateEdit) -> WOTercero:
@@ -292,6 +344,7 @@ class WoClient(BaseClient):
             wo_log.error(str(exception))
             raise exception
 
+        await InvalidacionCache.notificar('wo_terceros', wo_tercero_edit.identificacion)
         return tercero_response.data
 
     async def buscar_ciudad(
@@ -315,6 +368,13 @@ class WoClient(BaseClient):
             exception = WOException(msg='No se proporcionó nombre, departamento o código para buscar ciudad')
             raise exception
 
+        key = (atributo, valor.strip().lower())
+        ciudad = self.ciudades_cache.get(key)
+        if isinstance(ciudad, CiudadNoEncontrada):
+            raise WOException(url=ciudad.url, payload=ciudad.payload, response=ciudad.response, msg=ciudad.msg)
+        if ciudad is not None:
+            return ciudad.model_copy(deep=True)
+
         filtro = WOFiltro(
             atributo=atributo,
             valor=valor,
@@ -349,10 +409,12 @@ class WoClient(BaseClient):
                 msg += f', nombre: {nombre}'
             if departamento:
                 msg += f', departamento: {departamento}'
-            exception = WOException(url=url, payload=payload, response=ciudades_json, msg=msg)
-            raise exception
+            self.ciudades_cache.set(key, CiudadNoEncontrada(url=url, payload=payload, response=ciudades_json, msg=msg))
+            raise WOException(url=url, payload=payload, response=ciudades_json, msg=msg)
 
-        return ciudades_response.data.content[0]
+        ciudad = ciudades_response.data.content[0]
+        self.ciudades_cache.set(key, ciudad.model_copy(deep=True))
+        return ciudad
 
     async def documento_venta_por_concepto(self, concepto: str, codigo_documento: str = 'FV') -> WODocumentoFactura:
         # Filtro1 Obligatorio de acuerdo a la documentación de World Office
@@ -479,6 +541,10 @@ class WoClient(BaseClient):
         return factura_response.data
 
 
+InvalidacionCache.handler('world_office')(WoClient.vaciar_cache)
+InvalidacionCache.handler('wo_terceros')(WoClient.invalidar_tercero_local)
+
+
 if __name__ == '__main__':
     from asyncio import run
     # from random import randint
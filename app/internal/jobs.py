@@ -0,0 +1,152 @@
+# app/internal/jobs.py
+"""
+Worker de la cola de trabajos persistida (app.models.db.jobs).
+Cada proceso de uvicorn ejecuta un worker con máximo `Config.jobs_concurrencia` trabajos simultáneos, así el
+throughput total (ej. facturación en World Office) se controla con la concurrencia y el número de workers.
+Los trabajos se registran por tipo con `JobWorker.handler`; un trabajo que lanza una excepción se reintenta con
+backoff exponencial hasta agotar sus intentos.
+"""
+
+from asyncio import FIRST_COMPLETED, CancelledError, Task, create_task, sleep, wait
+from typing import Awaitable, Callable
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.config import Config
+from app.internal.log import factory_logger
+from app.internal.query.jobs import JobQuery
+from app.models.db.jobs import Job
+from app.models.db.session import AsyncSessionLocal
+
+log_jobs = factory_logger('jobs', file=True)
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+# Tipos de trabajo, compartidos por los routers que encolan y los que registran los handlers.
+JOB_PEDIDO_SHOPIFY = 'pedido_shopify'
+JOB_FACTURAR_PEDIDO = 'facturar_pedido'
+JOB_PARTICIONES_MOVIMIENTOS = 'particiones_movimientos'
+JOB_SYNC_PEDIDOS_SHOPIFY = 'sync_pedidos_shopify'
+
+
+class JobWorker:
+    __handlers: dict[str, JobHandler] = {}
+
+    def __init__(
+        self,
+        concurrencia: int = Config.jobs_concurrencia,
+        poll_interval: float = Config.jobs_poll_interval,
+        lease: float = Config.jobs_lease,
+        backoff: float = Config.jobs_backoff,
+    ):
+        self.concurrencia = concurrencia
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.backoff = backoff
+        self.job_query = JobQuery()
+        self._task: Task | None = None
+        self._en_proceso: set[Task] = set()
+
+    @classmethod
+    def handler(cls, tipo: str) -> Callable[[JobHandler], JobHandler]:
+        """Registra la función que ejecuta los trabajos de `tipo`, recibe el payload del trabajo."""
+
+        def decorator(func: JobHandler) -> JobHandler:
+            cls.__handlers[tipo] = func
+            return func
+
+        return decorator
+
+    def start(self):
+        if self._task is None and self.__handlers:
+            self._task = create_task(self._run())
+
+    async def stop(self):
+        """Detiene el worker. Los trabajos interrumpidos quedan en proceso y se retoman al vencer su lease."""
+        tasks = [task for task in (self._task, *self._en_proceso) if task is not None]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await wait(tasks)
+        self._task = None
+
+    def metrics(self) -> dict:
+        return {'concurrencia': self.concurrencia, 'en_proceso': len(self._en_proceso)}
+
+    async def _run(self):
+        while True:
+            libres = self.concurrencia - len(self._en_proceso)
+            if libres <= 0:
+                await wait(self._en_proceso, return_when=FIRST_COMPLETED)
+                continue
+
+            try:
+                async with AsyncSessionLocal() as session:
+                    jobs = await self.job_query.reclamar(session, list(self.__handlers), libres, self.lease)
+            except CancelledError:
+                raise
+            except Exception as e:
+                log_jobs.error(f'Error al obtener trabajos: {e}')
+                jobs = []
+
+            for job in jobs:
+                task = create_task(self._ejecutar(job))
+                self._en_proceso.add(task)
+                task.add_done_callback(self._en_proceso.discard)
+
+            if not jobs:
+                await sleep(self.poll_interval)
+
+    async def _renovar_lease(self, job: Job):
+        """Renueva el lease cada tercio de su duración mientras el handler se ejecuta, así un trabajo largo (ej. una
+        factura lenta en World Office) no vence y otro worker no lo ejecuta de nuevo en paralelo."""
+        while True:
+            await sleep(self.lease / 3)
+            try:
+                async with AsyncSessionLocal() as session:
+                    vigente = await self.job_query.renovar(session, job, self.lease)
+            except CancelledError:
+                raise
+            except Exception as e:
+                log_jobs.error(f'Job {job.id} {job.tipo}:{job.llave}: no fue posible renovar el lease: {e}')
+                continue
+            if not vigente:
+                log_jobs.warning(f'Job {job.id} {job.tipo}:{job.llave}: el lease venció y el trabajo fue retomado')
+                return
+
+    async def _ejecutar(self, job: Job):
+        handler = self.__handlers[job.tipo]
+        if job.intentos > job.max_intentos:
+            # Retomado tras vencer el lease (ej. el worker se detuvo) con los intentos agotados.
+            async with AsyncSessionLocal() as session:
+                vigente = await self.job_query.fallar(session, job, 'Intentos agotados', self.backoff)
+            if not vigente:
+                log_jobs.warning(f'Job {job.id} {job.tipo}:{job.llave}: el lease venció y el trabajo fue retomado')
+            return
+        heartbeat = create_task(self._renovar_lease(job))
+        try:
+            await handler(job.payload)
+        except CancelledError:
+            raise
+        except Exception as e:
+            log_jobs.error(f'Job {job.id} {job.tipo}:{job.llave} intento {job.intentos}/{job.max_intentos}: {e}')
+            async with AsyncSessionLocal() as session:
+                vigente = await self.job_query.fallar(session, job, f'{type(e).__name__}: {e}', self.backoff)
+            if not vigente:
+                log_jobs.warning(f'Job {job.id} {job.tipo}:{job.llave}: el lease venció, el fallo no se registró')
+            return
+        finally:
+            heartbeat.cancel()
+        async with AsyncSessionLocal() as session:
+            vigente = await self.job_query.completar(session, job)
+        if not vigente:
+            log_jobs.warning(f'Job {job.id} {job.tipo}:{job.llave}: el lease venció, otro worker retomó el trabajo')
+            return
+        log_jobs.info(f'Job {job.id} {job.tipo}:{job.llave} completado')
+
+
+job_worker = JobWorker()
@@ -0,0 +1,78 @@
+# app/internal/password.py
+"""
+Hash y verificación de contraseñas con argon2 fuera del event loop.
+argon2 es costoso en CPU y memoria a propósito; ejecutado dentro de un handler async bloquea el worker completo
+(incluidos los webhooks de Shopify) mientras dura. Las operaciones se envían a un pool de hilos acotado, argon2-cffi
+libera el GIL durante el cálculo, y un semáforo limita cuántas se ejecutan a la vez por proceso: las peticiones
+en exceso esperan en el event loop sin ocupar hilos ni memoria de argon2.
+"""
+
+from asyncio import Semaphore, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.config import Config
+
+password_hasher = PasswordHasher(
+    time_cost=Config.argon2_time_cost,
+    memory_cost=Config.argon2_memory_cost,
+    parallelism=Config.argon2_parallelism,
+)
+
+_executor = ThreadPoolExecutor(max_workers=Config.password_max_concurrencia, thread_name_prefix='argon2')
+_semaphore = Semaphore(Config.password_max_concurrencia)
+
+
+async def _run(func, *args):
+    async with _semaphore:
+        return await get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(password_hasher.hash, password)
+
+
+async def verify_password(hashed_password: str, plain_password: str) -> bool:
+    """Retorna False si la contraseña no coincide. Un hash inválido lanza InvalidHashError."""
+    try:
+        return await _run(password_hasher.verify, hashed_password, plain_password)
+    except VerifyMismatchError:
+        return False
+
+
+if __name__ == '__main__':
+    from asyncio import gather, run, sleep
+    from time import perf_counter
+
+    # Prueba de carga: latencia del event loop (ej. un webhook) durante una ráfaga de logins.
+    # Con argon2 en el event loop la latencia máxima crece con el número de logins, aquí debe mantenerse
+    # en el orden de milisegundos.
+    async def medir_latencia(duracion: float) -> list[float]:
+        latencias = []
+        fin = perf_counter() + duracion
+        while perf_counter() < fin:
+            inicio = perf_counter()
+            await sleep(0.01)
+            latencias.append(perf_counter() - inicio - 0.01)
+        return latencias
+
+    async def main():
+        hashed = await hash_password('Password1!')
+        inicio = perf_counter()
+        latencias, *resultados = await gather(
+            medir_latencia(2), *[verify_password(hashed, 'Password1!') for _ in range(50)]
+        )
+        assert all(resultados)
+        assert not await verify_password(hashed, 'otra')
+        print(f'50 verificaciones en {perf_counter() - inicio:.2f}s')
+        print(f'Latencia del event loop: max {max(latencias) * 1000:.1f}ms')
+
+    run(main())
@@ -1,10 +1,17 @@
 # app/internal/query/base.py
-from datetime import date
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from json import dumps, loads
 from enum import Enum
+from numpy import array, ndarray
 from pydantic import BaseModel
+from sqlalchemy import ColumnElement, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import noload
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import SQLModel, select
-from typing import Generic, TypeVar
+from typing import AsyncIterator, Generic, Sequence, TypeVar
 
 from app.internal.log import factory_logger
 
@@ -14,42 +21,219 @@ ModelCreate = TypeVar('ModelCreate', bound=SQLModel)
 
 log_base_query = factory_logger('base_query', file=True)
 
+# Límite de parámetros por sentencia del protocolo de PostgreSQL.
+MAX_PARAMS_STATEMENT = 65535
+
+
+# Llave en session.info que indica que la sesión está dentro de una unidad de trabajo.
+UNIT_OF_WORK = 'unit_of_work'
+# Llave en session.info con las funciones a ejecutar después del commit de la unidad de trabajo.
+AFTER_COMMIT = 'after_commit'
+
+
+@asynccontextmanager
+async def unit_of_work(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """Agrupa las operaciones de BaseQuery en una sola transacción.
+    Dentro del bloque los métodos de escritura solo hacen flush (los IDs generados quedan disponibles),
+    al salir se hace un único commit y si ocurre una excepción se revierte todo.
+    Un bloque anidado sobre la misma sesión se une a la unidad de trabajo existente.
+
+    Ejemplo:
+        async with unit_of_work(session):
+            await query.create(session, obj)
+            await query.update(session, other_obj, pk)
+    """
+    if session.info.get(UNIT_OF_WORK):
+        yield session
+        return
+
+    session.info[UNIT_OF_WORK] = True
+    try:
+        yield session
+        await session.commit()
+        for callback in session.info.get(AFTER_COMMIT, []):
+            callback()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        session.info.pop(UNIT_OF_WORK, None)
+        session.info.pop(AFTER_COMMIT, None)
+
 
 class Sort(str, Enum):
     ASC = 'asc'
     DESC = 'desc'
 
 
+class Formato(str, Enum):
+    TUPLAS = 'tuplas'
+    NUMPY = 'numpy'  # Un arreglo por columna
+
+
 class DateRange(BaseModel):
     start_date: date
     end_date: date
 
 
+def encode_cursor(valores: list) -> str:
+    """Cursor opaco con los valores de la columna de orden y el id del último registro de la página."""
+    valores = [valor.isoformat() if isinstance(valor, date) else valor for valor in valores]
+    return urlsafe_b64encode(dumps(valores).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        valores = loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != 2:
+        raise ValueError('Cursor inválido')
+    return valores
+
+
 class BaseQuery(Generic[ModelDB, ModelCreate]):
     def __init__(self, model_db: type[ModelDB], model_create: type[ModelCreate]) -> None:
         self.model_db = model_db
         self.model_create = model_create
 
+    async def _commit(self, session: AsyncSession, *objs: SQLModel):
+        """Confirma los cambios, o solo hace flush si la sesión está en una unidad de trabajo."""
+        if session.info.get(UNIT_OF_WORK):
+            await session.flush()
+            # _after_commit se difiere hasta el commit de la unidad de trabajo.
+            session.info.setdefault(AFTER_COMMIT, []).append(self._after_commit)
+            return
+
+        await session.commit()
+        for obj in objs:
+            await session.refresh(obj)
+        self._after_commit()
+
+    def _after_commit(self):
+        """Se ejecuta cuando los cambios del query quedan confirmados en la base de datos."""
+        pass
+
+    def _relaciones(self, stmt, relaciones: bool):
+        """Sin relaciones no se ejecutan los joins ni los selectin de las relaciones con carga ansiosa,
+        los atributos de relación quedan vacíos."""
+        return stmt if relaciones else stmt.options(noload('*'))
+
+    async def get_columnas(
+        self,
+        session: AsyncSession,
+        columnas: list[str],
+        *condiciones: ColumnElement[bool],
+        order_by: list[ColumnElement] | None = None,
+        limit: int | None = None,
+        formato: Formato = Formato.TUPLAS,
+    ) -> list[tuple] | dict[str, ndarray]:
+        """Proyección de solo las columnas solicitadas, sin instanciar modelos ni cargar relaciones.
+        Pensado para reportes que solo requieren algunas columnas de muchos registros.
+
+        Ejemplo:
+            await MovimientoQuery().get_columnas(
+                session, ['fecha', 'cantidad'], Movimiento.variante_id == 1, formato=Formato.NUMPY
+            )
+        """
+        table = self.model_db.__table__  # type: ignore
+        stmt = select(*[table.c[columna] for columna in columnas]).where(*condiciones)
+        if order_by is not None:
+            stmt = stmt.order_by(*order_by)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+
+        result = await session.execute(stmt)
+        rows = [tuple(row) for row in result.all()]
+        if formato == Formato.NUMPY:
+            valores = list(zip(*rows)) if rows else [() for _ in columnas]
+            return {columna: array(valores[i]) for i, columna in enumerate(columnas)}
+        return rows
+
+    async def get_pagina(
+        self,
+        session: AsyncSession,
+        after: str | None = None,
+        limit: int = 100,
+        sort: Sort = Sort.DESC,
+        orden: str = 'id',
+        filtros: dict | None = None,
+        campos: list[str] | None = None,
+    ) -> tuple[list[dict], str | None]:
+        """Paginación por llave (keyset): la página siguiente se filtra por (orden, id) del último registro en lugar
+        de usar OFFSET, el costo de una página profunda es el mismo de la primera.
+
+        Args:
+            after: Cursor retornado por la página anterior.
+            orden: Columna de ordenamiento, 'id' o una columna como 'fecha' (se desempata por id).
+            filtros: Igualdad por columna.
+            campos: Columnas a retornar, por defecto todas.
+        Returns:
+            Registros de la página y el cursor de la siguiente, None si es la última.
+        """
+        table = self.model_db.__table__  # type: ignore
+        for columna in [orden, *(filtros or {}), *(campos or [])]:
+            if columna not in table.c:
+                raise ValueError(f'{self.model_db.__name__} no tiene la columna {columna}')
+
+        columna_orden = table.c[orden]
+        columna_id = table.c.id
+        stmt = select(*[table.c[campo] for campo in campos] if campos else table.c)
+        stmt = stmt.where(*[table.c[columna] == valor for columna, valor in (filtros or {}).items()])
+
+        if after:
+            valor_orden, valor_id = decode_cursor(after)
+            try:
+                tipo = columna_orden.type.python_type
+            except NotImplementedError:
+                tipo = None
+            if tipo in (date, datetime) and isinstance(valor_orden, str):
+                valor_orden = tipo.fromisoformat(valor_orden)
+            llave = tuple_(columna_orden, columna_id)
+            cursor = tuple_(valor_orden, valor_id, types=[columna_orden.type, columna_id.type])
+            stmt = stmt.where(llave > cursor if sort == Sort.ASC else llave < cursor)
+
+        if sort == Sort.ASC:
+            stmt = stmt.order_by(columna_orden.asc(), columna_id.asc())
+        else:
+            stmt = stmt.order_by(columna_orden.desc(), columna_id.desc())
+        # Se obtiene un registro extra para saber si existe una página siguiente. Las columnas de orden se
+        # agregan aunque no se soliciten para construir el cursor.
+        stmt = stmt.add_columns(columna_orden.label('_orden'), columna_id.label('_id')).limit(limit + 1)
+
+        result = await session.execute(stmt)
+        rows = [dict(row) for row in result.mappings().all()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1]['_orden'], rows[-1]['_id']])
+        for row in rows:
+            row.pop('_orden')
+            row.pop('_id')
+        return rows, next_cursor
+
     async def get(self, session: AsyncSession, id: int | str) -> ModelDB | None:
         """Obtiene un objeto por su ID"""
         result = await session.get(self.model_db, id)
         return result
 
     async def get_list(
-        self, session: AsyncSession, skip: int = 0, limit: int = 100, sort: Sort = Sort.DESC
+        self, session: AsyncSession, skip: int = 0, limit: int = 100, sort: Sort = Sort.DESC, relaciones: bool = True
     ) -> list[ModelDB]:
         """Obtiene una lista de objetos de forma asíncrona."""
         order_id = self.model_db.id.asc() if sort == 'asc' else self.model_db.id.desc()  # type: ignore
         stmt = select(self.model_db).offset(skip).limit(limit).order_by(order_id)
+        stmt = self._relaciones(stmt, relaciones)
         result = await session.execute(stmt)
         return list(result.scalars().all()) or []
 
     async def get_list_by_ids(
-        self, session: AsyncSession, ids: list[int], sort: Sort = Sort.DESC
+        self, session: AsyncSession, ids: list[int], sort: Sort = Sort.DESC, relaciones: bool = True
     ) -> list[ModelDB]:
         """Obtiene una lista de objetos de forma asíncrona."""
         order_id = self.model_db.id.asc() if sort == 'asc' else self.model_db.id.desc()  # type: ignore
         stmt = select(self.model_db).where(self.model_db.id.in_(ids)).order_by(order_id)  # type: ignore
+        stmt = self._relaciones(stmt, relaciones)
         result = await session.execute(stmt)
         return list(result.scalars().all()) or []
 
@@ -60,8 +244,7 @@ class BaseQuery(Generic[ModelDB, ModelCreate]):
         )  # Se garantiza que el objeto sea del tipo correcto
         db_model = self.model_db(**create_model.model_dump(mode='json'))  # Modelo de retorno
         session.add(db_model)
-        await session.commit()
-        await session.refresh(db_model)  # Refresca para obtener el ID generado por la BD
+        await self._commit(session, db_model)  # El flush o el refresh asignan el ID generado por la BD
         return db_model
 
     async def bulk_insert(self, session: AsyncSession, objs: list[ModelDB]):
@@ -71,7 +254,60 @@ class BaseQuery(Generic[ModelDB, ModelCreate]):
         objs_in_data = [obj.model_dump() for obj in objs]
         base_objs = [self.model_db(**obj_in_data) for obj_in_data in objs_in_data]
         session.add_all(base_objs)
-        await session.commit()
+        await self._commit(session)
+
+    async def bulk_upsert(
+        self,
+        session: AsyncSession,
+        objs: Sequence[SQLModel],
+        conflict_cols: list[str],
+        update_cols: list[str] | None = None,
+    ) -> list[ModelDB]:
+        """Inserta o actualiza varios objetos con INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+        Los objetos se envían en lotes de acuerdo al límite de parámetros por sentencia.
+
+        Args:
+            conflict_cols: Columnas con índice único que identifican el registro (ej. ['id'], ['shopify_id']).
+            update_cols: Columnas a actualizar si el registro existe, por defecto todas las enviadas en cada fila.
+                Con una lista vacía los registros existentes no se modifican pero igual se retornan.
+        """
+        if not objs:
+            return []
+
+        table = self.model_db.__table__  # type: ignore
+        primary_keys = {column.name for column in table.primary_key}
+        # Las llaves repetidas en una misma sentencia generan error en ON CONFLICT, prevalece la última.
+        rows_by_key: dict[tuple, dict] = {}
+        for obj in objs:
+            row = {
+                key: value
+                for key, value in obj.model_dump().items()
+                if key in table.columns and not (key in primary_keys and value is None)
+            }
+            rows_by_key[tuple(row.get(col) for col in conflict_cols)] = row
+        # Un INSERT de varias filas requiere las mismas columnas en todas, las filas se agrupan por sus columnas
+        # (ej. las que omiten la llave primaria None y las que la envían).
+        rows_by_columns: dict[tuple[str, ...], list[dict]] = {}
+        for row in rows_by_key.values():
+            rows_by_columns.setdefault(tuple(row), []).append(row)
+
+        result: list[ModelDB] = []
+        for columns, rows in rows_by_columns.items():
+            set_cols = update_cols
+            if set_cols is None:
+                set_cols = [col for col in columns if col not in conflict_cols and col not in primary_keys]
+
+            chunk_size = max(1, MAX_PARAMS_STATEMENT // len(columns))
+            for i in range(0, len(rows), chunk_size):
+                stmt = insert(self.model_db).values(rows[i : i + chunk_size])
+                # Sin columnas a actualizar se asigna la misma llave, así RETURNING también incluye los existentes.
+                set_ = {col: stmt.excluded[col] for col in set_cols or conflict_cols[:1]}
+                stmt = stmt.on_conflict_do_update(index_elements=conflict_cols, set_=set_).returning(self.model_db)
+                chunk_result = await session.scalars(stmt, execution_options={'populate_existing': True})
+                result.extend(chunk_result.all())
+
+        await self._commit(session)
+        return result
 
     async def safe_bulk_insert(self, session: AsyncSession, objs: list[ModelDB]):
         objs = [obj for obj in objs if getattr(obj, 'id', None)]
@@ -97,8 +333,7 @@ class BaseQuery(Generic[ModelDB, ModelCreate]):
         db_obj.sqlmodel_update(update_data)
 
         session.add(db_obj)  # Añade el objeto modificado a la sesión
-        await session.commit()
-        await session.refresh(db_obj)
+        await self._commit(session, db_obj)
         return db_obj
 
     async def upsert(self, session: AsyncSession, obj: ModelDB):
@@ -119,12 +354,13 @@ class BaseQuery(Generic[ModelDB, ModelCreate]):
 
     async def delete(self, session: AsyncSession, id: int | str) -> ModelDB | None:
         """Elimina un objeto de forma asíncrona."""
-        db_obj = await self.get(session, id)
+        # Se carga desde la sesión como en update: get puede retornar copias fuera de la sesión (BaseQueryCatalogo).
+        db_obj = await session.get(self.model_db, id)
         if not db_obj:
             return None
 
         await session.delete(db_obj)  # Marca para eliminación
-        await session.commit()  # Confirma la eliminación
+        await self._commit(session)  # Confirma la eliminación
         # El objeto db_usuario todavía contiene los datos antes de ser eliminado,
         # lo cual es útil si quieres devolverlo como confirmación.
         return self.model_db(**db_obj.model_dump(mode='json'))
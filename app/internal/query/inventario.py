@@ -1,8 +1,14 @@
 # app/internal/query/inventario.py
-from datetime import date, timedelta
+from asyncio import Lock
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+import re
 import json
 from os import path
-from sqlmodel import SQLModel, select, asc, desc, func, between, literal
+from time import monotonic
+from typing import AsyncIterator, NamedTuple
+from sqlalchemy import TIMESTAMP, and_, cast, column, delete, insert, table, text, union_all
+from sqlmodel import SQLModel, select, asc, desc, func, between, literal, literal_column
 
 
 if __name__ == '__main__':
@@ -33,11 +39,13 @@ from app.models.db.inventario import (
     MetaValorCreate,
     Movimiento,
     MovimientoCreate,
+    MovimientoDiario,
     MetadatosPorSoporte,
     MetadatosPorSoporteCreate,
     MovimientoRead,
     PreciosPorVariante,
     PreciosPorVarianteCreate,
+    Saldo,
     TipoMovimiento,
     TipoMovimientoCreate,
     TipoPrecio,
@@ -49,7 +57,10 @@ from app.models.db.inventario import (
     VarianteElemento,
     VarianteElementoCreate,
 )
+from app.config import Config
+from app.internal.gen.utilities import divide
 from app.internal.query.base import BaseQuery, ModelCreate, ModelDB, Sort
+from sqlalchemy.exc import MultipleResultsFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.db.session import get_async_session
 
@@ -84,6 +95,113 @@ class BaseQeuryNombre(BaseQuery[ModelDB, ModelCreate]):
         return result
 
 
+@dataclass
+class CatalogoCache:
+    """Registros de una tabla de referencia en memoria, indexados por id, nombre y shopify_id."""
+
+    rows: list = field(default_factory=list)
+    by_id: dict = field(default_factory=dict)
+    by_nombre: dict = field(default_factory=dict)
+    by_shopify_id: dict = field(default_factory=dict)
+    loaded: float | None = None
+    lock: Lock = field(default_factory=Lock)
+    hits: int = 0
+    cargas: int = 0
+
+    def invalidate(self):
+        self.loaded = None
+
+    def metrics(self) -> dict:
+        return {'registros': len(self.rows), 'hits': self.hits, 'cargas': self.cargas}
+
+
+class BaseQueryCatalogo(BaseQuery[ModelDB, ModelCreate]):
+    """Query para tablas de referencia pequeñas (tipos, estados, bodegas) que se consultan en cada movimiento.
+    La tabla completa se carga una vez por proceso y las búsquedas por id, nombre y shopify_id se resuelven
+    en memoria. La caché se invalida con las escrituras hechas por el query y expira cada
+    `Config.catalogo_cache_ttl` segundos para reflejar cambios hechos por otros procesos.
+    Los registros retornados están desligados de la sesión y son compartidos, no se deben modificar.
+    """
+
+    __caches: dict[type, CatalogoCache] = {}
+    min_recarga: float = 5
+
+    @property
+    def cache(self) -> CatalogoCache:
+        cache = self.__caches.get(self.model_db)
+        if cache is None:
+            cache = CatalogoCache()
+            self.__caches[self.model_db] = cache
+        return cache
+
+    @classmethod
+    def all_metrics(cls) -> dict[str, dict]:
+        return {model.__name__: cache.metrics() for model, cache in cls.__caches.items()}
+
+    def _after_commit(self):
+        self.cache.invalidate()
+
+    async def _get_cache(self, session: AsyncSession) -> CatalogoCache:
+        cache = self.cache
+        if cache.loaded is not None and monotonic() - cache.loaded < Config.catalogo_cache_ttl:
+            cache.hits += 1
+            return cache
+
+        async with cache.lock:
+            # Otra corrutina pudo cargar la caché mientras se esperaba el lock.
+            if cache.loaded is not None and monotonic() - cache.loaded < Config.catalogo_cache_ttl:
+                cache.hits += 1
+                return cache
+
+            result = await session.execute(select(self.model_db))
+            # Copias fuera de la sesión, así los registros se pueden usar desde cualquier sesión.
+            rows = [self.model_db(**row.model_dump()) for row in result.scalars().all()]
+            cache.rows = rows
+            cache.by_id = {row.id: row for row in rows}  # type: ignore
+            cache.by_nombre = {row.nombre.lower(): row for row in rows if getattr(row, 'nombre', None)}
+            cache.by_shopify_id = {row.shopify_id: row for row in rows if getattr(row, 'shopify_id', None)}
+            cache.loaded = monotonic()
+            cache.cargas += 1
+            return cache
+
+    async def _lookup(self, session: AsyncSession, index: str, key) -> ModelDB | None:
+        cache = await self._get_cache(session)
+        result = getattr(cache, index).get(key)
+        # El registro pudo ser creado por otro proceso, se recarga como máximo cada `min_recarga` segundos.
+        if result is None and cache.loaded is not None and monotonic() - cache.loaded > self.min_recarga:
+            cache.invalidate()
+            cache = await self._get_cache(session)
+            result = getattr(cache, index).get(key)
+        return result
+
+    async def get(self, session: AsyncSession, id: int | str) -> ModelDB | None:
+        return await self._lookup(session, 'by_id', id)
+
+    async def get_all(self, session: AsyncSession) -> list[ModelDB]:
+        cache = await self._get_cache(session)
+        return list(cache.rows)
+
+    async def get_by_nombre(self, session: AsyncSession, nombre: str) -> ModelDB | None:
+        """Misma semántica de BaseQeuryNombre.get_by_nombre: coincidencia exacta sin distinguir mayúsculas,
+        si no existe una única coincidencia parcial."""
+        cache = await self._get_cache(session)
+        nombre = nombre.lower()
+        result = cache.by_nombre.get(nombre)
+        if result is None:
+            matches = [row for key, row in cache.by_nombre.items() if nombre in key]
+            if len(matches) > 1:
+                raise MultipleResultsFound(f'{self.model_db.__name__}: más de un registro coincide con {nombre}')
+            result = matches[0] if matches else None
+        return result
+
+    async def get_by_shopify_id(self, session: AsyncSession, shopify_id: int) -> ModelDB | None:
+        return await self._lookup(session, 'by_shopify_id', shopify_id)
+
+    async def get_by_shopify_ids(self, session: AsyncSession, shopify_ids: list[int]) -> list[ModelDB]:
+        cache = await self._get_cache(session)
+        return [cache.by_shopify_id[id] for id in shopify_ids if id in cache.by_shopify_id]
+
+
 class PrecioPorVarianteQuery(BaseQuery[PreciosPorVariante, PreciosPorVarianteCreate]):
     def __init__(self) -> None:
         super().__init__(PreciosPorVariante, PreciosPorVarianteCreate)
@@ -124,10 +242,120 @@ class PrecioPorVarianteQuery(BaseQuery[PreciosPorVariante, PreciosPorVarianteCre
         return list(result.scalars().all()) or []  # type: ignore
 
 
+class MetadatoCarga(NamedTuple):
+    """Metadato de un soporte por nombre de atributo y valor, para MovimientoQuery.cargar_copy."""
+
+    tipo_soporte_id: int
+    soporte_id: str
+    atributo: str
+    valor: str
+
+
+# Columnas de movimientos y tipos de PostgreSQL del COPY binario, en el orden de las filas.
+COPY_MOVIMIENTOS = {
+    'tipo_movimiento_id': 'int4',
+    'tipo_soporte_id': 'int4',
+    'variante_id': 'int4',
+    'estado_variante_id': 'int4',
+    'cantidad': 'int4',
+    'valor': 'float8',
+    'bodega_id': 'int4',
+    'soporte_id': 'varchar',
+    'nota': 'text',
+    'fecha': 'timestamptz',
+}
+COPY_METADATOS = {'tipo_soporte_id': 'int4', 'soporte_id': 'varchar', 'atributo': 'text', 'valor': 'text'}
+
+
 class MovimientoQuery(BaseQuery[Movimiento, MovimientoCreate]):
     def __init__(self) -> None:
         super().__init__(Movimiento, MovimientoCreate)
 
+    async def cargar_copy(
+        self,
+        session: AsyncSession,
+        movimientos: list[MovimientoCreate],
+        metadatos: list[MetadatoCarga] | None = None,
+    ) -> tuple[int, int]:
+        """Carga masiva para backfills históricos: COPY binario a tablas temporales y una sentencia por tabla
+        destino, en una sola transacción. Los triggers de saldos y movimientos_diarios se ejecutan una vez por carga.
+        Omite los movimientos cuyo (tipo_soporte_id, soporte_id, variante_id) ya existe y los metadatos repetidos,
+        la carga de un rango se puede repetir. Los atributos y valores de metadatos que no existen se crean.
+        Returns:
+            Movimientos y metadatos insertados.
+        """
+        filas = []
+        llaves = set()
+        for movimiento in movimientos:
+            if movimiento.soporte_id is not None:
+                llave = (movimiento.tipo_soporte_id, movimiento.soporte_id, movimiento.variante_id)
+                if llave in llaves:
+                    continue
+                llaves.add(llave)
+            filas.append(tuple(getattr(movimiento, columna) for columna in COPY_MOVIMIENTOS))
+
+        # El COPY usa la conexión de psycopg de la sesión, queda en la misma transacción que las sentencias.
+        connection = await (await session.connection()).get_raw_connection()
+        driver_connection = connection.driver_connection
+        tablas = (('movimientos_carga', COPY_MOVIMIENTOS, filas), ('metadatos_carga', COPY_METADATOS, metadatos or []))
+        try:
+            for tabla, columnas, registros in tablas:
+                definicion = ', '.join(f'{columna} {tipo}' for columna, tipo in columnas.items())
+                await session.execute(text(f'CREATE TEMP TABLE {tabla} ({definicion}) ON COMMIT DROP'))
+                async with driver_connection.cursor() as cursor:  # type: ignore
+                    async with cursor.copy(f'COPY {tabla} FROM STDIN (FORMAT BINARY)') as copy:
+                        copy.set_types(list(columnas.values()))
+                        for registro in registros:
+                            await copy.write_row(registro)
+
+            # Los atributos y valores se guardan en minúsculas (InventarioLower).
+            await session.execute(
+                text(
+                    'INSERT INTO inventario.meta_atributos (nombre) '
+                    'SELECT DISTINCT lower(atributo) FROM metadatos_carga ON CONFLICT (nombre) DO NOTHING'
+                )
+            )
+            await session.execute(
+                text(
+                    'INSERT INTO inventario.meta_valores (valor) '
+                    'SELECT DISTINCT lower(valor) FROM metadatos_carga ON CONFLICT (valor) DO NOTHING'
+                )
+            )
+            result_metadatos = await session.execute(
+                text(
+                    """
+                    INSERT INTO inventario.metadatos_por_soporte
+                        (tipo_soporte_id, soporte_id, meta_atributo_id, meta_valor_id)
+                    SELECT DISTINCT c.tipo_soporte_id, c.soporte_id, a.id, v.id
+                    FROM metadatos_carga c
+                    JOIN inventario.meta_atributos a ON a.nombre = lower(c.atributo)
+                    JOIN inventario.meta_valores v ON v.valor = lower(c.valor)
+                    ON CONFLICT DO NOTHING
+                    """
+                )
+            )
+            # ux_movimientos_soporte_variante incluye fecha (partición), la existencia se valida sin ella.
+            result_movimientos = await session.execute(
+                text(
+                    f"""
+                    INSERT INTO inventario.movimientos ({', '.join(COPY_MOVIMIENTOS)})
+                    SELECT {', '.join(f'c.{columna}' for columna in COPY_MOVIMIENTOS)}
+                    FROM movimientos_carga c
+                    WHERE c.soporte_id IS NULL OR NOT EXISTS (
+                        SELECT 1 FROM inventario.movimientos m
+                        WHERE m.tipo_soporte_id = c.tipo_soporte_id AND m.soporte_id = c.soporte_id
+                            AND m.variante_id = c.variante_id
+                    )
+                    ON CONFLICT DO NOTHING
+                    """
+                )
+            )
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        return result_movimientos.rowcount, result_metadatos.rowcount  # type: ignore
+
     async def get_total_by(self, session: AsyncSession, variante_id: int, tipo_movimiento_id: int):
         statement = (
             select(func.sum(self.model_db.cantidad))
@@ -150,6 +378,33 @@ class MovimientoQuery(BaseQuery[Movimiento, MovimientoCreate]):
         result = await session.execute(statement)
         return result.scalar_one_or_none()
 
+    async def bloquear_soportes(self, session: AsyncSession, tipo_soporte_id: int, soporte_ids: list[str]):
+        """Toma un advisory lock de transacción por soporte: los procesos que registran movimientos del mismo
+        soporte (ej. el webhook de un pedido y la sincronización por rango) se ejecutan uno después del otro, y el
+        segundo ve los movimientos del primero. Los locks se toman en orden para evitar deadlocks entre lotes y se
+        liberan con el commit o rollback."""
+        for soporte_id in sorted(set(soporte_ids)):
+            await session.execute(
+                text('SELECT pg_advisory_xact_lock(:tipo_soporte_id, hashtext(:soporte_id))'),
+                {'tipo_soporte_id': tipo_soporte_id, 'soporte_id': soporte_id},
+            )
+
+    async def get_by_soportes(
+        self, session: AsyncSession, tipo_soporte_id: int, soporte_ids: list[str]
+    ) -> list[Movimiento]:
+        statement = (
+            select(self.model_db)
+            .where(self.model_db.tipo_soporte_id == tipo_soporte_id)
+            .where(self.model_db.soporte_id.in_(soporte_ids))  # type: ignore
+        )
+        result = await session.execute(statement)
+        return list(result.scalars().all())
+
+    async def get_ultima_fecha(self, session: AsyncSession, tipo_soporte_id: int) -> datetime | None:
+        statement = select(func.max(self.model_db.fecha)).where(self.model_db.tipo_soporte_id == tipo_soporte_id)
+        result = await session.execute(statement)
+        return result.scalar_one()
+
     async def get_by_soporte_id(self, session: AsyncSession, tipo_soporte_id: int, soporte_id: str) -> list[Movimiento]:
         statement = (
             select(self.model_db)
@@ -167,8 +422,9 @@ class MovimientoQuery(BaseQuery[Movimiento, MovimientoCreate]):
         sort: Sort = Sort.DESC,
         tipo_soporte_id: int | None = None,
         tipo_movimiento_id: int | None = None,
+        relaciones: bool = True,
     ) -> list[Movimiento]:
-        stmt = select(self.model_db)
+        stmt = self._relaciones(select(self.model_db), relaciones)
         if start_date and end_date and end_date >= start_date:
             stmt = stmt.where(between(self.model_db.fecha, start_date, end_date + timedelta(days=1)))
         if tipo_soporte_id:
@@ -180,6 +436,225 @@ class MovimientoQuery(BaseQuery[Movimiento, MovimientoCreate]):
         result = await session.execute(stmt)
         return list(result.scalars().all()) or []
 
+    async def get_agrupados(
+        self,
+        session: AsyncSession,
+        start_date: date,
+        end_date: date,
+        frecuencia: str = 'D',
+        group_by: list[str] = [],
+        tipo_soporte_id: int | None = None,
+        tipo_movimiento_id: int | None = None,
+        meta_valor_ids: list[int] | None = None,
+        like_meta_valor: str | None = None,
+        por_tipo_movimiento: bool = True,
+    ) -> list[dict]:
+        """Cantidad y valor de los movimientos agrupados por periodo y por `group_by`, calculados en la base de datos.
+
+        Args:
+            frecuencia: 'D', 'W', 'ME' o 'Y'. Las etiquetas de periodo son las mismas de pandas.Grouper:
+                día, domingo de la semana, último día del mes y último día del año.
+            group_by: Columnas entre 'variante_id', 'bodega_id', 'meta_atributo' y 'meta_valor'.
+                Los metadatos requieren tipo_soporte_id. Al agrupar por variante o bodega se retornan
+                sus datos (variante, sku, elemento_id / ubicacion) en lugar del id.
+            like_meta_valor: Solo los soportes con un meta valor que contenga el texto, la columna meta_valor
+                del resultado es el texto buscado.
+        Los porcentajes son sobre el total de los movimientos filtrados, antes del cruce con metadatos.
+        Se calcula desde el acumulado movimientos_diarios, salvo con like_meta_valor que requiere los soportes.
+        """
+        meta_cols = [col for col in ('meta_atributo', 'meta_valor') if col in group_by]
+        if like_meta_valor:
+            base = self._base_movimientos(start_date, end_date, frecuencia, tipo_soporte_id, tipo_movimiento_id)
+        else:
+            base = self._base_diaria(
+                start_date, end_date, frecuencia, tipo_soporte_id, tipo_movimiento_id, meta_valor_ids, bool(meta_cols)
+            )
+
+        group_cols: list = [base.c.periodo]
+        if por_tipo_movimiento:
+            group_cols.append(base.c.tipo_movimiento_id)
+        select_cols: list = []
+
+        stmt = select().select_from(base)
+        if like_meta_valor:
+            meta = (
+                select(MetadatosPorSoporte.soporte_id, literal(like_meta_valor).label('meta_valor'))
+                .distinct()
+                .join(MetaValor)
+                .where(MetadatosPorSoporte.tipo_soporte_id == tipo_soporte_id)
+                .where(MetaValor.valor.like(f'%{like_meta_valor}%'))  # type: ignore
+                .subquery()
+            )
+            group_cols.append(meta.c.meta_valor)
+            stmt = stmt.join(meta, base.c.soporte_id == meta.c.soporte_id)
+        elif meta_cols:
+            group_cols.extend(base.c[col] for col in meta_cols)
+
+        if 'variante_id' in group_by:
+            stmt = stmt.outerjoin(VarianteElemento, base.c.variante_id == VarianteElemento.id)  # type: ignore
+            group_cols.extend([base.c.variante_id, VarianteElemento.id])
+            select_cols.extend(
+                [
+                    VarianteElemento.nombre.label('variante'),  # type: ignore
+                    VarianteElemento.sku,
+                    VarianteElemento.elemento_id,
+                ]
+            )
+        if 'bodega_id' in group_by:
+            stmt = stmt.outerjoin(Bodega, base.c.bodega_id == Bodega.id)  # type: ignore
+            group_cols.extend([base.c.bodega_id, Bodega.id])
+            select_cols.append(Bodega.ubicacion)
+
+        # Los ids de variante y bodega se agrupan pero no se retornan, se reemplazan por sus datos.
+        output_cols = [col for col in group_cols if col.name not in ('variante_id', 'bodega_id', 'id')]
+        stmt = (
+            stmt.add_columns(
+                *[col.label('fecha') if col.name == 'periodo' else col for col in output_cols],
+                *select_cols,
+                func.sum(base.c.cantidad).label('cantidad'),
+                func.sum(base.c.valor).label('valor'),
+                func.max(base.c.total_cantidad).label('total_cantidad'),
+                func.max(base.c.total_valor).label('total_valor'),
+            )
+            .group_by(*group_cols)
+            .order_by(*output_cols)
+        )
+
+        result = await session.execute(stmt)
+        rows = []
+        for row in result.mappings().all():
+            row = dict(row)
+            total_cantidad = row.pop('total_cantidad')
+            total_valor = row.pop('total_valor')
+            row['cantidad_%'] = divide(row['cantidad'], total_cantidad) * 100
+            row['valor_%'] = divide(row['valor'], total_valor) * 100
+            rows.append(row)
+        return rows
+
+    async def reconstruir_diarios(self, session: AsyncSession, zona: str = Config.local_timezone) -> int:
+        """Recalcula movimientos_diarios desde movimientos y las particiones archivadas, agrupando por día en `zona`.
+        Bloquea las escrituras sobre movimientos y metadatos_por_soporte mientras se recalcula."""
+        result = await session.execute(text('SELECT inventario.reconstruir_movimientos_diarios(:zona)'), {'zona': zona})
+        registros = result.scalar_one()
+        await session.commit()
+        return registros
+
+    async def sincronizar_zona_diarios(self, session: AsyncSession) -> int | None:
+        """Reconstruye movimientos_diarios si se calculó con una zona horaria distinta a Config.local_timezone.
+        La fila de la zona se bloquea hasta el commit: los workers que inician a la vez reconstruyen una sola vez.
+        Returns:
+            Registros del acumulado reconstruido, None si la zona no cambió.
+        """
+        result = await session.execute(text('SELECT zona FROM inventario.movimientos_diarios_zona FOR UPDATE'))
+        if result.scalar_one() == Config.local_timezone:
+            await session.commit()
+            return None
+        return await self.reconstruir_diarios(session)
+
+    @staticmethod
+    def _periodos(fecha_local) -> dict:
+        """Inicio del periodo (hora local) por frecuencia, con las etiquetas de pandas.Grouper."""
+        return {
+            'D': func.date_trunc('day', fecha_local),
+            'W': func.date_trunc('week', fecha_local) + literal_column("interval '6 days'"),
+            'ME': func.date_trunc('month', fecha_local) + literal_column("interval '1 month' - interval '1 day'"),
+            'Y': func.date_trunc('year', fecha_local) + literal_column("interval '1 year' - interval '1 day'"),
+        }
+
+    def _base_movimientos(
+        self,
+        start_date: date,
+        end_date: date,
+        frecuencia: str,
+        tipo_soporte_id: int | None,
+        tipo_movimiento_id: int | None,
+    ):
+        """Movimientos filtrados con su periodo, desde la tabla de hechos. Se usa cuando el cruce con metadatos
+        depende del soporte (like_meta_valor), que no se conserva en movimientos_diarios.
+        Incluye las particiones archivadas, igual que el acumulado diario."""
+        tz = Config.local_timezone
+        columnas = [
+            'fecha',
+            'tipo_movimiento_id',
+            'tipo_soporte_id',
+            'variante_id',
+            'bodega_id',
+            'soporte_id',
+            'cantidad',
+            'valor',
+        ]
+        historico = union_all(
+            select(*[getattr(Movimiento, columna) for columna in columnas]),
+            select(*[movimientos_archivo.c[columna] for columna in columnas]),
+        ).subquery('historico')
+        periodo = self._periodos(func.timezone(tz, historico.c.fecha))[frecuencia]
+        valor_total = historico.c.valor * historico.c.cantidad
+        base = select(
+            func.timezone(tz, periodo).label('periodo'),
+            historico.c.tipo_movimiento_id,
+            historico.c.variante_id,
+            historico.c.bodega_id,
+            historico.c.soporte_id,
+            historico.c.cantidad,
+            # En la base de datos el valor es precio unitario, por lo que no representa el valor total de la venta.
+            valor_total.label('valor'),
+            func.sum(historico.c.cantidad).over().label('total_cantidad'),
+            func.sum(valor_total).over().label('total_valor'),
+        )
+        if start_date and end_date and end_date >= start_date:
+            base = base.where(between(historico.c.fecha, start_date, end_date + timedelta(days=1)))
+        if tipo_soporte_id:
+            base = base.where(historico.c.tipo_soporte_id == tipo_soporte_id)
+        if tipo_movimiento_id:
+            base = base.where(historico.c.tipo_movimiento_id == tipo_movimiento_id)
+        return base.cte('base')
+
+    def _base_diaria(
+        self,
+        start_date: date,
+        end_date: date,
+        frecuencia: str,
+        tipo_soporte_id: int | None,
+        tipo_movimiento_id: int | None,
+        meta_valor_ids: list[int] | None,
+        por_meta: bool,
+    ):
+        """Mismas columnas de _base_movimientos desde el acumulado diario, para frecuencias de un día o mayores.
+        Los totales se toman de las filas sin metadato para que sean sobre los movimientos, no sobre el cruce.
+        """
+        tz = Config.local_timezone
+        periodo = self._periodos(cast(MovimientoDiario.fecha, TIMESTAMP))[frecuencia]
+        sin_meta = MovimientoDiario.meta_atributo_id == 0
+        base = (
+            select(
+                func.timezone(tz, periodo).label('periodo'),
+                func.nullif(MovimientoDiario.tipo_movimiento_id, 0).label('tipo_movimiento_id'),
+                func.nullif(MovimientoDiario.variante_id, 0).label('variante_id'),
+                func.nullif(MovimientoDiario.bodega_id, 0).label('bodega_id'),
+                MovimientoDiario.meta_atributo_id,
+                MetaAtributo.nombre.label('meta_atributo'),  # type: ignore
+                MetaValor.valor.label('meta_valor'),  # type: ignore
+                MovimientoDiario.cantidad,
+                MovimientoDiario.valor,
+                func.sum(MovimientoDiario.cantidad).filter(sin_meta).over().label('total_cantidad'),
+                func.sum(MovimientoDiario.valor).filter(sin_meta).over().label('total_valor'),
+            )
+            .outerjoin(MetaAtributo, MovimientoDiario.meta_atributo_id == MetaAtributo.id)  # type: ignore
+            .outerjoin(MetaValor, MovimientoDiario.meta_valor_id == MetaValor.id)  # type: ignore
+        )
+        if start_date and end_date and end_date >= start_date:
+            base = base.where(between(MovimientoDiario.fecha, start_date, end_date))
+        if tipo_soporte_id:
+            base = base.where(MovimientoDiario.tipo_soporte_id == tipo_soporte_id)
+        if tipo_movimiento_id:
+            base = base.where(MovimientoDiario.tipo_movimiento_id == tipo_movimiento_id)
+        if por_meta and meta_valor_ids:
+            base = base.where(sin_meta | MovimientoDiario.meta_valor_id.in_(meta_valor_ids))  # type: ignore
+        base = base.cte('base_diaria')
+        # Se filtran las filas después de calcular los totales.
+        filas = base.c.meta_atributo_id != 0 if por_meta else base.c.meta_atributo_id == 0
+        return select(*[col for col in base.c if col.name != 'meta_atributo_id']).where(filas).cte('base')
+
     async def get_with_relations(
         self,
         session: AsyncSession,
@@ -196,15 +671,66 @@ class MovimientoQuery(BaseQuery[Movimiento, MovimientoCreate]):
         result = [MovimientoRead.model_validate(movimiento) for movimiento in result.scalars().all()]
         return result or []
 
+    async def stream_with_relations(
+        self,
+        session: AsyncSession,
+        start_date: date,
+        end_date: date,
+        sort: Sort = Sort.DESC,
+        yield_per: int = 1000,
+    ) -> AsyncIterator[list[MovimientoRead]]:
+        """Igual a get_with_relations pero con un cursor del lado del servidor, retorna los movimientos en
+        lotes de `yield_per` a medida que se leen, la memoria no depende del tamaño del rango."""
+        stmt = select(self.model_db)
+        if start_date and end_date and end_date >= start_date:
+            stmt = stmt.where(between(self.model_db.fecha, start_date, end_date + timedelta(days=1)))
+        sort_fecha = asc(self.model_db.fecha) if sort == Sort.ASC else desc(self.model_db.fecha)
+        stmt = stmt.order_by(sort_fecha, self.model_db.id).execution_options(yield_per=yield_per)
+
+        result = await session.stream_scalars(stmt)
+        async for partition in result.partitions():
+            yield [MovimientoRead.model_validate(movimiento) for movimiento in partition]
+            # Los movimientos ya serializados no se conservan en la sesión.
+            session.expunge_all()
+
+
+class SaldoQuery(BaseQuery[Saldo, Saldo]):
+    """Consultas sobre la proyección inventario.saldos, mantenida por triggers sobre movimientos."""
+
+    def __init__(self) -> None:
+        super().__init__(Saldo, Saldo)
+
+    def _saldos_desde_movimientos(self):
+        """Saldos calculados a partir del histórico de movimientos, misma agregación de los triggers.
+        Incluye las particiones archivadas, los saldos no cambian al archivar."""
+        columnas = ['variante_id', 'bodega_id', 'estado_variante_id', 'cantidad', 'tipo_movimiento_id']
+        historico = union_all(
+            select(*[getattr(Movimiento, columna) for columna in columnas]),
+            select(*[movimientos_archivo.c[columna] for columna in columnas]),
+        ).subquery('historico')
+        bodega_id = func.coalesce(historico.c.bodega_id, 0)
+        estado_variante_id = func.coalesce(historico.c.estado_variante_id, 0)
+        return (
+            select(
+                historico.c.variante_id,
+                bodega_id.label('bodega_id'),
+                estado_variante_id.label('estado_variante_id'),
+                func.sum(historico.c.cantidad * TipoMovimiento.comportamiento).label('saldo'),
+            )
+            .join(TipoMovimiento, historico.c.tipo_movimiento_id == TipoMovimiento.id)  # type: ignore
+            .where(historico.c.variante_id.is_not(None))
+            .group_by(historico.c.variante_id, bodega_id, estado_variante_id)
+        )
+
     async def get_saldos(self, session: AsyncSession):
+        """Saldo por producto y sku, suma de todas las bodegas y estados."""
         stmt = (
             select(
                 Elemento.nombre.label('producto'),  # type: ignore
                 VarianteElemento.sku,
-                func.sum(Movimiento.cantidad * TipoMovimiento.comportamiento).label('saldo'),
+                func.sum(Saldo.saldo).label('saldo'),
             )
-            .join(TipoMovimiento, Movimiento.tipo_movimiento_id == TipoMovimiento.id)  # type: ignore
-            .join(VarianteElemento, Movimiento.variante_id == VarianteElemento.id)  # type: ignore
+            .join(VarianteElemento, Saldo.variante_id == VarianteElemento.id)  # type: ignore
             .join(Elemento, VarianteElemento.elemento_id == Elemento.id)  # type: ignore
             .group_by(VarianteElemento.sku, Elemento.nombre)
         )
@@ -220,6 +746,114 @@ class MovimientoQuery(BaseQuery[Movimiento, MovimientoCreate]):
             for row in result.all()
         ]
 
+    async def reconstruir(self, session: AsyncSession) -> int:
+        """Recalcula todos los saldos desde movimientos, ej. después de cambiar el comportamiento de un tipo de
+        movimiento. Bloquea las escrituras sobre movimientos mientras se recalcula."""
+        await session.execute(text('LOCK TABLE inventario.movimientos IN SHARE MODE'))
+        await session.execute(delete(Saldo))
+        stmt = insert(Saldo).from_select(
+            ['variante_id', 'bodega_id', 'estado_variante_id', 'saldo'], self._saldos_desde_movimientos()
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount  # type: ignore
+
+    async def verificar(self, session: AsyncSession) -> list[dict]:
+        """Retorna las diferencias entre la proyección y el saldo calculado desde movimientos."""
+        esperado = self._saldos_desde_movimientos().subquery()
+        keys = [
+            (Saldo.variante_id, esperado.c.variante_id),
+            (Saldo.bodega_id, esperado.c.bodega_id),
+            (Saldo.estado_variante_id, esperado.c.estado_variante_id),
+        ]
+        saldo_esperado = func.coalesce(esperado.c.saldo, 0)
+        stmt = (
+            select(
+                func.coalesce(Saldo.variante_id, esperado.c.variante_id).label('variante_id'),
+                func.coalesce(Saldo.bodega_id, esperado.c.bodega_id).label('bodega_id'),
+                func.coalesce(Saldo.estado_variante_id, esperado.c.estado_variante_id).label('estado_variante_id'),
+                func.coalesce(Saldo.saldo, 0).label('saldo'),
+                saldo_esperado.label('saldo_esperado'),
+            )
+            .select_from(Saldo)
+            .join(esperado, and_(*[a == b for a, b in keys]), full=True)  # type: ignore
+            .where(func.coalesce(Saldo.saldo, 0) != saldo_esperado)
+        )
+        result = await session.execute(stmt)
+        return [dict(row) for row in result.mappings().all()]
+
+
+# Particiones de movimientos separadas con ParticionesMovimientosQuery.archivar, misma estructura de movimientos.
+movimientos_archivo = table(
+    'movimientos_archivo',
+    *[column(columna.name, columna.type) for columna in Movimiento.__table__.c],  # type: ignore
+    schema='inventario',
+)
+
+
+class ParticionesMovimientosQuery:
+    """Particiones mensuales de inventario.movimientos (migración movimientos_particionados)."""
+
+    patron = re.compile(r'^movimientos_p(\d{4})(\d{2})$')
+
+    async def crear(self, session: AsyncSession, meses: int = Config.movimientos_particiones_meses) -> int:
+        """Crea las particiones del mes actual y los `meses` siguientes que no existan.
+        Returns:
+            Número de particiones creadas.
+        """
+        stmt = text(
+            'SELECT inventario.crear_particiones_movimientos(now(), now() + make_interval(months => :meses + 1), :zona)'
+        )
+        result = await session.execute(stmt, {'meses': meses, 'zona': Config.local_timezone})
+        await session.commit()
+        return result.scalar_one()
+
+    async def listar(self, session: AsyncSession) -> list[dict]:
+        stmt = text(
+            """
+            SELECT p.relname AS tabla, c.relname AS particion, pg_get_expr(c.relpartbound, c.oid) AS rango,
+                greatest(c.reltuples, 0)::bigint AS registros_estimados, pg_total_relation_size(c.oid) AS bytes
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            JOIN pg_namespace n ON n.oid = p.relnamespace
+            WHERE n.nspname = 'inventario' AND p.relname IN ('movimientos', 'movimientos_archivo')
+            ORDER BY p.relname, c.relname
+            """
+        )
+        result = await session.execute(stmt)
+        return [dict(row) for row in result.mappings().all()]
+
+    async def archivar(self, session: AsyncSession, antes_de: date) -> list[str]:
+        """Separa de movimientos las particiones de los meses que terminan antes de `antes_de` y las adjunta a
+        inventario.movimientos_archivo. Los reportes dejan de leerlas y los saldos no cambian.
+        Solo se deben archivar meses cerrados: un movimiento nuevo de un mes archivado queda en movimientos_default.
+        Returns:
+            Particiones archivadas.
+        """
+        archivadas = []
+        for particion in await self.listar(session):
+            match = self.patron.match(particion['particion'])
+            if particion['tabla'] != 'movimientos' or match is None:
+                continue
+            anio, mes = int(match.group(1)), int(match.group(2))
+            fin = date(anio + mes // 12, mes % 12 + 1, 1)
+            if fin > antes_de:
+                continue
+            nombre = particion['particion']
+            archivo = f'movimientos_archivo_p{anio}{mes:02d}'
+            await session.execute(text(f'ALTER TABLE inventario.movimientos DETACH PARTITION inventario.{nombre}'))
+            await session.execute(text(f'ALTER TABLE inventario.{nombre} RENAME TO {archivo}'))
+            await session.execute(
+                text(
+                    'ALTER TABLE inventario.movimientos_archivo '
+                    f'ATTACH PARTITION inventario.{archivo} {particion["rango"]}'
+                )
+            )
+            archivadas.append(nombre)
+        await session.commit()
+        return archivadas
+
 
 class MetadatosPorSoporteQuery(BaseQuery[MetadatosPorSoporte, MetadatosPorSoporteCreate]):
     def __init__(self) -> None:
@@ -340,7 +974,7 @@ class ElementoQuery(BaseQueryWithShopifyId[Elemento, ElementoCreate]):
         super().__init__(Elemento, ElementoCreate)
 
 
-class BodegaQuery(BaseQueryWithShopifyId[Bodega, BodegaCreate]):
+class BodegaQuery(BaseQueryCatalogo[Bodega, BodegaCreate]):
     def __init__(self) -> None:
         super().__init__(Bodega, BodegaCreate)
 
@@ -382,7 +1016,7 @@ class TiposMedidaQuery(BaseQuery[TiposMedida, TiposMedidaCreate]):
         super().__init__(TiposMedida, TiposMedidaCreate)
 
 
-class TipoSoporteQuery(BaseQeuryNombre[TipoSoporte, TipoSoporteCreate]):
+class TipoSoporteQuery(BaseQueryCatalogo[TipoSoporte, TipoSoporteCreate]):
     def __init__(self) -> None:
         super().__init__(TipoSoporte, TipoSoporteCreate)
 
@@ -392,12 +1026,12 @@ class MedidasPorVarianteQuery(BaseQuery[MedidasPorVariante, MedidasPorVarianteCr
         super().__init__(MedidasPorVariante, MedidasPorVarianteCreate)
 
 
-class TipoMovimientoQuery(BaseQeuryNombre[TipoMovimiento, TipoMovimientoCreate]):
+class TipoMovimientoQuery(BaseQueryCatalogo[TipoMovimiento, TipoMovimientoCreate]):
     def __init__(self) -> None:
         super().__init__(TipoMovimiento, TipoMovimientoCreate)
 
 
-class EstadoVarianteQuery(BaseQeuryNombre[EstadoVariante, EstadoVarianteCreate]):
+class EstadoVarianteQuery(BaseQueryCatalogo[EstadoVariante, EstadoVarianteCreate]):
     def __init__(self) -> None:
         super().__init__(EstadoVariante, EstadoVarianteCreate)
 
@@ -428,8 +1062,7 @@ async def seed_data_inventario():
                     continue
 
                 models = [Model(**item) for item in items]
-                for model in models:
-                    await model_query.upsert(session, model)
+                await model_query.bulk_upsert(session, models, ['id'])
 
 
 if __name__ == '__main__':
@@ -439,14 +1072,65 @@ if __name__ == '__main__':
     # logging.basicConfig()
     # logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
 
+    async def benchmark_carga(n: int = 20000, n_create: int = 500):
+        """Filas por segundo de la carga de movimientos: create (INSERT, commit y refresh por fila), bulk_insert
+        (ruta actual de crear_movimientos_ordenes) y cargar_copy. Requiere los catálogos sembrados; los movimientos
+        de prueba (soporte_id benchmark-*) se eliminan al final de cada ruta."""
+        from time import perf_counter
+
+        from app.internal.gen.utilities import DateTz
+
+        movimiento_query = MovimientoQuery()
+
+        def movimientos(ids: list[int], cantidad: int) -> list[MovimientoCreate]:
+            tipo_movimiento_id, tipo_soporte_id, variante_id, estado_variante_id, bodega_id = ids
+            return [
+                MovimientoCreate(
+                    tipo_movimiento_id=tipo_movimiento_id,
+                    tipo_soporte_id=tipo_soporte_id,
+                    variante_id=variante_id,
+                    estado_variante_id=estado_variante_id,
+                    bodega_id=bodega_id,
+                    soporte_id=f'benchmark-{i}',
+                    cantidad=1,
+                    valor=1000,
+                    fecha=DateTz.local(),
+                )
+                for i in range(cantidad)
+            ]
+
+        async def create(session: AsyncSession, objs: list[MovimientoCreate]):
+            for obj in objs:
+                await movimiento_query.create(session, obj)
+
+        async def medir(session: AsyncSession, ids: list[int], nombre: str, cantidad: int, cargar):
+            inicio = perf_counter()
+            await cargar(session, movimientos(ids, cantidad))
+            duracion = perf_counter() - inicio
+            print(f'{nombre}: {cantidad} filas en {duracion:.2f}s, {cantidad / duracion:.0f} filas/s')
+            benchmark = Movimiento.soporte_id.like('benchmark-%')  # type: ignore
+            await session.execute(delete(Movimiento).where(benchmark))
+            await session.commit()
+
+        async for session in get_async_session():
+            async with session:
+                ids = [
+                    (await session.execute(select(func.min(model.id)))).scalar_one()  # type: ignore
+                    for model in (TipoMovimiento, TipoSoporte, VarianteElemento, EstadoVariante, Bodega)
+                ]
+                await medir(session, ids, 'create', n_create, create)
+                await medir(session, ids, 'bulk_insert', n, movimiento_query.bulk_insert)
+                await medir(session, ids, 'cargar_copy', n, movimiento_query.cargar_copy)
+
     async def main():
+        # await benchmark_carga()
         async for session in get_async_session():
             async with session:
                 # await seed_data_inventario()
                 # movimiento_query = MovimientoQuery()
                 # await movimiento_query.get_total_by(session, variante_id=5, tipo_movimiento_id=1)
 
-                # saldos = await movimiento_query.get_saldos(session)
+                # saldos = await SaldoQuery().get_saldos(session)
                 # print(saldos)
 
                 # metadatos = await MetadatosPorSoporteQuery().get_list_by_soporte(
@@ -0,0 +1,232 @@
+# app/internal/query/jobs.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.query.base import MAX_PARAMS_STATEMENT, BaseQuery
+from app.models.db.jobs import Job, JobCreate, JobEstado
+
+# Estados cubiertos por el índice único de deduplicación (tipo, llave).
+ACTIVOS = [JobEstado.PENDIENTE.value, JobEstado.EN_PROCESO.value]
+# Predicado del índice ux_jobs_tipo_llave_activos para ON CONFLICT. Debe ir con literales: con parámetros
+# PostgreSQL no puede inferir que el índice parcial aplica.
+ACTIVOS_INDEX_WHERE = text("estado IN ('pendiente', 'en_proceso')")
+
+
+class JobQuery(BaseQuery[Job, JobCreate]):
+    def __init__(self):
+        super().__init__(Job, JobCreate)
+
+    async def encolar(
+        self,
+        session: AsyncSession,
+        tipo: str,
+        llave: str,
+        payload: dict | None = None,
+        delay: float = 0,
+        max_intentos: int = 5,
+    ) -> bool:
+        """Encola un trabajo para ejecutarse en `delay` segundos.
+        Returns:
+            False si ya existe un trabajo pendiente o en proceso con el mismo tipo y llave.
+        """
+        stmt = (
+            insert(Job)
+            .values(
+                tipo=tipo,
+                llave=llave,
+                payload=payload or {},
+                max_intentos=max_intentos,
+                estado=JobEstado.PENDIENTE.value,
+                intentos=0,
+                ejecutar_en=func.now() + timedelta(seconds=delay),
+                creado=func.now(),
+                actualizado=func.now(),
+            )
+            .on_conflict_do_nothing(
+                index_elements=['tipo', 'llave'],
+                index_where=ACTIVOS_INDEX_WHERE,
+            )
+            .returning(Job.id)
+        )
+        result = await session.execute(stmt)
+        job_id = result.scalar_one_or_none()
+        await session.commit()
+        return job_id is not None
+
+    async def encolar_varios(
+        self,
+        session: AsyncSession,
+        tipo: str,
+        payloads: dict[str, dict],
+        delay: float = 0,
+        max_intentos: int = 5,
+    ) -> list[str]:
+        """Encola un trabajo por llave en una sola sentencia.
+        Returns:
+            Llaves encoladas, se omiten las que ya tienen un trabajo pendiente o en proceso.
+        """
+        if not payloads:
+            return []
+        valores = [
+            {
+                'tipo': tipo,
+                'llave': llave,
+                'payload': payload,
+                'max_intentos': max_intentos,
+                'estado': JobEstado.PENDIENTE.value,
+                'intentos': 0,
+                'ejecutar_en': func.now() + timedelta(seconds=delay),
+                'creado': func.now(),
+                'actualizado': func.now(),
+            }
+            for llave, payload in payloads.items()
+        ]
+        llaves = []
+        chunk_size = MAX_PARAMS_STATEMENT // (len(valores[0]) + 1)
+        for i in range(0, len(valores), chunk_size):
+            stmt = (
+                insert(Job)
+                .values(valores[i : i + chunk_size])
+                .on_conflict_do_nothing(
+                    index_elements=['tipo', 'llave'],
+                    index_where=ACTIVOS_INDEX_WHERE,
+                )
+                .returning(Job.llave)
+            )
+            result = await session.execute(stmt)
+            llaves.extend(result.scalars().all())
+        await session.commit()
+        return llaves
+
+    async def get_llaves_activas(self, session: AsyncSession, tipo: str, llaves: list[str]) -> set[str]:
+        """Llaves de `llaves` con un trabajo de `tipo` pendiente o en proceso."""
+        stmt = select(Job.llave).where(Job.tipo == tipo, Job.estado.in_(ACTIVOS), Job.llave.in_(llaves))  # type: ignore
+        result = await session.execute(stmt)
+        return set(result.scalars().all())
+
+    async def reclamar(self, session: AsyncSession, tipos: list[str], limite: int, lease: float) -> list[Job]:
+        """Toma hasta `limite` trabajos listos para ejecutarse. SKIP LOCKED evita que dos workers tomen el mismo
+        trabajo sin esperar uno al otro; los trabajos en proceso con el lease vencido se vuelven a tomar."""
+        listos = (
+            select(Job.id)
+            .where(
+                Job.tipo.in_(tipos),  # type: ignore
+                Job.estado.in_(ACTIVOS),  # type: ignore
+                Job.ejecutar_en <= func.now(),
+            )
+            .order_by(Job.ejecutar_en)  # type: ignore
+            .limit(limite)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(Job)
+            .where(Job.id.in_(listos.scalar_subquery()))  # type: ignore
+            .values(
+                estado=JobEstado.EN_PROCESO.value,
+                intentos=Job.intentos + 1,
+                ejecutar_en=func.now() + timedelta(seconds=lease),
+                actualizado=func.now(),
+            )
+            .returning(Job)
+        )
+        result = await session.scalars(stmt, execution_options={'synchronize_session': False})
+        jobs = list(result.all())
+        await session.commit()
+        return jobs
+
+    async def renovar(self, session: AsyncSession, job: Job, lease: float) -> bool:
+        """Extiende el lease de un trabajo en proceso mientras su handler se ejecuta.
+        Returns:
+            False si el trabajo ya no pertenece a este intento (ej. otro worker lo retomó).
+        """
+        stmt = (
+            update(Job)
+            .where(*self._intento_vigente(job))
+            .values(ejecutar_en=func.now() + timedelta(seconds=lease), actualizado=func.now())
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount > 0  # type: ignore
+
+    def _intento_vigente(self, job: Job):
+        """Filtro del intento reclamado: un worker cuyo lease venció no sobrescribe al que retomó el trabajo."""
+        return (
+            Job.id == job.id,  # type: ignore
+            Job.estado == JobEstado.EN_PROCESO.value,
+            Job.intentos == job.intentos,
+        )
+
+    async def completar(self, session: AsyncSession, job: Job) -> bool:
+        """Marca el trabajo como completado.
+        Returns:
+            False si el trabajo ya no pertenece a este intento (ej. otro worker lo retomó).
+        """
+        stmt = (
+            update(Job)
+            .where(*self._intento_vigente(job))
+            .values(estado=JobEstado.COMPLETADO.value, error=None, actualizado=func.now())
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount > 0  # type: ignore
+
+    async def fallar(
+        self, session: AsyncSession, job: Job, error: str, backoff: float, backoff_max: float = 3600
+    ) -> bool:
+        """Reprograma el trabajo con backoff exponencial, o lo marca como fallido si agotó sus intentos.
+        Returns:
+            False si el trabajo ya no pertenece a este intento (ej. otro worker lo retomó).
+        """
+        if job.intentos >= job.max_intentos:
+            values = {'estado': JobEstado.FALLIDO.value}
+        else:
+            espera = min(backoff * 2 ** (job.intentos - 1), backoff_max)
+            values = {'estado': JobEstado.PENDIENTE.value, 'ejecutar_en': func.now() + timedelta(seconds=espera)}
+        stmt = update(Job).where(*self._intento_vigente(job)).values(**values, error=error, actualizado=func.now())
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount > 0  # type: ignore
+
+    async def resumen(
+        self, session: AsyncSession, tipo: str | None = None, desde: datetime | None = None
+    ) -> dict[str, dict[str, int]]:
+        """Cantidad de trabajos por tipo y estado, opcionalmente de un tipo o creados desde una fecha."""
+        stmt = select(Job.tipo, Job.estado, func.count()).group_by(Job.tipo, Job.estado)
+        if tipo is not None:
+            stmt = stmt.where(Job.tipo == tipo)
+        if desde is not None:
+            stmt = stmt.where(Job.creado >= desde)
+        result = await session.execute(stmt)
+        resumen: dict[str, dict[str, int]] = {}
+        for tipo_job, estado, cantidad in result.all():
+            resumen.setdefault(tipo_job, {})[estado] = cantidad
+        return resumen
+
+    async def get_fallidos(self, session: AsyncSession, tipo: str, desde: datetime | None = None) -> list[Job]:
+        stmt = select(Job).where(Job.tipo == tipo, Job.estado == JobEstado.FALLIDO.value)
+        if desde is not None:
+            stmt = stmt.where(Job.creado >= desde)
+        result = await session.execute(stmt.order_by(Job.creado))  # type: ignore
+        return list(result.scalars().all())
+
+
+if __name__ == '__main__':
+    from sqlalchemy.dialects import postgresql
+
+    stmt = (
+        update(Job)
+        .where(Job.id.in_(select(Job.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()))  # type: ignore
+        .values(intentos=Job.intentos + 1, ejecutar_en=func.now() + timedelta(seconds=60))
+        .returning(Job)
+    )
+    print(stmt.compile(dialect=postgresql.dialect()))
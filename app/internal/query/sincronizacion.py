@@ -0,0 +1,36 @@
+# app/internal/query/sincronizacion.py
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.query.base import BaseQuery
+from app.models.db.sincronizacion import MarcaSincronizacion
+
+
+class MarcaSincronizacionQuery(BaseQuery[MarcaSincronizacion, MarcaSincronizacion]):
+    def __init__(self):
+        super().__init__(MarcaSincronizacion, MarcaSincronizacion)
+
+    async def get_marca(self, session: AsyncSession, nombre: str) -> datetime | None:
+        result = await session.execute(select(MarcaSincronizacion.marca).where(MarcaSincronizacion.nombre == nombre))
+        return result.scalar_one_or_none()
+
+    async def avanzar(self, session: AsyncSession, nombre: str, marca: datetime):
+        """Guarda la marca si es posterior a la actual. Una sincronización concurrente o repetida con datos más
+        antiguos no la hace retroceder."""
+        stmt = insert(MarcaSincronizacion).values(nombre=nombre, marca=marca, actualizado=func.now())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['nombre'],
+            set_={'marca': func.greatest(MarcaSincronizacion.marca, stmt.excluded.marca), 'actualizado': func.now()},
+        )
+        await session.execute(stmt)
+        await session.commit()
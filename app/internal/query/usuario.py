@@ -2,13 +2,13 @@
 from getpass import getpass
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
-from argon2 import PasswordHasher
 
 from app.models.db.usuario import UsuarioCreate, UsuarioDB
 from app.models.db.session import get_async_session
 
 from app.internal.query.base import BaseQuery
 from app.internal.log import factory_logger
+from app.internal.password import hash_password
 from app.config import Config
 
 
@@ -27,7 +27,6 @@ class UsuarioQuery(BaseQuery[UsuarioDB, UsuarioCreate]):
 
 
 usuario_query = UsuarioQuery()
-password_hasher = PasswordHasher()
 
 
 usuario_logger = factory_logger('usuario', file=True)
@@ -40,7 +39,7 @@ async def set_admin_user(reset_password: bool = False):
         async with session:
             usuario = await usuario_query.get_by_username(session, 'admin')
             if usuario is None:
-                password = password_hasher.hash(Config.admin_password)
+                password = await hash_password(Config.admin_password)
                 usuario = UsuarioDB(username='admin', password=password)
                 usuario = await usuario_query.create(session, usuario)
                 logger.info('✅ Usuario creado')
@@ -50,7 +49,7 @@ async def set_admin_user(reset_password: bool = False):
                 if password != retype_password:
                     logger.error('❌ Las contraseñas no coinciden. Por favor, vuelva a intentarlo.')
                     return await set_admin_user(reset_password=reset_password)
-                usuario.password = password_hasher.hash(password)
+                usuario.password = await hash_password(password)
                 usuario_db = await usuario_query.get_by_username(session, 'admin')
                 if usuario_db is None:
                     usuario_db = await usuario_query.create(session, usuario)
@@ -1,18 +1,54 @@
 # main.py
+from contextlib import asynccontextmanager
 from app.config import Config
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from app.routers import inventario, transacciones, usuario, auth, oauth, search, facturacion
+from app.routers import inventario, transacciones, usuario, auth, oauth, search, facturacion, metricas
 from app.internal.log import factory_logger
+from app.internal.integrations.base import HttpClientPool
+from app.internal.integrations.shopify import ShopifyGraphQLClient
+from app.internal.integrations.world_office import WoClient
+from app.internal.integrations.addi import AddiClient
+from app.internal.jobs import job_worker
+from app.internal.cache_invalidacion import invalidacion_cache
 
 logger = factory_logger('main', file=False)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clientes HTTP compartidos por integración, se cierran al apagar el worker.
+    for client in (ShopifyGraphQLClient(), WoClient(), AddiClient()):
+        client.open_http_client()
+    # Worker de la cola de trabajos (ej. pedidos de Shopify por facturar).
+    job_worker.start()
+    # Invalidación de cachés en memoria publicada por los demás procesos (ej. usuario eliminado).
+    invalidacion_cache.start()
+    try:
+        await inventario.sincronizar_zona_movimientos_diarios()
+    except Exception as e:
+        logger.error(f'No fue posible sincronizar la zona horaria de los movimientos diarios: {e}')
+    try:
+        await inventario.programar_particiones_movimientos()
+    except Exception as e:
+        logger.error(f'No fue posible programar la creación de particiones de movimientos: {e}')
+    try:
+        await inventario.programar_sync_pedidos_shopify()
+    except Exception as e:
+        logger.error(f'No fue posible programar la sincronización incremental de pedidos: {e}')
+    yield
+    await job_worker.stop()
+    await invalidacion_cache.stop()
+    await HttpClientPool.close()
+
+
 # Crea la instancia de la aplicación FastAPI
 app = FastAPI(
     title='API de Inventarios Coco Salvaje',
     description='API para gestionar el inventario de Coco Salvaje.',
     version='1.0.0',
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -39,6 +75,8 @@ app.include_router(transacciones.router)
 app.include_router(search.router)
 # Facturación
 app.include_router(facturacion.router)
+# Métricas
+app.include_router(metricas.router)
 
 
 # Ruta raíz simple para verificar que la API está funcionando
@@ -179,6 +179,8 @@ class MovimientoCreate(InventarioBase):
 
 
 class Movimiento(MovimientoCreate, table=True):
+    # Particionada por mes sobre fecha (migración movimientos_particionados), en la base de datos la clave primaria
+    # es (id, fecha). El mapeo conserva id como clave, es único por la secuencia.
     __tablename__ = 'movimientos'  # type: ignore
 
     id: int = Field(primary_key=True)
@@ -211,6 +213,40 @@ class MovimientoRead(MovimientoCreate):
     metadatos: list['MetadatosPorSoporteRead'] = []
 
 
+class Saldo(InventarioBase, table=True):
+    """Saldo actual por variante, bodega y estado. Proyección de movimientos mantenida por triggers en la
+    base de datos (ver migraciones), no se escribe desde la aplicación.
+    Los movimientos sin bodega o sin estado se acumulan con id 0.
+    """
+
+    __tablename__ = 'saldos'  # type: ignore
+
+    variante_id: int = Field(primary_key=True)
+    bodega_id: int = Field(primary_key=True, default=0)
+    estado_variante_id: int = Field(primary_key=True, default=0)
+    saldo: int = Field(default=0)
+
+
+class MovimientoDiario(InventarioBase, table=True):
+    """Cantidad y valor de los movimientos por día (hora local) y dimensión, mantenido por triggers sobre
+    movimientos y metadatos_por_soporte (ver migraciones), no se escribe desde la aplicación.
+    Cada movimiento suma en la fila sin metadato (meta_atributo_id y meta_valor_id 0) y en una fila por cada metadato
+    de su soporte. Las dimensiones nulas se acumulan con id 0.
+    """
+
+    __tablename__ = 'movimientos_diarios'  # type: ignore
+
+    fecha: date = Field(sa_type=DATE, primary_key=True)
+    tipo_movimiento_id: int = Field(primary_key=True, default=0)
+    tipo_soporte_id: int = Field(primary_key=True, default=0)
+    variante_id: int = Field(primary_key=True, default=0)
+    bodega_id: int = Field(primary_key=True, default=0)
+    meta_atributo_id: int = Field(primary_key=True, default=0)
+    meta_valor_id: int = Field(primary_key=True, default=0)
+    cantidad: int = Field(sa_type=BIGINT, default=0)
+    valor: float = Field(default=0.0)
+
+
 # region metadatos
 # Modelo EAV (Entity-Attribute-Value) para soportes de movimientos
 class MetadatosPorSoporteCreate(InventarioBase):
@@ -0,0 +1,51 @@
+# app/models/db/jobs.py
+
+"""
+Cola de trabajos persistida en PostgreSQL. Los trabajos sobreviven reinicios y se reparten entre los workers de
+uvicorn con SELECT ... FOR UPDATE SKIP LOCKED (ver app.internal.jobs).
+"""
+
+from datetime import datetime
+from enum import Enum
+from typing import Any
+
+from sqlalchemy import String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import SMALLINT, TEXT, TIMESTAMP, Field, SQLModel
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.gen.utilities import DateTz
+
+
+class JobEstado(str, Enum):
+    PENDIENTE = 'pendiente'
+    EN_PROCESO = 'en_proceso'
+    COMPLETADO = 'completado'
+    FALLIDO = 'fallido'
+
+
+class JobCreate(SQLModel):
+    tipo: str = Field(max_length=50)
+    # Llave de deduplicación, solo puede existir un trabajo pendiente o en proceso por (tipo, llave).
+    llave: str = Field(max_length=120)
+    payload: dict[str, Any] = Field(sa_type=JSONB, default_factory=dict)
+    max_intentos: int = Field(sa_type=SMALLINT, default=5)
+    # Pendiente: momento a partir del cual se puede ejecutar. En proceso: vencimiento del lease, si el worker
+    # se detiene sin terminar el trabajo, otro lo toma después de esta fecha.
+    ejecutar_en: datetime = Field(sa_type=TIMESTAMP(timezone=True), default_factory=DateTz.local)  # type: ignore
+
+
+class Job(JobCreate, table=True):
+    __tablename__ = 'jobs'  # type: ignore
+
+    id: int | None = Field(primary_key=True, default=None)
+    estado: JobEstado = Field(sa_type=String(20), default=JobEstado.PENDIENTE)
+    intentos: int = Field(sa_type=SMALLINT, default=0)
+    error: str | None = Field(sa_type=TEXT, default=None)
+    creado: datetime = Field(sa_type=TIMESTAMP(timezone=True), default_factory=DateTz.local)  # type: ignore
+    actualizado: datetime = Field(sa_type=TIMESTAMP(timezone=True), default_factory=DateTz.local)  # type: ignore
@@ -0,0 +1,891 @@
+# app/models/db/migraciones.py
+
+"""
+Cambios de esquema que `SQLModel.metadata.create_all` no aplica sobre tablas existentes (índices, restricciones,
+extensiones). Cada migración se registra en public.migraciones y se aplica una sola vez, en su propia transacción;
+si falla (ej. registros duplicados que impiden un índice único) se registra el error y se reintenta en el siguiente
+inicio, sin impedir que la aplicación arranque.
+Las migraciones se agregan al final de la lista, nunca se modifican una vez desplegadas.
+"""
+
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.log import factory_logger
+
+log_migraciones = factory_logger('migraciones', file=True)
+
+
+@dataclass(frozen=True)
+class Migracion:
+    nombre: str
+    sentencias: list[str]
+
+
+MIGRACIONES: list[Migracion] = [
+    # Índices únicos por shopify_id, requeridos por los upserts (ON CONFLICT) de la sincronización con Shopify.
+    Migracion(
+        'shopify_id_unicos',
+        [
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_bodegas_shopify_id ON inventario.bodegas (shopify_id)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_elementos_shopify_id ON inventario.elementos (shopify_id)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ix_variantes_elemento_shopify_id '
+            'ON inventario.variantes_elemento (shopify_id)',
+        ],
+    ),
+    Migracion(
+        'indices_busqueda',
+        [
+            'CREATE INDEX IF NOT EXISTS ix_variantes_elemento_sku ON inventario.variantes_elemento (sku)',
+            # get_by_nombre compara func.lower(nombre)
+            'CREATE INDEX IF NOT EXISTS ix_elementos_lower_nombre ON inventario.elementos (lower(nombre))',
+            'CREATE INDEX IF NOT EXISTS ix_variantes_elemento_lower_nombre '
+            'ON inventario.variantes_elemento (lower(nombre))',
+            # get_last / get_lasts: último precio por variante y tipo de precio
+            'CREATE INDEX IF NOT EXISTS ix_precios_variante_variante_tipo_fecha '
+            'ON inventario.precios_variante (variante_id, tipo_precio_id, fecha DESC)',
+            'CREATE INDEX IF NOT EXISTS ix_movimientos_fecha ON inventario.movimientos (fecha)',
+            'CREATE INDEX IF NOT EXISTS ix_movimientos_variante_id ON inventario.movimientos (variante_id)',
+            # get_distinct une metadatos y movimientos por soporte_id
+            'CREATE INDEX IF NOT EXISTS ix_movimientos_soporte_id ON inventario.movimientos (soporte_id)',
+            'CREATE INDEX IF NOT EXISTS ix_metadatos_por_soporte_soporte_id '
+            'ON inventario.metadatos_por_soporte (soporte_id)',
+        ],
+    ),
+    # Restricciones que evitan duplicados cuando el mismo pedido se procesa de forma concurrente
+    # (webhook repetido, sincronización por rango).
+    Migracion(
+        'restricciones_unicas',
+        [
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_movimientos_soporte_variante '
+            'ON inventario.movimientos (tipo_soporte_id, soporte_id, variante_id) WHERE soporte_id IS NOT NULL',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_metadatos_por_soporte '
+            'ON inventario.metadatos_por_soporte (tipo_soporte_id, soporte_id, meta_atributo_id, meta_valor_id)',
+            # Los atributos y valores se guardan en minúsculas (InventarioLower)
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_meta_atributos_nombre ON inventario.meta_atributos (nombre)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_meta_valores_valor ON inventario.meta_valores (valor)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_pedidos_numero ON transaccion.pedidos (numero)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_compras_numero_factura_proveedor '
+            'ON transaccion.compras (numero_factura_proveedor)',
+        ],
+    ),
+    # Búsquedas LIKE '%x%' de get_like y get_by_nombre, un índice btree no aplica con comodín al inicio.
+    Migracion(
+        'indices_trigram',
+        [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX IF NOT EXISTS ix_meta_atributos_nombre_trgm '
+            'ON inventario.meta_atributos USING gin (nombre gin_trgm_ops)',
+            'CREATE INDEX IF NOT EXISTS ix_meta_valores_valor_trgm '
+            'ON inventario.meta_valores USING gin (valor gin_trgm_ops)',
+            'CREATE INDEX IF NOT EXISTS ix_meta_atributos_lower_nombre_trgm '
+            'ON inventario.meta_atributos USING gin (lower(nombre) gin_trgm_ops)',
+        ],
+    ),
+    # Saldos: cada sentencia sobre movimientos aplica su delta a inventario.saldos en la misma transacción.
+    # Triggers por sentencia con tablas de transición, una inserción masiva hace un solo upsert agrupado.
+    Migracion(
+        'saldos_triggers',
+        [
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_saldos() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.saldos AS s (variante_id, bodega_id, estado_variante_id, saldo)
+                    SELECT m.variante_id, coalesce(m.bodega_id, 0), coalesce(m.estado_variante_id, 0),
+                        -sum(m.cantidad * t.comportamiento)
+                    FROM anteriores m
+                    JOIN inventario.tipos_movimiento t ON t.id = m.tipo_movimiento_id
+                    WHERE m.variante_id IS NOT NULL
+                    GROUP BY 1, 2, 3
+                    ORDER BY 1, 2, 3
+                    ON CONFLICT (variante_id, bodega_id, estado_variante_id)
+                    DO UPDATE SET saldo = s.saldo + excluded.saldo;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.saldos AS s (variante_id, bodega_id, estado_variante_id, saldo)
+                    SELECT m.variante_id, coalesce(m.bodega_id, 0), coalesce(m.estado_variante_id, 0),
+                        sum(m.cantidad * t.comportamiento)
+                    FROM nuevos m
+                    JOIN inventario.tipos_movimiento t ON t.id = m.tipo_movimiento_id
+                    WHERE m.variante_id IS NOT NULL
+                    GROUP BY 1, 2, 3
+                    ORDER BY 1, 2, 3
+                    ON CONFLICT (variante_id, bodega_id, estado_variante_id)
+                    DO UPDATE SET saldo = s.saldo + excluded.saldo;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+            'DROP TRIGGER IF EXISTS tr_saldos_insert ON inventario.movimientos',
+            'DROP TRIGGER IF EXISTS tr_saldos_update ON inventario.movimientos',
+            'DROP TRIGGER IF EXISTS tr_saldos_delete ON inventario.movimientos',
+            'CREATE TRIGGER tr_saldos_insert AFTER INSERT ON inventario.movimientos '
+            'REFERENCING NEW TABLE AS nuevos FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_saldos()',
+            'CREATE TRIGGER tr_saldos_update AFTER UPDATE ON inventario.movimientos '
+            'REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_saldos()',
+            'CREATE TRIGGER tr_saldos_delete AFTER DELETE ON inventario.movimientos '
+            'REFERENCING OLD TABLE AS anteriores FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_saldos()',
+            # Carga inicial desde el histórico, en la misma transacción que crea los triggers.
+            'LOCK TABLE inventario.movimientos IN SHARE MODE',
+            'DELETE FROM inventario.saldos',
+            """
+            INSERT INTO inventario.saldos (variante_id, bodega_id, estado_variante_id, saldo)
+            SELECT m.variante_id, coalesce(m.bodega_id, 0), coalesce(m.estado_variante_id, 0),
+                sum(m.cantidad * t.comportamiento)
+            FROM inventario.movimientos m
+            JOIN inventario.tipos_movimiento t ON t.id = m.tipo_movimiento_id
+            WHERE m.variante_id IS NOT NULL
+            GROUP BY 1, 2, 3
+            """,
+        ],
+    ),
+    # Paginación por cursor (CRUD /{recursos}/cursor): la comparación (fecha, id) > (:fecha, :id) recorre el índice
+    # desde el cursor, sin leer las filas de las páginas anteriores.
+    Migracion(
+        'indices_keyset',
+        [
+            'CREATE INDEX IF NOT EXISTS ix_movimientos_fecha_id ON inventario.movimientos (fecha, id)',
+            'CREATE INDEX IF NOT EXISTS ix_precios_variante_fecha_id ON inventario.precios_variante (fecha, id)',
+            'CREATE INDEX IF NOT EXISTS ix_pedidos_fecha_id ON transaccion.pedidos (fecha, id)',
+            'CREATE INDEX IF NOT EXISTS ix_compras_fecha_id ON transaccion.compras (fecha, id)',
+        ],
+    ),
+    # Cola de trabajos (app.internal.jobs): un solo trabajo activo por (tipo, llave), ej. el número de pedido de
+    # un webhook repetido; e índice de los trabajos listos para ejecutarse.
+    Migracion(
+        'jobs',
+        [
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_tipo_llave_activos ON public.jobs (tipo, llave) '
+            "WHERE estado IN ('pendiente', 'en_proceso')",
+            'CREATE INDEX IF NOT EXISTS ix_jobs_activos_ejecutar_en ON public.jobs (ejecutar_en) '
+            "WHERE estado IN ('pendiente', 'en_proceso')",
+        ],
+    ),
+    # Movimientos particionado por mes (fecha). Los reportes por rango de fechas solo leen las particiones de los
+    # meses consultados y el mantenimiento (vacuum, índices) se hace por partición. La clave primaria y las
+    # restricciones únicas deben incluir fecha; los movimientos de un pedido comparten la fecha del pedido, así
+    # ux_movimientos_soporte_variante sigue evitando duplicados.
+    # Las particiones de meses futuros se crean con inventario.crear_particiones_movimientos (ver
+    # ParticionesMovimientosQuery); los registros fuera de las particiones existentes quedan en movimientos_default
+    # y se trasladan al crear la partición de su mes.
+    Migracion(
+        'movimientos_particionados',
+        [
+            """
+            CREATE OR REPLACE FUNCTION inventario.crear_particiones_movimientos(desde timestamptz, hasta timestamptz)
+            RETURNS integer LANGUAGE plpgsql AS $$
+            DECLARE
+                inicio timestamptz := date_trunc('month', desde AT TIME ZONE 'America/Bogota')
+                    AT TIME ZONE 'America/Bogota';
+                fin timestamptz;
+                nombre text;
+                creadas integer := 0;
+            BEGIN
+                WHILE inicio < hasta LOOP
+                    fin := (date_trunc('month', inicio AT TIME ZONE 'America/Bogota') + interval '1 month')
+                        AT TIME ZONE 'America/Bogota';
+                    nombre := 'movimientos_p' || to_char(inicio AT TIME ZONE 'America/Bogota', 'YYYYMM');
+                    IF to_regclass('inventario.' || nombre) IS NULL THEN
+                        -- Se crea fuera del padre, se le trasladan los registros del mes que estén en la partición
+                        -- por defecto y luego se adjunta. Las sentencias sobre particiones no disparan los
+                        -- triggers de saldos del padre, los saldos no cambian.
+                        EXECUTE format(
+                            'CREATE TABLE inventario.%I (LIKE inventario.movimientos INCLUDING DEFAULTS)', nombre
+                        );
+                        EXECUTE format(
+                            'WITH movidos AS (DELETE FROM inventario.movimientos_default '
+                            'WHERE fecha >= %L AND fecha < %L RETURNING *) '
+                            'INSERT INTO inventario.%I SELECT * FROM movidos',
+                            inicio, fin, nombre
+                        );
+                        EXECUTE format(
+                            'ALTER TABLE inventario.movimientos ATTACH PARTITION inventario.%I '
+                            'FOR VALUES FROM (%L) TO (%L)',
+                            nombre, inicio, fin
+                        );
+                        creadas := creadas + 1;
+                    END IF;
+                    inicio := fin;
+                END LOOP;
+                RETURN creadas;
+            END;
+            $$
+            """,
+            'ALTER TABLE inventario.movimientos RENAME TO movimientos_sin_particion',
+            'ALTER TABLE inventario.movimientos_sin_particion '
+            'RENAME CONSTRAINT movimientos_pkey TO movimientos_sin_particion_pkey',
+            'CREATE TABLE inventario.movimientos (LIKE inventario.movimientos_sin_particion INCLUDING DEFAULTS) '
+            'PARTITION BY RANGE (fecha)',
+            'ALTER TABLE inventario.movimientos ADD PRIMARY KEY (id, fecha)',
+            'ALTER TABLE inventario.movimientos ADD FOREIGN KEY (tipo_movimiento_id) '
+            'REFERENCES inventario.tipos_movimiento (id)',
+            'ALTER TABLE inventario.movimientos ADD FOREIGN KEY (tipo_soporte_id) '
+            'REFERENCES inventario.tipos_soporte (id)',
+            'ALTER TABLE inventario.movimientos ADD FOREIGN KEY (variante_id) '
+            'REFERENCES inventario.variantes_elemento (id)',
+            'ALTER TABLE inventario.movimientos ADD FOREIGN KEY (estado_variante_id) '
+            'REFERENCES inventario.estados_variante (id)',
+            'ALTER TABLE inventario.movimientos ADD FOREIGN KEY (bodega_id) REFERENCES inventario.bodegas (id)',
+            'CREATE TABLE inventario.movimientos_default PARTITION OF inventario.movimientos DEFAULT',
+            'SELECT inventario.crear_particiones_movimientos('
+            'coalesce((SELECT min(fecha) FROM inventario.movimientos_sin_particion), now()), '
+            "now() + interval '3 months')",
+            # Los triggers de saldos se crean después de copiar el histórico, los saldos ya lo incluyen.
+            'INSERT INTO inventario.movimientos SELECT * FROM inventario.movimientos_sin_particion',
+            'ALTER SEQUENCE inventario.movimientos_id_seq OWNED BY inventario.movimientos.id',
+            'DROP TABLE inventario.movimientos_sin_particion',
+            'CREATE INDEX ix_movimientos_fecha_id ON inventario.movimientos (fecha, id)',
+            'CREATE INDEX ix_movimientos_variante_id ON inventario.movimientos (variante_id)',
+            'CREATE INDEX ix_movimientos_soporte_id ON inventario.movimientos (soporte_id)',
+            'CREATE UNIQUE INDEX ux_movimientos_soporte_variante '
+            'ON inventario.movimientos (tipo_soporte_id, soporte_id, variante_id, fecha) WHERE soporte_id IS NOT NULL',
+            'CREATE TRIGGER tr_saldos_insert AFTER INSERT ON inventario.movimientos '
+            'REFERENCING NEW TABLE AS nuevos FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_saldos()',
+            'CREATE TRIGGER tr_saldos_update AFTER UPDATE ON inventario.movimientos '
+            'REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_saldos()',
+            'CREATE TRIGGER tr_saldos_delete AFTER DELETE ON inventario.movimientos '
+            'REFERENCING OLD TABLE AS anteriores FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_saldos()',
+            # Particiones archivadas: se separan de movimientos pero siguen disponibles para consultas y para
+            # reconstruir los saldos.
+            'CREATE TABLE inventario.movimientos_archivo (LIKE inventario.movimientos) PARTITION BY RANGE (fecha)',
+        ],
+    ),
+    # Acumulado diario de movimientos para los reportes agrupados (MovimientoQuery.get_agrupados). Cada par
+    # (movimiento, metadato de su soporte) se suma una sola vez: en el trigger de movimientos si el metadato ya
+    # existe, o en el de metadatos_por_soporte si el movimiento ya existe.
+    Migracion(
+        'movimientos_diarios',
+        [
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_movimientos_diarios() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        md.meta_atributo_id, md.meta_valor_id, -sum(m.cantidad), -sum(m.cantidad * m.valor)
+                    FROM anteriores m
+                    CROSS JOIN LATERAL (
+                        SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                        UNION ALL
+                        SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                        WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                            AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    ) md
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        md.meta_atributo_id, md.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                    FROM nuevos m
+                    CROSS JOIN LATERAL (
+                        SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                        UNION ALL
+                        SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                        WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                            AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    ) md
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_movimientos_diarios_metadatos() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        s.meta_atributo_id, s.meta_valor_id, -sum(m.cantidad), -sum(m.cantidad * m.valor)
+                    FROM anteriores s
+                    JOIN inventario.movimientos m
+                        ON m.tipo_soporte_id = s.tipo_soporte_id AND m.soporte_id = s.soporte_id
+                    WHERE s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        s.meta_atributo_id, s.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                    FROM nuevos s
+                    JOIN inventario.movimientos m
+                        ON m.tipo_soporte_id = s.tipo_soporte_id AND m.soporte_id = s.soporte_id
+                    WHERE s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+            # Recalcula el acumulado completo, incluye las particiones archivadas.
+            """
+            CREATE OR REPLACE FUNCTION inventario.reconstruir_movimientos_diarios() RETURNS bigint
+            LANGUAGE plpgsql AS $$
+            DECLARE
+                registros bigint;
+            BEGIN
+                LOCK TABLE inventario.movimientos, inventario.metadatos_por_soporte IN SHARE MODE;
+                DELETE FROM inventario.movimientos_diarios;
+                INSERT INTO inventario.movimientos_diarios
+                    (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                    meta_valor_id, cantidad, valor)
+                SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                    coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                    md.meta_atributo_id, md.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                FROM (
+                    SELECT * FROM inventario.movimientos
+                    UNION ALL
+                    SELECT * FROM inventario.movimientos_archivo
+                ) m
+                CROSS JOIN LATERAL (
+                    SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                    UNION ALL
+                    SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                    WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                        AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                ) md
+                GROUP BY 1, 2, 3, 4, 5, 6, 7;
+                GET DIAGNOSTICS registros = ROW_COUNT;
+                RETURN registros;
+            END;
+            $$
+            """,
+            'DROP TRIGGER IF EXISTS tr_movimientos_diarios_insert ON inventario.movimientos',
+            'DROP TRIGGER IF EXISTS tr_movimientos_diarios_update ON inventario.movimientos',
+            'DROP TRIGGER IF EXISTS tr_movimientos_diarios_delete ON inventario.movimientos',
+            'CREATE TRIGGER tr_movimientos_diarios_insert AFTER INSERT ON inventario.movimientos '
+            'REFERENCING NEW TABLE AS nuevos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_movimientos_diarios()',
+            'CREATE TRIGGER tr_movimientos_diarios_update AFTER UPDATE ON inventario.movimientos '
+            'REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_movimientos_diarios()',
+            'CREATE TRIGGER tr_movimientos_diarios_delete AFTER DELETE ON inventario.movimientos '
+            'REFERENCING OLD TABLE AS anteriores '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_movimientos_diarios()',
+            'DROP TRIGGER IF EXISTS tr_movimientos_diarios_insert ON inventario.metadatos_por_soporte',
+            'DROP TRIGGER IF EXISTS tr_movimientos_diarios_update ON inventario.metadatos_por_soporte',
+            'DROP TRIGGER IF EXISTS tr_movimientos_diarios_delete ON inventario.metadatos_por_soporte',
+            'CREATE TRIGGER tr_movimientos_diarios_insert AFTER INSERT ON inventario.metadatos_por_soporte '
+            'REFERENCING NEW TABLE AS nuevos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_movimientos_diarios_metadatos()',
+            'CREATE TRIGGER tr_movimientos_diarios_update AFTER UPDATE ON inventario.metadatos_por_soporte '
+            'REFERENCING OLD TABLE AS anteriores NEW TABLE AS nuevos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_movimientos_diarios_metadatos()',
+            'CREATE TRIGGER tr_movimientos_diarios_delete AFTER DELETE ON inventario.metadatos_por_soporte '
+            'REFERENCING OLD TABLE AS anteriores '
+            'FOR EACH STATEMENT EXECUTE FUNCTION inventario.actualizar_movimientos_diarios_metadatos()',
+            # Carga inicial desde el histórico, en la misma transacción que crea los triggers.
+            'SELECT inventario.reconstruir_movimientos_diarios()',
+            'CREATE INDEX IF NOT EXISTS ix_movimientos_diarios_tipo_soporte_meta_valor '
+            'ON inventario.movimientos_diarios (tipo_soporte_id, meta_valor_id, fecha)',
+        ],
+    ),
+    # Saldo de tokens por integración, compartido por los procesos (SharedTokenBucket).
+    Migracion(
+        'rate_limits',
+        [
+            'CREATE TABLE IF NOT EXISTS public.rate_limits (nombre VARCHAR(120) PRIMARY KEY, '
+            'tokens DOUBLE PRECISION NOT NULL, actualizado TIMESTAMP WITH TIME ZONE NOT NULL)',
+        ],
+    ),
+    # crear_particiones_movimientos recibe la zona horaria de los límites de mes (Config.local_timezone) en lugar
+    # de tenerla fija. Se elimina la versión de dos parámetros para que ningún llamado use la zona anterior.
+    Migracion(
+        'particiones_movimientos_zona',
+        [
+            """
+            CREATE OR REPLACE FUNCTION inventario.crear_particiones_movimientos(
+                desde timestamptz, hasta timestamptz, zona text
+            ) RETURNS integer LANGUAGE plpgsql AS $$
+            DECLARE
+                inicio timestamptz := date_trunc('month', desde AT TIME ZONE zona) AT TIME ZONE zona;
+                fin timestamptz;
+                nombre text;
+                creadas integer := 0;
+            BEGIN
+                WHILE inicio < hasta LOOP
+                    fin := (date_trunc('month', inicio AT TIME ZONE zona) + interval '1 month') AT TIME ZONE zona;
+                    nombre := 'movimientos_p' || to_char(inicio AT TIME ZONE zona, 'YYYYMM');
+                    IF to_regclass('inventario.' || nombre) IS NULL THEN
+                        -- Ver movimientos_particionados: se crea fuera del padre, se trasladan los registros del mes
+                        -- desde la partición por defecto y luego se adjunta.
+                        EXECUTE format(
+                            'CREATE TABLE inventario.%I (LIKE inventario.movimientos INCLUDING DEFAULTS)', nombre
+                        );
+                        EXECUTE format(
+                            'WITH movidos AS (DELETE FROM inventario.movimientos_default '
+                            'WHERE fecha >= %L AND fecha < %L RETURNING *) '
+                            'INSERT INTO inventario.%I SELECT * FROM movidos',
+                            inicio, fin, nombre
+                        );
+                        EXECUTE format(
+                            'ALTER TABLE inventario.movimientos ATTACH PARTITION inventario.%I '
+                            'FOR VALUES FROM (%L) TO (%L)',
+                            nombre, inicio, fin
+                        );
+                        creadas := creadas + 1;
+                    END IF;
+                    inicio := fin;
+                END LOOP;
+                RETURN creadas;
+            END;
+            $$
+            """,
+            'DROP FUNCTION IF EXISTS inventario.crear_particiones_movimientos(timestamptz, timestamptz)',
+        ],
+    ),
+    # Los triggers de movimientos_diarios se serializan por soporte con el mismo advisory lock de
+    # MovimientoQuery.bloquear_soportes: sin él, una transacción que inserta los movimientos de un soporte y otra
+    # que inserta sus metadatos no ven las filas de la otra (ninguna ha hecho commit) y el cruce no se suma en
+    # ninguno de los dos triggers. Con el lock la segunda espera al commit de la primera y, como cada sentencia
+    # de la función toma un snapshot nuevo (READ COMMITTED), ve sus filas.
+    # El trigger de metadatos también suma los movimientos de las particiones archivadas, como
+    # reconstruir_movimientos_diarios.
+    Migracion(
+        'movimientos_diarios_por_soporte',
+        [
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_movimientos_diarios() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                -- Los soportes se bloquean antes de leer la otra tabla, en orden para evitar deadlocks.
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM anteriores
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM nuevos
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        md.meta_atributo_id, md.meta_valor_id, -sum(m.cantidad), -sum(m.cantidad * m.valor)
+                    FROM anteriores m
+                    CROSS JOIN LATERAL (
+                        SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                        UNION ALL
+                        SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                        WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                            AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    ) md
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        md.meta_atributo_id, md.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                    FROM nuevos m
+                    CROSS JOIN LATERAL (
+                        SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                        UNION ALL
+                        SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                        WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                            AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    ) md
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_movimientos_diarios_metadatos() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                -- Los soportes se bloquean antes de leer la otra tabla, en orden para evitar deadlocks.
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM anteriores
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM nuevos
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        s.meta_atributo_id, s.meta_valor_id, -sum(m.cantidad), -sum(m.cantidad * m.valor)
+                    FROM anteriores s
+                    JOIN (
+                        SELECT * FROM inventario.movimientos
+                        UNION ALL
+                        SELECT * FROM inventario.movimientos_archivo
+                    ) m ON m.tipo_soporte_id = s.tipo_soporte_id AND m.soporte_id = s.soporte_id
+                    WHERE s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE 'America/Bogota')::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        s.meta_atributo_id, s.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                    FROM nuevos s
+                    JOIN (
+                        SELECT * FROM inventario.movimientos
+                        UNION ALL
+                        SELECT * FROM inventario.movimientos_archivo
+                    ) m ON m.tipo_soporte_id = s.tipo_soporte_id AND m.soporte_id = s.soporte_id
+                    WHERE s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+        ],
+    ),
+    # movimientos_diarios agrupa por día en la zona horaria de Config.local_timezone en lugar de tenerla fija. La zona
+    # con la que se calculó el acumulado queda en movimientos_diarios_zona, la leen los triggers y solo la cambia
+    # reconstruir_movimientos_diarios: con otra zona los triggers descontarían en días distintos a los sumados.
+    # Al iniciar, MovimientoQuery.sincronizar_zona_diarios reconstruye el acumulado si la zona configurada cambió.
+    Migracion(
+        'movimientos_diarios_zona',
+        [
+            'CREATE TABLE IF NOT EXISTS inventario.movimientos_diarios_zona ('
+            'unica BOOLEAN PRIMARY KEY DEFAULT true CHECK (unica), zona TEXT NOT NULL)',
+            # El acumulado existente se calculó con la zona que tenían fija los triggers.
+            "INSERT INTO inventario.movimientos_diarios_zona (zona) VALUES ('America/Bogota') ON CONFLICT DO NOTHING",
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_movimientos_diarios() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            DECLARE
+                zona_local text := (SELECT z.zona FROM inventario.movimientos_diarios_zona z);
+            BEGIN
+                -- Los soportes se bloquean antes de leer la otra tabla, en orden para evitar deadlocks.
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM anteriores
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM nuevos
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE zona_local)::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        md.meta_atributo_id, md.meta_valor_id, -sum(m.cantidad), -sum(m.cantidad * m.valor)
+                    FROM anteriores m
+                    CROSS JOIN LATERAL (
+                        SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                        UNION ALL
+                        SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                        WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                            AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    ) md
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE zona_local)::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        md.meta_atributo_id, md.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                    FROM nuevos m
+                    CROSS JOIN LATERAL (
+                        SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                        UNION ALL
+                        SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                        WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                            AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    ) md
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION inventario.actualizar_movimientos_diarios_metadatos() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            DECLARE
+                zona_local text := (SELECT z.zona FROM inventario.movimientos_diarios_zona z);
+            BEGIN
+                -- Los soportes se bloquean antes de leer la otra tabla, en orden para evitar deadlocks.
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM anteriores
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    PERFORM pg_advisory_xact_lock(t.tipo_soporte_id, hashtext(t.soporte_id))
+                    FROM (
+                        SELECT DISTINCT tipo_soporte_id, soporte_id FROM nuevos
+                        WHERE tipo_soporte_id IS NOT NULL AND soporte_id IS NOT NULL
+                        ORDER BY 1, 2
+                    ) t;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE zona_local)::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        s.meta_atributo_id, s.meta_valor_id, -sum(m.cantidad), -sum(m.cantidad * m.valor)
+                    FROM anteriores s
+                    JOIN (
+                        SELECT * FROM inventario.movimientos
+                        UNION ALL
+                        SELECT * FROM inventario.movimientos_archivo
+                    ) m ON m.tipo_soporte_id = s.tipo_soporte_id AND m.soporte_id = s.soporte_id
+                    WHERE s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO inventario.movimientos_diarios AS d
+                        (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id, cantidad, valor)
+                    SELECT (m.fecha AT TIME ZONE zona_local)::date, coalesce(m.tipo_movimiento_id, 0),
+                        coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                        s.meta_atributo_id, s.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                    FROM nuevos s
+                    JOIN (
+                        SELECT * FROM inventario.movimientos
+                        UNION ALL
+                        SELECT * FROM inventario.movimientos_archivo
+                    ) m ON m.tipo_soporte_id = s.tipo_soporte_id AND m.soporte_id = s.soporte_id
+                    WHERE s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5, 6, 7
+                    ORDER BY 1, 2, 3, 4, 5, 6, 7
+                    ON CONFLICT (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                        meta_valor_id)
+                    DO UPDATE SET cantidad = d.cantidad + excluded.cantidad, valor = d.valor + excluded.valor;
+                END IF;
+                RETURN NULL;
+            END;
+            $$
+            """,
+            """
+            CREATE OR REPLACE FUNCTION inventario.reconstruir_movimientos_diarios(zona text) RETURNS bigint
+            LANGUAGE plpgsql AS $$
+            DECLARE
+                registros bigint;
+            BEGIN
+                -- Serializa las reconstrucciones antes de bloquear las tablas, SHARE no se bloquea a sí mismo.
+                PERFORM 1 FROM inventario.movimientos_diarios_zona FOR UPDATE;
+                LOCK TABLE inventario.movimientos, inventario.metadatos_por_soporte IN SHARE MODE;
+                UPDATE inventario.movimientos_diarios_zona SET zona = reconstruir_movimientos_diarios.zona;
+                DELETE FROM inventario.movimientos_diarios;
+                INSERT INTO inventario.movimientos_diarios
+                    (fecha, tipo_movimiento_id, tipo_soporte_id, variante_id, bodega_id, meta_atributo_id,
+                    meta_valor_id, cantidad, valor)
+                SELECT (m.fecha AT TIME ZONE zona)::date, coalesce(m.tipo_movimiento_id, 0),
+                    coalesce(m.tipo_soporte_id, 0), coalesce(m.variante_id, 0), coalesce(m.bodega_id, 0),
+                    md.meta_atributo_id, md.meta_valor_id, sum(m.cantidad), sum(m.cantidad * m.valor)
+                FROM (
+                    SELECT * FROM inventario.movimientos
+                    UNION ALL
+                    SELECT * FROM inventario.movimientos_archivo
+                ) m
+                CROSS JOIN LATERAL (
+                    SELECT 0 AS meta_atributo_id, 0 AS meta_valor_id
+                    UNION ALL
+                    SELECT s.meta_atributo_id, s.meta_valor_id FROM inventario.metadatos_por_soporte s
+                    WHERE s.tipo_soporte_id = m.tipo_soporte_id AND s.soporte_id = m.soporte_id
+                        AND s.meta_atributo_id IS NOT NULL AND s.meta_valor_id IS NOT NULL
+                ) md
+                GROUP BY 1, 2, 3, 4, 5, 6, 7;
+                GET DIAGNOSTICS registros = ROW_COUNT;
+                RETURN registros;
+            END;
+            $$
+            """,
+            'DROP FUNCTION IF EXISTS inventario.reconstruir_movimientos_diarios()',
+        ],
+    ),
+]
+
+
+async def aplicar_migraciones(engine: AsyncEngine, migraciones: list[Migracion] = MIGRACIONES):
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                'CREATE TABLE IF NOT EXISTS public.migraciones ('
+                'nombre VARCHAR(120) PRIMARY KEY, fecha TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now())'
+            )
+        )
+        result = await conn.execute(text('SELECT nombre FROM public.migraciones'))
+        aplicadas = set(result.scalars().all())
+
+    for migracion in migraciones:
+        if migracion.nombre in aplicadas:
+            continue
+        try:
+            async with engine.begin() as conn:
+                for sentencia in migracion.sentencias:
+                    await conn.execute(text(sentencia))
+                await conn.execute(
+                    text('INSERT INTO public.migraciones (nombre) VALUES (:nombre)'), {'nombre': migracion.nombre}
+                )
+            log_migraciones.info(f'Migración aplicada: {migracion.nombre}')
+        except Exception as e:
+            log_migraciones.error(f'No fue posible aplicar la migración {migracion.nombre}: {e}')
+
+
+if __name__ == '__main__':
+    from asyncio import run
+
+    from app.config import Config
+    from app.models.db.session import async_engine, create_db_and_tables
+
+    # Consultas frecuentes y el índice que deben usar. enable_seqscan = off evita que el planner prefiera
+    # un seq scan por el tamaño de las tablas en una base de datos de desarrollo.
+    PLANES = {
+        "SELECT * FROM inventario.variantes_elemento WHERE shopify_id = 1": 'ix_variantes_elemento_shopify_id',
+        "SELECT * FROM inventario.variantes_elemento WHERE sku = 'x'": 'ix_variantes_elemento_sku',
+        "SELECT * FROM inventario.elementos WHERE lower(nombre) = 'x'": 'ix_elementos_lower_nombre',
+        # En movimientos el plan muestra los índices de cada partición (ej. movimientos_p202501_variante_id_idx).
+        "SELECT * FROM inventario.movimientos WHERE tipo_soporte_id = 1 AND soporte_id = '1' AND variante_id = 1": (
+            'Index Scan'
+        ),
+        "SELECT * FROM inventario.meta_valores WHERE valor LIKE '%x%'": 'ix_meta_valores_valor_trgm',
+        "SELECT * FROM inventario.meta_atributos WHERE lower(nombre) LIKE '%x%'": (
+            'ix_meta_atributos_lower_nombre_trgm'
+        ),
+        'SELECT * FROM transaccion.pedidos WHERE numero = 1': 'ux_pedidos_numero',
+        (
+            "SELECT * FROM inventario.movimientos WHERE (fecha, id) < ('2025-01-01', 1) "
+            'ORDER BY fecha DESC, id DESC LIMIT 101'
+        ): 'fecha_id_idx',
+    }
+
+    async def verificar_planes():
+        await create_db_and_tables()
+        async with async_engine.connect() as conn:
+            await conn.execute(text('SET enable_seqscan = off'))
+            for consulta, indice in PLANES.items():
+                result = await conn.execute(text(f'EXPLAIN {consulta}'))
+                plan = '\n'.join(result.scalars().all())
+                assert indice in plan, f'{consulta} no usa {indice}:\n{plan}'
+                print(f'OK {indice}')
+
+            # Poda de particiones: un rango de un mes solo lee la partición de ese mes.
+            await conn.execute(
+                text("SELECT inventario.crear_particiones_movimientos('2025-01-01', '2025-03-01', :zona)"),
+                {'zona': Config.local_timezone},
+            )
+            result = await conn.execute(
+                text(
+                    'EXPLAIN SELECT * FROM inventario.movimientos '
+                    "WHERE fecha >= '2025-01-05 00:00-05' AND fecha < '2025-01-20 00:00-05'"
+                )
+            )
+            plan = '\n'.join(result.scalars().all())
+            assert 'movimientos_p202501' in plan and 'movimientos_p202502' not in plan, plan
+            print('OK poda de particiones')
+
+    run(verificar_planes())
@@ -16,6 +16,7 @@ from sqlmodel import SQLModel
 
 
 from app.config import Config
+from app.models.db.migraciones import aplicar_migraciones
 
 # SQLModel.metadata.schema = 'public'  # Asegúrate de que todas las tablas se creen en el esquema correcto
 url = URL.create(
@@ -55,3 +56,6 @@ async def create_db_and_tables():
 
         # Crear todas las tablas
         await conn.run_sync(SQLModel.metadata.create_all)
+
+    # Índices y restricciones que create_all no aplica sobre tablas existentes.
+    await aplicar_migraciones(async_engine)
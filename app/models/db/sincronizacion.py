@@ -0,0 +1,27 @@
+# app/models/db/sincronizacion.py
+
+"""
+Marcas de agua de las sincronizaciones incrementales: hasta dónde se procesó cada fuente externa, para consultar
+solo lo que cambió después (ver ShopifyInventario.sincronizar_movimientos_ordenes_incremental).
+"""
+
+from datetime import datetime
+
+from sqlmodel import TIMESTAMP, Field, SQLModel
+
+if __name__ == '__main__':
+    from os.path import abspath
+    from sys import path as sys_path
+
+    sys_path.append(abspath('.'))
+
+from app.internal.gen.utilities import DateTz
+
+
+class MarcaSincronizacion(SQLModel, table=True):
+    __tablename__ = 'marcas_sincronizacion'  # type: ignore
+
+    nombre: str = Field(primary_key=True, max_length=50)
+    # Fecha de la fuente (ej. updated_at del último pedido procesado), no la hora de la sincronización.
+    marca: datetime = Field(sa_type=TIMESTAMP(timezone=True))  # type: ignore
+    actualizado: datetime = Field(sa_type=TIMESTAMP(timezone=True), default_factory=DateTz.local)  # type: ignore
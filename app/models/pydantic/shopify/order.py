@@ -195,6 +195,7 @@ class Order(Base):
     email: str = ''
     number: int = 0
     createdAt: Annotated[datetime, BeforeValidator(parse_datetime)] = Field(default_factory=DateTz.local)
+    updatedAt: Annotated[datetime, BeforeValidator(parse_datetime)] | None = None
     app: App = App()
     customer: Customer = Customer()
     transactions: list[Transaction] = []
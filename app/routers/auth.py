@@ -1,6 +1,5 @@
 # app/routers/base.py
 from app.internal.log import factory_logger
-from argon2.exceptions import VerifyMismatchError
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 from fastapi import APIRouter, Request, Depends, HTTPException, status
@@ -9,10 +8,12 @@ from fastapi import APIRouter, Request, Depends, HTTPException, status
 import jwt
 from jwt.exceptions import InvalidTokenError
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from argon2 import PasswordHasher
 from argon2.exceptions import InvalidHashError
 from pydantic import BaseModel
 from app.config import Config
+from app.internal.cache_invalidacion import InvalidacionCache
+from app.internal.gen.cache import TTLCache
+from app.internal.password import verify_password
 import hmac
 import hashlib
 import base64
@@ -45,9 +46,24 @@ class TokenData(BaseModel):
     scopes: list[str] = []
 
 
-password_hasher = PasswordHasher()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/login')
 
+# Usuarios de tokens ya validados, llave (sub, token). Evita una consulta por petición autenticada.
+usuarios_cache: TTLCache[tuple[str, str], UsuarioDB] = TTLCache.get_named('usuarios', ttl=Config.auth_cache_ttl)
+
+
+@InvalidacionCache.handler('usuarios')
+def _invalidar_usuario_local(usuario_id: str | None):
+    if usuario_id is None:
+        usuarios_cache.clear()
+    else:
+        usuarios_cache.invalidate_where(lambda key: key[0] == usuario_id)
+
+
+async def invalidar_usuario(usuario_id: int | str):
+    """Descarta los tokens cacheados del usuario en todos los procesos, se llama al actualizarlo o eliminarlo."""
+    await InvalidacionCache.notificar('usuarios', str(usuario_id))
+
 
 class AuthException:
     credentials_exception = HTTPException(
@@ -69,12 +85,11 @@ class AuthException:
     )
 
 
-def verificar_password(plain_password, hashed_password):
-    try:
-        return password_hasher.verify(hashed_password, plain_password)
-    except VerifyMismatchError:
+async def verificar_password(plain_password, hashed_password):
+    verificado = await verify_password(hashed_password, plain_password)
+    if not verificado:
         auth_log.error('VerifyMismatchError')
-        return False
+    return verificado
 
 
 async def autenticar_usuario(username: str, password: str, session: AsyncSessionDep) -> UsuarioDB | None:
@@ -82,7 +97,7 @@ async def autenticar_usuario(username: str, password: str, session: AsyncSession
         usuario = await usuario_query.get_by_username(session, username)
     except InvalidHashError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    if usuario and verificar_password(password, usuario.password):
+    if usuario and await verificar_password(password, usuario.password):
         return usuario
     return None
 
@@ -108,9 +123,20 @@ async def validar_access_token(token: Annotated[str, Depends(oauth2_scheme)], se
             raise AuthException.unauthorized_exception
     except InvalidTokenError:
         raise AuthException.unauthorized_exception
+
+    key = (str(user_id), token)
+    user = usuarios_cache.get(key)
+    if user is not None:
+        return user
     user = await usuario_query.get(session, user_id)
     if user is None:
         raise AuthException.unauthorized_exception
+    # La entrada no debe sobrevivir a la expiración del token.
+    ttl = Config.auth_cache_ttl
+    if payload.get('exp') is not None:
+        ttl = min(ttl, payload['exp'] - datetime.now(timezone.utc).timestamp())
+    # Copia fuera de la sesión, la sesión de esta petición se cierra al terminar.
+    usuarios_cache.set(key, UsuarioDB(**user.model_dump()), ttl=ttl)
     return user
 
 
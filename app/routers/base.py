@@ -1,6 +1,10 @@
 # app/routers/base.py
-from typing import Annotated, TypeVar
-from fastapi import APIRouter, HTTPException, status
+from datetime import date
+from decimal import Decimal
+from enum import Enum
+from typing import Annotated, Any, Literal, TypeVar
+from fastapi import APIRouter, HTTPException, Query, status
+from pydantic import BaseModel, Field, create_model
 from sqlmodel import SQLModel
 
 from app.internal.gen.utilities import pluralizar_por_sep
@@ -14,6 +18,37 @@ ModelDB = TypeVar('ModelDB', bound=SQLModel)
 ModelCreate = TypeVar('ModelCreate', bound=SQLModel)
 
 
+class Pagina(BaseModel):
+    items: list[dict[str, Any]]
+    next_cursor: str | None = None
+
+
+class ConsultaPagina(BaseModel):
+    """Parámetros de la paginación por cursor, los filtros por columna se agregan por modelo (ver filtros_model)."""
+
+    after: str | None = None
+    limit: int = Field(100, ge=1, le=1000)
+    sort: Sort = Sort.DESC
+    orden: Literal['id', 'fecha'] = 'id'
+    campos: list[str] | None = None
+
+
+def filtros_model(model_db: type[SQLModel]) -> type[ConsultaPagina]:
+    """Modelo de query params con un filtro de igualdad opcional por cada columna escalar de la tabla."""
+    filtros = {}
+    for columna in model_db.__table__.c:  # type: ignore
+        try:
+            # AutoString de SQLModel es un TypeDecorator, el tipo python está en impl_instance.
+            tipo = getattr(columna.type, 'impl_instance', columna.type).python_type
+        except NotImplementedError:
+            continue
+        if columna.name in ConsultaPagina.model_fields:
+            continue
+        if issubclass(tipo, (int, float, str, bool, date, Decimal, Enum)):
+            filtros[columna.name] = (tipo | None, None)
+    return create_model(f'Consulta{model_db.__name__}', __base__=ConsultaPagina, **filtros)
+
+
 class CRUD:
     def __init__(
         self,
@@ -72,6 +107,47 @@ class CRUD:
             description=f'Obtiene una lista paginada de {pluralizar_por_sep(name, "-", 1).replace("-", " ")}.',
         )
 
+        # GET - Obtener lista de recursos por cursor
+        Consulta = filtros_model(model_db)
+
+        async def get_resources_cursor(
+            session: AsyncSessionDep,
+            consulta: Annotated[Consulta, Query()],  # type: ignore
+        ) -> Pagina:
+            """Obtiene una página de recursos a partir del cursor de la página anterior."""
+            if consulta.orden not in model_db.__table__.c:  # type: ignore
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f'{model_db.__name__} no se puede ordenar por {consulta.orden}',
+                )
+            filtros = consulta.model_dump(exclude_none=True, exclude=set(ConsultaPagina.model_fields))
+            try:
+                items, next_cursor = await model_query.get_pagina(
+                    session,
+                    after=consulta.after,
+                    limit=consulta.limit,
+                    sort=consulta.sort,
+                    orden=consulta.orden,
+                    filtros=filtros,
+                    campos=consulta.campos,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            return Pagina(items=items, next_cursor=next_cursor)
+
+        router.add_api_route(
+            f'/{pluralizar_por_sep(name, "-", 1)}/cursor',
+            get_resources_cursor,
+            methods=['GET'],
+            operation_id=f'get_{pluralizar_por_sep(name, "-", 1)}_cursor',
+            response_model=Pagina,
+            summary=f'Obtener lista de {name.replace("-", " ")}s por cursor',
+            description=(
+                f'Obtiene una página de {pluralizar_por_sep(name, "-", 1).replace("-", " ")} ordenada por id o fecha. '
+                'Para la página siguiente se envía next_cursor en after, el costo no aumenta con la profundidad.'
+            ),
+        )
+
         # GET - Obtener un recurso por ID
         async def get_resource(
             session: AsyncSessionDep,
@@ -52,6 +52,21 @@ router = APIRouter(
 )
 
 
+@router.post(
+    '/world-office/cache/invalidar',
+    status_code=status.HTTP_200_OK,
+    response_model=bool,
+    summary='Invalida las cachés de consultas a World Office.',
+    description='nombre: inventario, ciudades o terceros. Sin nombre se invalidan todas, en todos los procesos.',
+)
+async def invalidar_cache_world_office(nombre: str | None = None):
+    try:
+        await WoClient.invalidar_cache(nombre)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return True
+
+
 @router.get(
     '/compra-registrada',
     status_code=status.HTTP_200_OK,
@@ -1,10 +1,12 @@
 # app/routers/inventario.py
-from datetime import date
+from csv import DictWriter
+from datetime import date, timedelta
 from enum import Enum
-from anyio import sleep
+from io import StringIO
+from time import time
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, status
-from pandas import DataFrame, Grouper
-from numpy import nan
+from fastapi.responses import StreamingResponse
+from pandas import DataFrame
 from pydantic import BaseModel
 
 
@@ -15,10 +17,19 @@ if __name__ == '__main__':
     sys_path.append(abspath('.'))
 
 
-from app.internal.gen.utilities import divide
+from app.config import Config
 from app.internal.integrations.shopify import ShopifyGraphQLClient, ShopifyInventario
-from app.models.db.session import AsyncSessionDep
+from app.models.db.session import AsyncSessionDep, AsyncSessionLocal
+from app.internal.gen.utilities import DateTz
+from app.internal.jobs import (
+    JOB_FACTURAR_PEDIDO,
+    JOB_PARTICIONES_MOVIMIENTOS,
+    JOB_PEDIDO_SHOPIFY,
+    JOB_SYNC_PEDIDOS_SHOPIFY,
+    JobWorker,
+)
 from app.internal.query.base import DateRange, Sort
+from app.internal.query.jobs import JobQuery
 from app.internal.query.inventario import (
     BodegaQuery,
     ComponentesPorVarianteQuery,
@@ -31,7 +42,9 @@ from app.internal.query.inventario import (
     MetaValorQuery,
     MetadatosPorSoporteQuery,
     MovimientoQuery,
+    ParticionesMovimientosQuery,
     PrecioPorVarianteQuery,
+    SaldoQuery,
     TipoMovimientoQuery,
     TipoPrecioQuery,
     TipoSoporteQuery,
@@ -89,6 +102,7 @@ log_inventario_shopify = factory_logger('inventario_shopify', file=True)
 log_debug = factory_logger('debug', level=LogLevel.DEBUG, file=False)
 
 
+
 class Tags(Enum):
     INVENTARIO = 'Inventario'
     SHOPIFY = 'Shopify'
@@ -150,6 +164,69 @@ async def get_movimientos_with_relations(
     return movimientos
 
 
+class FormatoExport(str, Enum):
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+
+
+def movimiento_csv_row(movimiento: MovimientoRead) -> dict:
+    """Movimiento con sus relaciones en una fila plana."""
+    relaciones = {'variante', 'bodega', 'tipo_movimiento', 'estado_variante', 'tipo_soporte', 'metadatos'}
+    return {
+        **movimiento.model_dump(mode='json', exclude=relaciones),
+        'variante': movimiento.variante.nombre if movimiento.variante else None,
+        'sku': movimiento.variante.sku if movimiento.variante else None,
+        'bodega': movimiento.bodega.ubicacion if movimiento.bodega else None,
+        'tipo_movimiento': movimiento.tipo_movimiento.nombre if movimiento.tipo_movimiento else None,
+        'estado_variante': movimiento.estado_variante.nombre if movimiento.estado_variante else None,
+        'tipo_soporte': movimiento.tipo_soporte.nombre if movimiento.tipo_soporte else None,
+        'metadatos': '; '.join(
+            f'{metadato.meta_atributo.nombre}:{metadato.meta_valor.valor}'
+            for metadato in movimiento.metadatos
+            if metadato.meta_atributo and metadato.meta_valor
+        ),
+    }
+
+
+@router.get(
+    '/movimientos-with-relations/export',
+    status_code=status.HTTP_200_OK,
+    summary='Exporta movimientos con relaciones en NDJSON o CSV',
+    description='Los movimientos se envían a medida que se leen de la base de datos, apto para rangos extensos.',
+    tags=[Tags.INVENTARIO],
+    dependencies=[Depends(validar_access_token)],
+)
+async def export_movimientos_with_relations(
+    start_date: date,
+    end_date: date,
+    sort: Sort = Sort.DESC,
+    formato: FormatoExport = FormatoExport.NDJSON,
+):
+    async def content():
+        # La sesión vive lo mismo que la respuesta, no la del endpoint.
+        async with AsyncSessionLocal() as session:
+            header = True
+            async for movimientos in MovimientoQuery().stream_with_relations(session, start_date, end_date, sort):
+                if formato == FormatoExport.NDJSON:
+                    yield ''.join(f'{movimiento.model_dump_json()}\n' for movimiento in movimientos)
+                    continue
+
+                buffer = StringIO()
+                rows = [movimiento_csv_row(movimiento) for movimiento in movimientos]
+                writer = DictWriter(buffer, fieldnames=list(rows[0].keys()))
+                if header:
+                    writer.writeheader()
+                    header = False
+                writer.writerows(rows)
+                yield buffer.getvalue()
+
+    media_type = 'application/x-ndjson' if formato == FormatoExport.NDJSON else 'text/csv'
+    filename = f'movimientos_{start_date}_{end_date}.{formato.value}'
+    return StreamingResponse(
+        content(), media_type=media_type, headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
 class Frequency(str, Enum):
     DAILY = 'D'
     WEEKLY = 'W'
@@ -228,81 +305,23 @@ async def get_movimientos_agrupados(
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Tipo de soporte no encontrado')
         tipo_soporte_id = tipo_soporte.id
 
-    movimientos = await MovimientoQuery().get_by_dates(
-        session=session,
-        start_date=start_date,
-        end_date=end_date,
-        sort=sort,
-        tipo_movimiento_id=tipo_movimiento_id,
-        tipo_soporte_id=tipo_soporte_id,
-    )
-
-    if not movimientos:
-        return []
-
-    df_movimientos = DataFrame([mov.model_dump() for mov in movimientos])
-    # En la base de datos el valor es precio unitario, por lo que no representa el valor total de la venta.
-    df_movimientos.valor = df_movimientos.valor * df_movimientos.cantidad
-    df = df_movimientos.copy()
-
-    metadatos = None
     meta_agrupadores = {GroupByMovimientos.META_ATRIBUTO, GroupByMovimientos.META_VALOR} & body.group_by
-    if tipo_soporte_id and meta_agrupadores:
-        metadatos = await MetadatosPorSoporteQuery().get_list_by(
-            session=session,
-            tipo_soporte_id=tipo_soporte_id,
-            meta_valor_ids=body.meta_valor_ids,
-            soporte_ids=[movimiento.soporte_id for movimiento in movimientos if movimiento.soporte_id],
-        )
-
     if meta_agrupadores and not tipo_soporte_id:
         for meta_agrupador in meta_agrupadores:
             body.group_by.remove(meta_agrupador)
 
-    if metadatos:
-        df_metadatos = DataFrame(metadatos)
-        df = df.merge(df_metadatos, left_on='soporte_id', right_on='soporte_id', how='inner')
-    elif meta_agrupadores and not metadatos:
-        return []
-        
-    if df.empty:
-        return []
-
-    df = (
-        df.set_index('fecha')
-        .groupby([Grouper(freq=frequency.value), 'tipo_movimiento_id', *body.group_by])
-        .agg(
-            {
-                'cantidad': 'sum',
-                'valor': 'sum',
-            }
-        )
-        .reset_index()
+    # La agregación se hace en la base de datos, solo se transfieren las filas agrupadas.
+    return await MovimientoQuery().get_agrupados(
+        session=session,
+        start_date=start_date,
+        end_date=end_date,
+        frecuencia=frequency.value,
+        group_by=[group.value for group in body.group_by],
+        tipo_soporte_id=tipo_soporte_id,
+        tipo_movimiento_id=tipo_movimiento_id,
+        meta_valor_ids=body.meta_valor_ids,
     )
 
-    total_cantidad = df_movimientos['cantidad'].sum()
-    df['cantidad_%'] = df['cantidad'].apply(lambda x: divide(x, total_cantidad) * 100)
-
-    total_valor = df_movimientos['valor'].sum()
-    df['valor_%'] = df['valor'].apply(lambda x: divide(x, total_valor) * 100)
-
-    if GroupByMovimientos.VARIANTE in body.group_by:
-        variantes_elemento = await VarianteElementoQuery().get_list(session)
-
-        df_variantes = DataFrame([ve.model_dump() for ve in variantes_elemento])
-
-        df = df.merge(df_variantes, left_on='variante_id', right_on='id', how='left')
-        df = df.drop(columns=['id', 'variante_id', 'shopify_id'])
-        df = df.rename(columns={'nombre': 'variante'})
-
-    if GroupByMovimientos.BODEGA in body.group_by:
-        bodegas = await BodegaQuery().get_list(session)
-        df_bodegas = DataFrame([bodega.model_dump() for bodega in bodegas])
-        df = df.merge(df_bodegas, left_on='bodega_id', right_on='id', how='left')
-        df = df.drop(columns=['id', 'bodega_id', 'shopify_id'])
-
-    return df.replace(nan, None).to_dict(orient='records')
-
 
 class BodyMovimientoAgrupadosLikeMetaValor(BaseModel):
     group_by: set[GroupByLikeMetaValor] = {GroupByLikeMetaValor.VARIANTE}
@@ -339,78 +358,123 @@ async def get_movimientos_agrupados_like_metavalor(
     if not tipo_soporte_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Tipo de soporte no encontrado')
 
-    movimientos = await MovimientoQuery().get_by_dates(
+    return await MovimientoQuery().get_agrupados(
         session=session,
         start_date=start_date,
         end_date=end_date,
-        sort=sort,
-        tipo_movimiento_id=tipo_movimiento_id,
+        frecuencia=frequency.value,
+        group_by=[group.value for group in body.group_by],
         tipo_soporte_id=tipo_soporte_id,
+        tipo_movimiento_id=tipo_movimiento_id,
+        like_meta_valor=like_metavalor,
+        por_tipo_movimiento=False,
     )
 
-    if not movimientos:
-        return []
 
-    df_movimientos = DataFrame([mov.model_dump() for mov in movimientos])
-    # En la base de datos el valor es precio unitario, por lo que no representa el valor total de la venta.
-    df_movimientos.valor = df_movimientos.valor * df_movimientos.cantidad
+@router.get(
+    '/saldos',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(validar_access_token)],
+)
+async def get_saldos(session: AsyncSessionDep):
+    saldos = await SaldoQuery().get_saldos(session)
+    return saldos
 
-    metadatos = None
-    metadatos = await MetadatosPorSoporteQuery().get_like(
-        session=session,
-        tipo_soporte_id=tipo_soporte_id,
-        meta_valor=like_metavalor,
-    )
-    if not metadatos:
-        return []
-
-    df = df_movimientos.merge(DataFrame(metadatos), left_on='soporte_id', right_on='soporte_id', how='inner')
-
-    df = (
-        df.set_index('fecha')
-        .groupby([Grouper(freq=frequency.value), 'meta_valor', *body.group_by])
-        .agg(
-            {
-                'cantidad': 'sum',
-                'valor': 'sum',
-            }
-        )
-        .reset_index()
-    )
 
-    total_cantidad = df_movimientos['cantidad'].sum()
-    df['cantidad_%'] = df['cantidad'].apply(lambda x: divide(x, total_cantidad) * 100)
+@router.post(
+    '/saldos/reconstruir',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(validar_access_token)],
+    summary='Recalcula los saldos desde el histórico de movimientos',
+)
+async def reconstruir_saldos(session: AsyncSessionDep):
+    registros = await SaldoQuery().reconstruir(session)
+    log_inventario.info(f'Saldos reconstruidos, {registros} registros')
+    return {'registros': registros}
 
-    total_valor = df_movimientos['valor'].sum()
-    df['valor_%'] = df['valor'].apply(lambda x: divide(x, total_valor) * 100)
 
-    if GroupByMovimientos.VARIANTE in body.group_by:
-        variantes_elemento = await VarianteElementoQuery().get_list(session)
+@router.get(
+    '/saldos/verificar',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(validar_access_token)],
+    summary='Diferencias entre los saldos y el histórico de movimientos',
+    description='Una lista vacía indica que los saldos son consistentes con los movimientos.',
+)
+async def verificar_saldos(session: AsyncSessionDep) -> list[dict]:
+    return await SaldoQuery().verificar(session)
 
-        df_variantes = DataFrame([ve.model_dump() for ve in variantes_elemento])
 
-        df = df.merge(df_variantes, left_on='variante_id', right_on='id', how='left')
-        df = df.drop(columns=['id', 'variante_id', 'shopify_id'])
-        df = df.rename(columns={'nombre': 'variante'})
+@router.post(
+    '/movimientos/diarios/reconstruir',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(validar_access_token)],
+    summary='Recalcula el acumulado diario de movimientos usado por los reportes agrupados',
+)
+async def reconstruir_movimientos_diarios(session: AsyncSessionDep):
+    registros = await MovimientoQuery().reconstruir_diarios(session)
+    log_inventario.info(f'Movimientos diarios reconstruidos, {registros} registros')
+    return {'registros': registros}
 
-    if GroupByMovimientos.BODEGA in body.group_by:
-        bodegas = await BodegaQuery().get_list(session)
-        df_bodegas = DataFrame([bodega.model_dump() for bodega in bodegas])
-        df = df.merge(df_bodegas, left_on='bodega_id', right_on='id', how='left')
-        df = df.drop(columns=['id', 'bodega_id', 'shopify_id'])
 
-    return df.replace(nan, None).to_dict(orient='records')
+@router.get(
+    '/movimientos/particiones',
+    status_code=status.HTTP_200_OK,
+    summary='Particiones mensuales de movimientos',
+    description='Particiones activas y archivadas con su rango, registros estimados y tamaño en bytes.',
+)
+async def get_particiones_movimientos(session: AsyncSessionDep) -> list[dict]:
+    return await ParticionesMovimientosQuery().listar(session)
 
 
-@router.get(
-    '/saldos',
+@router.post(
+    '/movimientos/particiones/archivar',
     status_code=status.HTTP_200_OK,
-    dependencies=[Depends(validar_access_token)],
+    summary='Archiva las particiones de movimientos anteriores a una fecha',
+    description=(
+        'Los meses que terminan antes de antes_de se separan de movimientos: los listados dejan de leerlos, los '
+        'saldos y los reportes agrupados (acumulado diario) no cambian. Solo se deben archivar meses cerrados.'
+    ),
 )
-async def get_saldos(session: AsyncSessionDep):
-    movimiento_query = MovimientoQuery()
-    saldos = await movimiento_query.get_saldos(session)
-    return saldos
+async def archivar_particiones_movimientos(session: AsyncSessionDep, antes_de: date) -> list[str]:
+    if antes_de > DateTz.today().replace(day=1):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail='No se puede archivar el mes actual ni meses futuros'
+        )
+    archivadas = await ParticionesMovimientosQuery().archivar(session, antes_de)
+    log_inventario.info(f'Particiones de movimientos archivadas: {archivadas}')
+    return archivadas
+
+
+async def sincronizar_zona_movimientos_diarios():
+    """Reconstruye el acumulado diario al iniciar si LOCAL_TIMEZONE cambió desde el último cálculo."""
+    async with AsyncSessionLocal() as session:
+        registros = await MovimientoQuery().sincronizar_zona_diarios(session)
+    if registros is not None:
+        log_inventario.info(f'Movimientos diarios reconstruidos en {Config.local_timezone}, {registros} registros')
+
+
+async def programar_particiones_movimientos(dias: int = 0):
+    """Encola la creación de particiones de movimientos para dentro de `dias` días. La llave es la fecha de
+    ejecución, los workers que la programan al iniciar el mismo día generan un solo trabajo."""
+    async with AsyncSessionLocal() as session:
+        await JobQuery().encolar(
+            session,
+            JOB_PARTICIONES_MOVIMIENTOS,
+            (DateTz.today() + timedelta(days=dias)).isoformat(),
+            delay=dias * 86400,
+        )
+
+
+@JobWorker.handler(JOB_PARTICIONES_MOVIMIENTOS)
+async def crear_particiones_movimientos(payload: dict):
+    """Mantiene creadas las particiones de los próximos meses, se reprograma a diario aunque la creación falle."""
+    try:
+        async with AsyncSessionLocal() as session:
+            creadas = await ParticionesMovimientosQuery().crear(session)
+        if creadas:
+            log_inventario.info(f'Particiones de movimientos creadas: {creadas}')
+    finally:
+        await programar_particiones_movimientos(dias=1)
 
 
 CRUD(router, 'movimiento', MovimientoQuery(), Movimiento, MovimientoCreate)
@@ -424,26 +488,38 @@ CRUD(router, 'movimiento', MovimientoQuery(), Movimiento, MovimientoCreate)
     tags=[Tags.INVENTARIO, Tags.SHOPIFY],
     dependencies=[Depends(hmac_validation_shopify)],
 )
-async def recibir_pedido_shopify(
-    request: Request,
-    background_tasks: BackgroundTasks,
-):
+async def recibir_pedido_shopify(request: Request, session: AsyncSessionDep):
     request_json = await request.json()
     # Obtener datos de pedido
     order_webhook = OrderWebHook(**request_json)
     """Se evidencia que shopify en ocasiones intenta enviar el mismo pedido varias veces.
-    Se evita usando BackgroundTasks pos si es a causa de un TimeoutError."""
-    async def task():
-        await sleep(30)
-        order = await ShopifyGraphQLClient().get_order_by_number(order_webhook.order_number)
-        if order is None:
-            return
-        await facturar_orden_shopify_world_office(order)
-        await ShopifyInventario().crear_movimientos_orden(order)
+    El pedido se encola con el número como llave: los webhooks repetidos mientras el trabajo está pendiente o en
+    proceso se descartan, y la respuesta es inmediata para evitar reintentos por TimeoutError."""
+    await JobQuery().encolar(
+        session,
+        JOB_PEDIDO_SHOPIFY,
+        str(order_webhook.order_number),
+        {'order_number': order_webhook.order_number},
+        delay=30,
+    )
+    return True
 
-    background_tasks.add_task(task)
 
-    return True
+@JobWorker.handler(JOB_PEDIDO_SHOPIFY)
+async def procesar_pedido_shopify(payload: dict):
+    """Factura el pedido en World Office y registra sus movimientos de inventario.
+    Si /facturar-pendientes ya encoló la facturación del pedido, solo se registran los movimientos: facturarlo en
+    ambos trabajos a la vez duplicaría la factura."""
+    order = await ShopifyGraphQLClient().get_order_by_number(payload['order_number'])
+    if order is None:
+        return
+    async with AsyncSessionLocal() as session:
+        en_facturacion = await JobQuery().get_llaves_activas(session, JOB_FACTURAR_PEDIDO, [str(order.number)])
+    if en_facturacion:
+        log_inventario_shopify.info(f'Pedido {order.number} con facturación encolada, solo se registran movimientos')
+    else:
+        await facturar_orden_shopify_world_office(order)
+    await ShopifyInventario().crear_movimientos_orden(order)
 
 
 # Sincronización
@@ -456,10 +532,11 @@ async def recibir_pedido_shopify(
     tags=[Tags.INVENTARIO, Tags.SHOPIFY],
     dependencies=[Depends(validar_access_token)],
 )
-async def sync_shopify():
-    """Sincroniza los datos de inventario desde Shopify."""
+async def sync_shopify(bulk: bool = False):
+    """Sincroniza los datos de inventario desde Shopify.
+    Con bulk=True el catálogo se obtiene con una operación bulk, recomendado para catálogos grandes."""
     try:
-        await ShopifyInventario().sicnronizar_inventario(True)
+        await ShopifyInventario().sicnronizar_inventario(True, bulk=bulk)
         return True
     except Exception as e:
         log_inventario_shopify.error(f'Error al sincronizar inventarios de Shopify: {e}')
@@ -481,6 +558,42 @@ async def sync_movimientos_ordenes_by_range(date_range: DateRange, background_ta
     return True
 
 
+@shopify_inventario_router.post(
+    '/sync-movimientos-ordenes-incremental',
+    status_code=status.HTTP_200_OK,
+    tags=[Tags.INVENTARIO, Tags.SHOPIFY],
+    dependencies=[Depends(validar_access_token)],
+    summary='Registra los movimientos de los pedidos pagados nuevos desde la última sincronización',
+)
+async def sync_movimientos_ordenes_incremental(background_tasks: BackgroundTasks):
+    background_tasks.add_task(ShopifyInventario().sincronizar_movimientos_ordenes_incremental)
+    return True
+
+
+async def programar_sync_pedidos_shopify(delay: float = 0):
+    """Encola la sincronización incremental de pedidos para dentro de `delay` segundos. La llave es el intervalo
+    de ejecución, los workers que la programan al iniciar en el mismo intervalo generan un solo trabajo."""
+    if Config.shopify_sync_intervalo <= 0:
+        return
+    async with AsyncSessionLocal() as session:
+        await JobQuery().encolar(
+            session,
+            JOB_SYNC_PEDIDOS_SHOPIFY,
+            str(int((time() + delay) // Config.shopify_sync_intervalo)),
+            delay=delay,
+            max_intentos=1,
+        )
+
+
+@JobWorker.handler(JOB_SYNC_PEDIDOS_SHOPIFY)
+async def sync_pedidos_shopify(payload: dict):
+    """Sincronización incremental periódica, se reprograma cada Config.shopify_sync_intervalo segundos."""
+    try:
+        await ShopifyInventario().sincronizar_movimientos_ordenes_incremental()
+    finally:
+        await programar_sync_pedidos_shopify(delay=Config.shopify_sync_intervalo)
+
+
 @shopify_inventario_router.post(
     '/sync-metadata-ordenes-by-range',
     status_code=status.HTTP_200_OK,
@@ -0,0 +1,58 @@
+# app/routers/metricas.py
+from fastapi import APIRouter, Depends, status
+
+from app.internal.gen.cache import TTLCache
+from app.internal.integrations.rate_limit import TokenBucket
+from app.internal.jobs import job_worker
+from app.internal.query.jobs import JobQuery
+from app.internal.query.inventario import BaseQueryCatalogo
+from app.models.db.session import AsyncSessionDep
+from app.routers.auth import validar_access_token
+
+
+router = APIRouter(
+    prefix='/metricas',
+    responses={404: {'description': 'No encontrado'}},
+    tags=['Metricas'],
+    dependencies=[Depends(validar_access_token)],
+)
+
+
+@router.get(
+    '/rate-limit',
+    status_code=status.HTTP_200_OK,
+    summary='Métricas de rate limiting por integración',
+    description='Profundidad de la cola y tiempos de espera del token bucket de cada integración en este worker.',
+)
+async def get_metricas_rate_limit() -> dict[str, dict]:
+    return TokenBucket.all_metrics()
+
+
+@router.get(
+    '/catalogo',
+    status_code=status.HTTP_200_OK,
+    summary='Métricas de la caché de tablas de referencia',
+    description='Registros, consultas resueltas en memoria y cargas desde la base de datos por tabla en este worker.',
+)
+async def get_metricas_catalogo() -> dict[str, dict]:
+    return BaseQueryCatalogo.all_metrics()
+
+
+@router.get(
+    '/cache',
+    status_code=status.HTTP_200_OK,
+    summary='Métricas de las cachés en memoria',
+    description='Hits, misses, hit rate y registros de cada caché con TTL (ej. usuarios autenticados) en este worker.',
+)
+async def get_metricas_cache() -> dict[str, dict]:
+    return TTLCache.all_metrics()
+
+
+@router.get(
+    '/jobs',
+    status_code=status.HTTP_200_OK,
+    summary='Estado de la cola de trabajos',
+    description='Trabajos por tipo y estado en la base de datos, y trabajos en proceso en este worker.',
+)
+async def get_metricas_jobs(session: AsyncSessionDep) -> dict:
+    return {'cola': await JobQuery().resumen(session), 'worker': job_worker.metrics()}
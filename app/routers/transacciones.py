@@ -1,14 +1,19 @@
+from datetime import timedelta
 from enum import Enum
 
 from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, UploadFile, status
 
 from app.internal.integrations.shopify import ShopifyGraphQLClient
 from app.internal.integrations.shopify_world_office import facturar_orden_shopify_world_office
+from app.internal.gen.utilities import DateTz
+from app.internal.jobs import JOB_FACTURAR_PEDIDO, JOB_PEDIDO_SHOPIFY, JobWorker
 from app.internal.log import factory_logger
-from app.models.db.session import AsyncSessionDep
+from app.models.db.session import AsyncSessionDep, AsyncSessionLocal
 from app.models.db.transacciones import Compra, CompraCreate, Pedido, PedidoCreate, PedidoLogs
 from app.routers.auth import validar_access_token
 from app.routers.base import CRUD
+from app.internal.query.base import Formato
+from app.internal.query.jobs import JobQuery
 from app.internal.query.transacciones import CompraQuery, PedidoQuery
 from app.config import Environments, Config
 from pandas import read_csv, DataFrame, to_datetime
@@ -38,10 +43,11 @@ log_transacciones = factory_logger('transacciones')
     status_code=status.HTTP_200_OK,
     dependencies=[Depends(validar_access_token)],
 )
-async def facturar_pendientes(
-    session: AsyncSessionDep,
-    background_tasks: BackgroundTasks,
-):
+async def facturar_pendientes(session: AsyncSessionDep) -> dict:
+    """Encola un trabajo de facturación por pedido pendiente. Los trabajos se ejecutan en paralelo en los workers
+    de la cola (Config.jobs_concurrencia por proceso), cada uno con su propia sesión, y las peticiones a Shopify y
+    World Office pasan por el rate limit de cada integración. El avance se consulta en /facturar-pendientes/progreso.
+    """
     pedido_query = PedidoQuery()
     pedidos = await pedido_query.get_pendientes_facturar(session)
     log_transacciones.info(
@@ -49,26 +55,55 @@ async def facturar_pendientes(
     )
 
     if Config.environment in [Environments.DEVELOPMENT.value, Environments.STAGING.value]:
-        return True
+        return {'pendientes': len(pedidos), 'encolados': 0, 'omitidos': len(pedidos)}
 
-    async def task(pedidos: list[Pedido]):
-        for pedido in pedidos:
-            if not pedido.numero or not pedido.id:
-                continue
-            if pedido.log == PedidoLogs.NO_FACTURAR.value:
-                continue
-            orden = await ShopifyGraphQLClient().get_order_by_number(pedido.numero)
-            if orden is None:
-                log_transacciones.error(f'No se encontró orden con número {pedido.numero}')
-            pedido_update = pedido.model_copy()
-            pedido_update.q_intentos = pedido.q_intentos - 1
-            await pedido_query.update(session, pedido_update, pedido.id)
-            await facturar_orden_shopify_world_office(orden)
-
-        log_transacciones.info(f'Se intentarón facturar los pedidios: {", ".join([str(x.numero) for x in pedidos])}')
-
-    background_tasks.add_task(task, pedidos)
-    return True
+    payloads = {
+        str(pedido.numero): {'pedido_id': pedido.id, 'numero': pedido.numero}
+        for pedido in pedidos
+        if pedido.numero and pedido.id and pedido.log != PedidoLogs.NO_FACTURAR.value
+    }
+    job_query = JobQuery()
+    # Pedidos que el webhook aún está procesando.
+    en_webhook = await job_query.get_llaves_activas(session, JOB_PEDIDO_SHOPIFY, list(payloads))
+    for llave in en_webhook:
+        payloads.pop(llave)
+    encolados = await job_query.encolar_varios(session, JOB_FACTURAR_PEDIDO, payloads, max_intentos=1)
+    log_transacciones.info(f'Se encolaron {len(encolados)} pedidos para facturar: {", ".join(encolados)}')
+    return {'pendientes': len(pedidos), 'encolados': len(encolados), 'omitidos': len(pedidos) - len(encolados)}
+
+
+@JobWorker.handler(JOB_FACTURAR_PEDIDO)
+async def reprocesar_pedido(payload: dict):
+    async with AsyncSessionLocal() as session:
+        pedido_query = PedidoQuery()
+        pedido = await pedido_query.get(session, payload['pedido_id'])
+        if pedido is None or pedido.factura_id:
+            return
+        pedido_update = pedido.model_copy()
+        pedido_update.q_intentos = pedido.q_intentos - 1
+        await pedido_query.update(session, pedido_update, payload['pedido_id'])
+
+    orden = await ShopifyGraphQLClient().get_order_by_number(payload['numero'])
+    if orden is None:
+        raise ValueError(f'No se encontró orden con número {payload["numero"]}')
+    await facturar_orden_shopify_world_office(orden)
+
+
+@router.get(
+    '/facturar-pendientes/progreso',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(validar_access_token)],
+)
+async def progreso_facturar_pendientes(session: AsyncSessionDep, horas: int = 24) -> dict:
+    """Trabajos de facturación creados en las últimas `horas` por estado, y el error de los fallidos."""
+    desde = DateTz.local() - timedelta(hours=horas)
+    job_query = JobQuery()
+    resumen = await job_query.resumen(session, JOB_FACTURAR_PEDIDO, desde)
+    fallidos = await job_query.get_fallidos(session, JOB_FACTURAR_PEDIDO, desde)
+    return {
+        'estados': resumen.get(JOB_FACTURAR_PEDIDO, {}),
+        'fallidos': [{'numero': job.llave, 'error': job.error} for job in fallidos],
+    }
 
 
 @router.post(
@@ -164,8 +199,15 @@ async def buscar_pedidos_csv_addi(files: list[UploadFile], session: AsyncSession
 
     df['orden'] = df['ID Orden'].map(lambda x: map_orders.get(x))
 
-    pedidos = await PedidoQuery().get_by_numbers(session, [int(x) for x in df['orden'][df['orden'].notna()]])
-    pedidos_df = DataFrame([pedido.model_dump() for pedido in pedidos])
+    # Solo las columnas del reporte, sin instanciar los pedidos.
+    numeros = [int(x) for x in df['orden'][df['orden'].notna()]]
+    pedidos = await PedidoQuery().get_columnas(
+        session,
+        ['fecha', 'numero', 'factura_id', 'contabilizado'],
+        Pedido.numero.in_(numeros),  # type: ignore
+        formato=Formato.NUMPY,
+    )
+    pedidos_df = DataFrame(pedidos)
 
     df = df.merge(pedidos_df, left_on='orden', right_on='numero', how='left')
     df = df.rename(columns={'CC': 'cc', 'Nombre Cliente': 'nombre_cliente', 'Tipo de venta': 'tipo_venta'})
@@ -11,7 +11,8 @@ from app.models.db.usuario import UsuarioBase, UsuarioCreate, UsuarioDB
 from app.internal.query.usuario import usuario_query
 
 # Seguridad
-from app.routers.auth import password_hasher, validar_access_token
+from app.internal.password import hash_password
+from app.routers.auth import invalidar_usuario, validar_access_token
 
 router = APIRouter(
     prefix='/usuarios',
@@ -71,7 +72,7 @@ async def crear_usuario(
     session: AsyncSessionDep,
 ):
     # hash password
-    usuario.password = password_hasher.hash(usuario.password)
+    usuario.password = await hash_password(usuario.password)
     usuario_db = UsuarioDB(**usuario.model_dump())
 
     usuario_creado = await usuario_query.create(session, usuario_db)
@@ -133,6 +134,7 @@ async def actualizar(
         raise exception
 
     usuario_actualizado = await usuario_query.update(session, usuario, db_user.id)
+    await invalidar_usuario(db_user.id)
     return usuario_actualizado
 
 
@@ -146,6 +148,7 @@ async def eliminar(
     usuario_id: int,
 ):
     usuario_eliminado = await usuario_query.delete(session, usuario_id)
+    await invalidar_usuario(usuario_id)
     if usuario_eliminado is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,